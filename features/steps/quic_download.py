@@ -1,14 +1,19 @@
 import asyncio
 import logging
+import pathlib
 from types import SimpleNamespace
 
 from behave import *
 
-from istream_player.quic.client import QuicClientImpl
-from istream_player.quic.event_parser import H3EventParserImpl
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
+from istream_player.modules.downloader.quic.client import QuicClientImpl
+from istream_player.utils.dash_server import DashServer
 
 use_step_matcher("re")
 
+RESOURCES = pathlib.Path(__file__).parent.parent.parent.joinpath("tests", "resources")
+
 
 @given("A QUIC Client")
 def step_impl(context):
@@ -18,7 +23,8 @@ def step_impl(context):
     context : behave.runner.Context
     """
     context.args = SimpleNamespace()
-    context.args.quic_client = QuicClientImpl([], H3EventParserImpl())
+    context.args.quic_client = QuicClientImpl()
+    context.args.server = DashServer(str(RESOURCES))
 
 
 @when("The client is asked to get content from an URL")
@@ -28,9 +34,8 @@ def step_impl(context):
     ----------
     context : behave.runner.Context
     """
-    # context.args.url = "https://lab.yangliu.xyz/videos/BBB/output.mpd"
-    context.args.url1 = "https://oracle1.jace.website/videos/BBB/chunk-stream0-00010.m4s"
-    context.args.url2 = "https://oracle1.jace.website/videos/BBB/chunk-stream0-00011.m4s"
+    context.args.path1 = "chunks/chunk-stream0-00001.m4s"
+    context.args.path2 = "chunks/chunk-stream0-00002.m4s"
 
 
 @then("The client get it")
@@ -42,13 +47,19 @@ def step_impl(context):
     """
     logging.basicConfig(level=logging.DEBUG)
     quic_client: QuicClientImpl = context.args.quic_client
-
-    # asyncio.run(quic_client.get(context.args.url))
+    server: DashServer = context.args.server
 
     async def foo():
-        await quic_client.download(context.args.url1)
-        await quic_client.download(context.args.url2)
-        await quic_client.wait_complete(context.args.url1)
-        await quic_client.wait_complete(context.args.url2)
+        async with server:
+            await server.start(http=None, h3=0)
+            await quic_client.setup(PlayerConfig(input=""))
+            url1 = server.base_url("h3") + context.args.path1
+            url2 = server.base_url("h3") + context.args.path2
+            await quic_client.download(DownloadRequest(url1, DownloadType.SEGMENT))
+            await quic_client.download(DownloadRequest(url2, DownloadType.SEGMENT))
+            for url, path in [(url1, context.args.path1), (url2, context.args.path2)]:
+                result = await quic_client.wait_complete(url)
+                assert result is not None and result[0] == RESOURCES.joinpath(path).read_bytes()
+            await quic_client.close()
 
     asyncio.run(foo())
@@ -25,8 +25,6 @@ class ABRController(ModuleInterface, ABC):
             A dictionary where the key is the index of an adaptation set, and the
             value is the chosen representation id for that adaptation set.
         """
-
-        self._min_bitrate_representations: Dict[int, int] = {}
         pass
 
     def update_selection_lowest(self, adaptation_sets: Dict[int, AdaptationSet]):
@@ -47,20 +45,4 @@ class ABRController(ModuleInterface, ABC):
         -------
             The representation ID with the lowest bitrate
         """
-        if adaptation_set.id in self._min_bitrate_representations:
-            return self._min_bitrate_representations[adaptation_set.id]
-
-        representations = list(adaptation_set.representations.values())
-        min_id = representations[0].id
-        min_bandwidth = representations[0].bandwidth
-
-        for representation in representations:
-            if min_bandwidth is None:
-                min_bandwidth = representation.bandwidth
-                min_id = representation.id
-            elif representation.bandwidth < min_bandwidth:
-                min_bandwidth = representation.bandwidth
-                min_id = representation.id
-        self._min_bitrate_representations[adaptation_set.id] = min_id
-
-        return min_id
+        return adaptation_set.representation_index.lowest.id
@@ -28,15 +28,14 @@ class BandwidthUpdateListener(ABC):
         """
         pass
 
-    # async def on_continuous_bw_update(self, bw: int) -> None:
-    #     """
-    #     Parameters
-    #     ----------
-    #     bw: int
-    #         The instantaneous latest bandwidth estimate in bps (bytes per second)
-    #     update_time: float
-    #         The time at which this bandwidth is estimated
-    #     """
+    async def on_continuous_bw_update(self, bw: int) -> None:
+        """
+        Parameters
+        ----------
+        bw: int
+            The instantaneous latest bandwidth estimate in bps (bytes per second)
+        """
+        pass
 
 
 class BandwidthMeter(ModuleInterface, ABC):
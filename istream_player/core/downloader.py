@@ -1,8 +1,8 @@
+import time
 from abc import ABC, abstractmethod
-import asyncio
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 from istream_player.core.module import ModuleInterface
 
@@ -18,6 +18,47 @@ class DownloadRequest:
     url: str
     req_type: DownloadType
     headers: Dict[str, str] = field(default_factory=dict)
+    # Adaptation set of a segment or initialization request, for downloaders which prioritize the transfers
+    as_id: Optional[int] = None
+
+
+# Offset between the wall clock and the monotonic clock, measured once. Events are stamped with the monotonic clock,
+# which is cheaper to read and never goes backwards, and are converted to wall clock time with it.
+_WALL_CLOCK_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+
+def monotonic_ns_to_time(monotonic_ns: int) -> float:
+    """
+    Convert a time.monotonic_ns() timestamp to seconds since the epoch, comparable with time.time()
+    """
+    return (monotonic_ns + _WALL_CLOCK_OFFSET_NS) / 1e9
+
+
+@dataclass(slots=True)
+class ChunkEvent:
+    """
+    A chunk received by a downloader, as delivered to batch subscribers
+    """
+
+    # The url of the request
+    url: str
+
+    # Bytes in the chunk
+    length: int
+
+    # Position of the stream after the chunk, in bytes
+    position: int
+
+    # Size of the content, in bytes
+    size: int
+
+    # time.monotonic_ns() when the chunk was received
+    monotonic_ns: int
+
+    @property
+    def time(self) -> float:
+        """Seconds since the epoch when the chunk was received"""
+        return monotonic_ns_to_time(self.monotonic_ns)
 
 
 class DownloadEventListener(ABC):
@@ -38,6 +79,17 @@ class DownloadEventListener(ABC):
         """
         pass
 
+    async def on_bytes_transferred_batch(self, events: List[ChunkEvent]) -> None:
+        """
+        Called instead of on_bytes_transferred if the listener subscribed with a batch interval
+
+        Parameters
+        ----------
+        events: List[ChunkEvent]
+            The chunks received since the last batch, in order
+        """
+        pass
+
     async def on_transfer_end(self, size: int, url: str) -> None:
         """
         Parameters
@@ -72,9 +124,86 @@ class DownloadEventListener(ABC):
         pass
 
 
-class DownloadManager(ModuleInterface, ABC):
+class _BatchSubscription(object):
+    __slots__ = ("listener", "interval_ns", "events", "last_flush_ns")
+
+    def __init__(self, listener: DownloadEventListener, interval_ns: int):
+        self.listener = listener
+        self.interval_ns = interval_ns
+        self.events: List[ChunkEvent] = []
+        self.last_flush_ns = time.monotonic_ns()
+
+    async def flush(self, now_ns: int):
+        self.last_flush_ns = now_ns
+        if self.events:
+            events, self.events = self.events, []
+            await self.listener.on_bytes_transferred_batch(events)
+
+
+class DownloadEventBus(object):
+    """
+    Delivers the events of a downloader to its listeners.
+
+    Every chunk is stamped once with time.monotonic_ns(). Listeners subscribe either per event, or to batches of
+    chunk events coalesced over an interval. A batch is delivered with the first chunk after its interval elapsed,
+    and always before the end or the cancellation of any transfer, so batch subscribers see all the chunks of a
+    transfer before its end. Start, end and cancel events are always delivered one by one.
+    """
+
     def __init__(self) -> None:
         self.listeners: List[DownloadEventListener] = []
+        self._batches: List[_BatchSubscription] = []
+
+    def add_listener(self, listener: DownloadEventListener, batch_interval: Optional[float] = None):
+        if listener in self.listeners or any(batch.listener is listener for batch in self._batches):
+            return
+        if batch_interval is None:
+            self.listeners.append(listener)
+        else:
+            self._batches.append(_BatchSubscription(listener, int(batch_interval * 1e9)))
+
+    async def _flush(self):
+        if self._batches:
+            now_ns = time.monotonic_ns()
+            for batch in self._batches:
+                await batch.flush(now_ns)
+
+    async def transfer_start(self, url: str):
+        for listener in self.listeners:
+            await listener.on_transfer_start(url)
+        for batch in self._batches:
+            await batch.listener.on_transfer_start(url)
+
+    async def bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes):
+        for listener in self.listeners:
+            await listener.on_bytes_transferred(length, url, position, size, content)
+        if self._batches:
+            now_ns = time.monotonic_ns()
+            event = ChunkEvent(url, length, position, size, now_ns)
+            for batch in self._batches:
+                batch.events.append(event)
+                if now_ns - batch.last_flush_ns >= batch.interval_ns:
+                    await batch.flush(now_ns)
+
+    async def transfer_end(self, size: int, url: str):
+        await self._flush()
+        for listener in self.listeners:
+            await listener.on_transfer_end(size, url)
+        for batch in self._batches:
+            await batch.listener.on_transfer_end(size, url)
+
+    async def transfer_canceled(self, url: str, position: int, size: int):
+        await self._flush()
+        for listener in self.listeners:
+            await listener.on_transfer_canceled(url, position, size)
+        for batch in self._batches:
+            await batch.listener.on_transfer_canceled(url, position, size)
+
+
+class DownloadManager(ModuleInterface, ABC):
+    def __init__(self) -> None:
+        self.events = DownloadEventBus()
+        self.listeners: List[DownloadEventListener] = self.events.listeners
 
     @property
     @abstractmethod
@@ -121,7 +250,7 @@ class DownloadManager(ModuleInterface, ABC):
         """
         pass
 
-    def add_listener(self, listener: DownloadEventListener):
+    def add_listener(self, listener: DownloadEventListener, batch_interval: Optional[float] = None):
         """
         Dynamically add a listener
 
@@ -129,13 +258,14 @@ class DownloadManager(ModuleInterface, ABC):
         ----------
         listener
             An instance of DownloadEventListener
+        batch_interval
+            If set, chunk events are delivered to on_bytes_transferred_batch, coalesced over this many seconds,
+            instead of one by one to on_bytes_transferred
         """
-
-        if listener not in self.listeners:
-            self.listeners.append(listener)
+        self.events.add_listener(listener, batch_interval)
 
     @abstractmethod
-    async def wait_complete(self, url: str) -> Tuple[bytes, int]:
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         """
         Wait the stream to complete
 
@@ -148,6 +278,35 @@ class DownloadManager(ModuleInterface, ABC):
         -------
             The return value could be None, meaning that the stream got dropped.
             It could be a tuple, the bytes as the first element and size as the second element.
+            The bytes can be a bytearray shared with the downloader, which must not be modified.
+        """
+        pass
+
+    def response_headers(self, url: str) -> Optional[Dict[str, str]]:
+        """
+        Get the response headers of the last request to the URL
+
+        Parameters
+        ----------
+        url:
+            The URL of the request
+
+        Returns
+        -------
+            The headers with lowercase names, and the response status code under the ":status" key.
+            None if the headers are not available.
+        """
+        return None
+
+    async def warm_up(self, url: str):
+        """
+        Open the connection to the origin of the URL ahead of the first request, so the handshake overlaps the
+        player startup. Errors are not raised, the first request will report them.
+
+        Parameters
+        ----------
+        url:
+            A URL of the origin to connect to
         """
         pass
 
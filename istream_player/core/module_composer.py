@@ -8,9 +8,12 @@ from typing import Any, Callable, Dict, Optional, Type, TypedDict
 from istream_player.config.config import PlayerConfig
 from istream_player.core.module import Module, ModuleInterface
 from istream_player.modules.abr.abr_bandwidth import BandwidthABRController
+from istream_player.modules.abr.abr_bola import BolaABRController, BolaEABRController
 from istream_player.modules.abr.abr_buffer import BufferABRController
 from istream_player.modules.abr.abr_dash import DashABRController
 from istream_player.modules.abr.abr_hybrid import HybridABRController
+from istream_player.modules.abr.abr_mpc import MPCABRController
+from istream_player.modules.abr.abr_viewport import ViewportABRController
 from istream_player.modules.analyzer.analyzer import PlaybackAnalyzer
 from istream_player.modules.analyzer.event_logger import EventLogger
 from istream_player.modules.analyzer.file_content_listener import \
@@ -18,11 +21,17 @@ from istream_player.modules.analyzer.file_content_listener import \
 from istream_player.modules.analyzer.playback import Playback
 from istream_player.modules.buffer.buffer_manager import BufferManagerImpl
 from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_cont import ContinuousBandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_ewma import EWMABandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_harmonic import HarmonicBandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_percentile import PercentileBandwidthMeterImpl
+from istream_player.modules.downloader.http2 import H2ClientImpl
 from istream_player.modules.downloader.local import LocalClient
 from istream_player.modules.downloader.quic.client import QuicClientImpl
 from istream_player.modules.downloader.tcp import TCPClientImpl
 from istream_player.modules.mpd.mpd_provider_impl import MPDProviderImpl
 from istream_player.modules.player.player_dash import DASHPlayer
+from istream_player.modules.scheduler.prefetch_scheduler import PrefetchSchedulerImpl
 from istream_player.modules.scheduler.scheduler import SchedulerImpl
 
 ModInitFnType = Callable[[str, Any, Any], Dict[str, Module]]
@@ -223,18 +232,52 @@ class PlayerComposer:
     def register_core_modules(self):
         self.register_module("mpd", [MPDProviderImpl], single_initializer, "MPD Provider", False, "mpd")
         self.register_module(
-            "downloader", [LocalClient, TCPClientImpl, QuicClientImpl], downloader_initializer, "Downloader", False, "local"
+            "downloader",
+            [LocalClient, TCPClientImpl, H2ClientImpl, QuicClientImpl],
+            downloader_initializer,
+            "Downloader",
+            False,
+            "local",
+        )
+        self.register_module(
+            "bw",
+            [
+                BandwidthMeterImpl,
+                ContinuousBandwidthMeterImpl,
+                HarmonicBandwidthMeterImpl,
+                EWMABandwidthMeterImpl,
+                PercentileBandwidthMeterImpl,
+            ],
+            single_initializer,
+            "Bandwidth Estimation",
+            False,
+            "bw_meter",
         )
-        self.register_module("bw", [BandwidthMeterImpl], single_initializer, "Bandwidth Estimation", False, "bw_meter")
         self.register_module(
             "abr",
-            [DashABRController, BufferABRController, BandwidthABRController, HybridABRController],
+            [
+                DashABRController,
+                BufferABRController,
+                BandwidthABRController,
+                HybridABRController,
+                BolaABRController,
+                BolaEABRController,
+                MPCABRController,
+                ViewportABRController,
+            ],
             single_initializer,
             "Adaptive Bitrate Controller",
             False,
             "dash",
         )
-        self.register_module("scheduler", [SchedulerImpl], single_initializer, "Segment download scheduler", False, "scheduler")
+        self.register_module(
+            "scheduler",
+            [SchedulerImpl, PrefetchSchedulerImpl],
+            single_initializer,
+            "Segment download scheduler",
+            False,
+            "scheduler",
+        )
         self.register_module("buffer", [BufferManagerImpl], single_initializer, "Buffer manager", False, "buffer_manager")
         self.register_module("player", [DASHPlayer], single_initializer, "Headless DASH Streamer", False, "dash")
         self.register_module(
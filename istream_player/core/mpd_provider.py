@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Optional
 
@@ -12,6 +13,16 @@ class MPDProvider(ModuleInterface, ABC):
     def mpd(self) -> Optional[MPD]:
         pass
 
+    @property
+    @abstractmethod
+    def mpd_update_cond(self) -> asyncio.Condition:
+        """
+        Returns
+        -------
+        mpd_update_cond: asyncio.Condition
+            async condition notified every time a new MPD is available
+        """
+
     @abstractmethod
     async def stop(self):
         """
@@ -1,8 +1,24 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from typing import Dict, Literal, Optional
+from typing import Dict, Iterable, Iterator, List, Literal, Mapping, Optional
 
 
 class MPD(object):
+    __slots__ = (
+        "content",
+        "url",
+        "type",
+        "media_presentation_duration",
+        "min_buffer_time",
+        "max_segment_duration",
+        "adaptation_sets",
+        "attrib",
+        "minimum_update_period",
+        "time_shift_buffer_depth",
+    )
+
     def __init__(
         self,
         content: str,
@@ -12,7 +28,9 @@ class MPD(object):
         max_segment_duration: float,
         min_buffer_time: float,
         adaptation_sets: Dict[int, "AdaptationSet"],
-        attrib: Dict[str, str]
+        attrib: Dict[str, str],
+        minimum_update_period: float = 0,
+        time_shift_buffer_depth: Optional[float] = None,
     ):
         self.content = content
         """
@@ -54,8 +72,33 @@ class MPD(object):
         All attributes from XML
         """
 
+        self.minimum_update_period = minimum_update_period
+        """
+        The minimum period between two refreshes of a dynamic MPD in seconds. 0 if not specified.
+        """
+
+        self.time_shift_buffer_depth = time_shift_buffer_depth
+        """
+        The duration of the time shifting buffer of a dynamic MPD in seconds. None if not specified.
+        """
+
 
 class AdaptationSet(object):
+    __slots__ = (
+        "id",
+        "content_type",
+        "frame_rate",
+        "max_width",
+        "max_height",
+        "par",
+        "representations",
+        "attrib",
+        "first_segment_num",
+        "last_segment_num",
+        "supplemental_properties",
+        "_representation_index",
+    )
+
     def __init__(
         self,
         adaptation_set_id: int,
@@ -65,7 +108,8 @@ class AdaptationSet(object):
         max_height: int,
         par: Optional[str],
         representations: Dict[int, "Representation"],
-        attrib: Dict[str, str]
+        attrib: Dict[str, str],
+        supplemental_properties: Optional[Dict[str, str]] = None,
     ):
         self.id = adaptation_set_id
         """
@@ -107,8 +151,67 @@ class AdaptationSet(object):
         All attributes from XML
         """
 
+        self.supplemental_properties: Dict[str, str] = supplemental_properties if supplemental_properties is not None else {}
+        """
+        The values of the SupplementalProperty elements, by schemeIdUri
+        """
+
+        self.first_segment_num: Optional[int] = None
+        """
+        The smallest segment number among all the representations. None if there are no segments.
+        """
+
+        self.last_segment_num: Optional[int] = None
+        """
+        The largest segment number among all the representations. None if there are no segments.
+        """
+
+        self._representation_index: Optional[RepresentationIndex] = None
+
+        self.update_segment_bounds()
+
+    def update_segment_bounds(self):
+        """
+        Recompute the segment number bounds from the cached bounds of the representations.
+        Call it after the bounds of any representation changed.
+        """
+        firsts = [repr.first_segment_num for repr in self.representations.values() if repr.first_segment_num is not None]
+        lasts = [repr.last_segment_num for repr in self.representations.values() if repr.last_segment_num is not None]
+        self.first_segment_num = min(firsts, default=None)
+        self.last_segment_num = max(lasts, default=None)
+
+    @property
+    def representation_index(self) -> "RepresentationIndex":
+        """
+        The representations ordered by bitrate. Built on first use, and shared by everything using this adaptation set
+        until the representations change.
+        """
+        if self._representation_index is None:
+            self._representation_index = RepresentationIndex(self.representations.values())
+        return self._representation_index
+
+    def update_representations(self):
+        """
+        Drop the representation index. Call it after representations are added or removed.
+        """
+        self._representation_index = None
+
 
 class Representation(object):
+    __slots__ = (
+        "id",
+        "mime_type",
+        "codecs",
+        "bandwidth",
+        "width",
+        "height",
+        "initialization",
+        "segments",
+        "attrib",
+        "first_segment_num",
+        "last_segment_num",
+    )
+
     def __init__(
         self,
         id_: int,
@@ -118,7 +221,7 @@ class Representation(object):
         width: int,
         height: int,
         initialization: str,
-        segments: Dict[int, "Segment"],
+        segments: "SegmentSequence",
         attrib: Dict[str, str]
     ):
         self.id = id_
@@ -156,9 +259,9 @@ class Representation(object):
         The initialization URL
         """
 
-        self.segments: Dict[int, Segment] = segments
+        self.segments: SegmentSequence = segments
         """
-        The video segments
+        The video segments, by segment number
         """
 
         self.attrib = attrib
@@ -166,8 +269,85 @@ class Representation(object):
         All attributes from XML
         """
 
+        self.first_segment_num: Optional[int] = None
+        """
+        The smallest segment number. None if there are no segments.
+        """
+
+        self.last_segment_num: Optional[int] = None
+        """
+        The largest segment number. None if there are no segments.
+        """
+
+        self.update_segment_bounds()
+
+    def update_segment_bounds(self):
+        """
+        Recompute the segment number bounds. Call it after segments are added or removed.
+        """
+        self.first_segment_num = self.segments.first_number
+        self.last_segment_num = self.segments.last_number
+
+
+class RepresentationIndex(object):
+    """
+    The representations of an adaptation set ordered by bitrate, lowest first.
+    The rank of a representation is its position in this order.
+    """
+
+    __slots__ = ("representations", "bitrates", "_ranks")
+
+    def __init__(self, representations: Iterable[Representation]):
+        self.representations: List[Representation] = sorted(representations, key=lambda r: r.bandwidth)
+        assert len(self.representations) > 0, "Adaptation set without representations"
+
+        self.bitrates: List[int] = [representation.bandwidth for representation in self.representations]
+        """
+        The bitrates of the representations in bps, in increasing order
+        """
+
+        self._ranks: Dict[int, int] = {representation.id: rank for rank, representation in enumerate(self.representations)}
 
-@dataclass
+    def __len__(self) -> int:
+        return len(self.representations)
+
+    @property
+    def lowest(self) -> Representation:
+        return self.representations[0]
+
+    @property
+    def highest(self) -> Representation:
+        return self.representations[-1]
+
+    def rank(self, repr_id: int) -> int:
+        """
+        Returns
+        -------
+        rank: int
+            The rank of the representation, 0 for the lowest bitrate. Raises KeyError for an unknown id.
+        """
+        return self._ranks[repr_id]
+
+    def rank_below(self, bw: float) -> int:
+        """
+        Returns
+        -------
+        rank: int
+            The rank of the highest bitrate lower than bw, or 0 if there is none
+        """
+        return max(bisect_left(self.bitrates, bw) - 1, 0)
+
+    def highest_below(self, bw: float) -> Representation:
+        """
+        Returns
+        -------
+        representation: Representation
+            The representation with the highest bitrate lower than bw, or the lowest bitrate if there is none
+        """
+        return self.representations[self.rank_below(bw)]
+
+
+@dataclass(slots=True)
 class Segment(object):
     # Segment URL
     url: str
@@ -186,3 +366,241 @@ class Segment(object):
 
     # Representation ID
     repr_id: int
+
+
+class SegmentSequence(Mapping[int, Segment]):
+    """
+    Read-only mapping from segment number to Segment, expanded lazily from a SegmentTemplate.
+
+    Only the runs of equal-duration segments are stored (one per SegmentTimeline "S" element, or a single run
+    for a template with a fixed duration). The URL, start time and duration of a segment are computed when it is
+    looked up, so the memory and the parsing time do not depend on the number of segments.
+    """
+
+    _IDENTIFIER = re.compile(r"\$(\$|Number(%0?\d*d)?\$)")
+
+    __slots__ = (
+        "init_url",
+        "timescale",
+        "as_id",
+        "repr_id",
+        "_url_format",
+        "_url_pattern",
+        "_url_affixes",
+        "_run_numbers",
+        "_run_times",
+        "_run_durations",
+        "_run_counts",
+        "_length",
+    )
+
+    def __init__(self, media: str, init_url: str, timescale: int, as_id: int, repr_id: int):
+        """
+        Parameters
+        ----------
+        media: str
+            The media URL template. Only the $Number$ identifier (optionally with a format tag) and the $$ escape are
+            supported, other identifiers raise an exception.
+        init_url: str
+            The initialization URL of the representation
+        timescale: int
+            The timescale of the "t" and "d" values of the runs
+        as_id: int
+            The adaptation set ID
+        repr_id: int
+            The representation ID
+        """
+        self.init_url = init_url
+        self.timescale = timescale
+        self.as_id = as_id
+        self.repr_id = repr_id
+
+        self._url_format, self._url_pattern, self._url_affixes = self._compile_template(media)
+
+        # Runs of segments with the same duration, as compact columns of 64-bit integers. The i-th run covers the
+        # segment numbers [_run_numbers[i], _run_numbers[i] + _run_counts[i]), and starts at _run_times[i]
+        self._run_numbers = array("q")
+        self._run_times = array("q")
+        self._run_durations = array("q")
+        self._run_counts = array("q")
+        self._length = 0
+
+    @classmethod
+    def _compile_template(cls, media: str) -> tuple[str, re.Pattern, Optional[tuple[str, str]]]:
+        """
+        Convert the media template to a %-format string for the forward lookup and a regex for the reverse lookup,
+        and get the URL text before and after the segment number if the template has a single $Number$
+        """
+        for identifier in re.findall(r"\$([^$]*)\$", media):
+            if identifier and not cls._IDENTIFIER.fullmatch(f"${identifier}$"):
+                raise Exception(f"Cannot replace {identifier} in {media}")
+
+        url_format = []
+        url_pattern = []
+        # URL text of the template, split at the $Number$ identifiers
+        parts = [""]
+        position = 0
+        for match in cls._IDENTIFIER.finditer(media):
+            literal = media[position:match.start()]
+            url_format.append(literal.replace("%", "%%"))
+            url_pattern.append(re.escape(literal))
+            parts[-1] += literal
+            if match.group(1) == "$":
+                url_format.append("$")
+                url_pattern.append(re.escape("$"))
+                parts[-1] += "$"
+            else:
+                url_format.append(match.group(2) or "%d")
+                url_pattern.append(r"(\d+)")
+                parts.append("")
+            position = match.end()
+        literal = media[position:]
+        url_format.append(literal.replace("%", "%%"))
+        url_pattern.append(re.escape(literal))
+        parts[-1] += literal
+        url_affixes = (parts[0], parts[1]) if len(parts) == 2 else None
+        return "".join(url_format), re.compile("".join(url_pattern)), url_affixes
+
+    def add_run(self, number: int, time: int, duration: int, count: int):
+        """
+        Append a run of `count` consecutive segments of the same duration
+
+        Parameters
+        ----------
+        number: int
+            The number of the first segment in the run. It must follow the last segment of the previous run.
+        time: int
+            The start time of the first segment, in timescale units
+        duration: int
+            The duration of every segment, in timescale units
+        count: int
+            The number of segments in the run
+        """
+        if count <= 0:
+            return
+        if self._run_numbers:
+            assert number == self._run_numbers[-1] + self._run_counts[-1], "Segment runs should be contiguous"
+        self._run_numbers.append(number)
+        self._run_times.append(time)
+        self._run_durations.append(duration)
+        self._run_counts.append(count)
+        self._length += count
+
+    def extend(self, other: "SegmentSequence"):
+        """
+        Append the segments of `other` that come after the last segment of this sequence
+
+        Parameters
+        ----------
+        other: SegmentSequence
+            A newer version of the same sequence, e.g. from a refreshed live MPD
+        """
+        next_number = self.last_number + 1 if self._run_numbers else None
+        for number, time, duration, count in zip(other._run_numbers, other._run_times, other._run_durations, other._run_counts):
+            if next_number is not None and number < next_number:
+                # Skip the segments that are already known
+                skipped = min(next_number - number, count)
+                number, time, count = number + skipped, time + skipped * duration, count - skipped
+            self.add_run(number, time, duration, count)
+            if count > 0:
+                next_number = number + count
+
+    def evict_before(self, number: int):
+        """
+        Remove all the segments with a number smaller than `number`
+        """
+        while self._run_numbers and self._run_numbers[0] < number:
+            first, count = self._run_numbers[0], self._run_counts[0]
+            if first + count <= number:
+                del self._run_numbers[0], self._run_times[0], self._run_durations[0], self._run_counts[0]
+                self._length -= count
+            else:
+                evicted = number - first
+                self._run_numbers[0] = number
+                self._run_times[0] += evicted * self._run_durations[0]
+                self._run_counts[0] -= evicted
+                self._length -= evicted
+
+    def evict_ended_before(self, time: float):
+        """
+        Remove all the segments that end at or before the given presentation time in seconds
+        """
+        ticks = time * self.timescale
+        for number, start, duration, count in zip(self._run_numbers, self._run_times, self._run_durations, self._run_counts):
+            if start + count * duration > ticks:
+                # Number of segments in this run that ended already
+                self.evict_before(number + max(0, int((ticks - start) // duration)))
+                return
+        if self._run_numbers:
+            self.evict_before(self.last_number + 1)
+
+    @property
+    def end_time(self) -> Optional[float]:
+        """The presentation time in seconds when the last segment ends. None if there are no segments."""
+        if not self._run_numbers:
+            return None
+        return (self._run_times[-1] + self._run_counts[-1] * self._run_durations[-1]) / self.timescale
+
+    @property
+    def first_number(self) -> Optional[int]:
+        """The smallest segment number. None if there are no segments."""
+        return self._run_numbers[0] if self._run_numbers else None
+
+    @property
+    def last_number(self) -> Optional[int]:
+        """The largest segment number. None if there are no segments."""
+        return self._run_numbers[-1] + self._run_counts[-1] - 1 if self._run_numbers else None
+
+    def url(self, number: int) -> str:
+        """Get the URL of the segment with given number, without checking that the segment exists"""
+        return self._url_format % number
+
+    @property
+    def url_affixes(self) -> Optional[tuple[str, str]]:
+        """
+        The URL text before and after the segment number, shared by all the segment URLs.
+        None if the template does not have exactly one $Number$ identifier.
+        """
+        return self._url_affixes
+
+    def number_of(self, url: str) -> Optional[int]:
+        """
+        Get the number of the segment with given URL in O(1)
+
+        Returns
+        -------
+        number: Optional[int]
+            The segment number. None if the URL is not a segment of this sequence.
+        """
+        match = self._url_pattern.fullmatch(url)
+        if match is None or not match.groups():
+            return None
+        number = int(match.group(1))
+        # A different zero padding would produce a different URL
+        if number not in self or self.url(number) != url:
+            return None
+        return number
+
+    def __getitem__(self, number: int) -> Segment:
+        if not isinstance(number, int) or number not in self:
+            raise KeyError(number)
+        run = bisect_right(self._run_numbers, number) - 1
+        offset = number - self._run_numbers[run]
+        duration = self._run_durations[run]
+        start_time = self._run_times[run] + offset * duration
+        return Segment(
+            self.url(number), self.init_url, duration / self.timescale, start_time / self.timescale, self.as_id, self.repr_id
+        )
+
+    def __contains__(self, number: object) -> bool:
+        if not isinstance(number, int) or not self._run_numbers:
+            return False
+        # Runs are contiguous
+        return self._run_numbers[0] <= number < self._run_numbers[-1] + self._run_counts[-1]
+
+    def __iter__(self) -> Iterator[int]:
+        for number, count in zip(self._run_numbers, self._run_counts):
+            yield from range(number, number + count)
+
+    def __len__(self) -> int:
+        return self._length
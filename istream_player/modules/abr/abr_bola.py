@@ -0,0 +1,190 @@
+import logging
+import math
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.abr import ABRController
+from istream_player.core.buffer import BufferManager
+from istream_player.core.bw_meter import BandwidthMeter
+from istream_player.core.module import Module, ModuleOption
+from istream_player.models.mpd_objects import AdaptationSet, RepresentationIndex
+
+
+class BolaTable(object):
+    """
+    The BOLA decision of one adaptation set, precomputed for every buffer level.
+
+    BOLA picks the quality m maximizing (Vp * (u_m + gp) - Q) / S_m, where Q is the buffer level, S_m the bitrate and
+    u_m = ln(S_m / S_0) + 1 the utility. As a function of Q every score is a line, so the decision is the upper
+    envelope of R lines: the quality only goes up with the buffer level and changes at R - 1 thresholds at most.
+    The envelope is built once, a decision is then a binary search of the thresholds.
+    Qualities are the ranks of the representation index.
+    """
+
+    __slots__ = ("index", "thresholds", "qualities")
+
+    def __init__(self, index: RepresentationIndex, min_buffer: float, buffer_target: float):
+        """
+        Parameters
+        ----------
+        index: RepresentationIndex
+            The representations of the adaptation set
+        min_buffer: float
+            The buffer level in seconds under which the lowest quality is selected
+        buffer_target: float
+            The buffer level in seconds at which the highest quality is selected
+        """
+        self.index = index
+
+        # Qualities on the upper envelope, and the buffer level from which each one is selected
+        self.qualities: List[int] = [0]
+        self.thresholds: List[float] = []
+        bitrates = index.bitrates
+        if bitrates[-1] == bitrates[0]:
+            return
+
+        utilities = [math.log(bitrate / bitrates[0]) + 1 for bitrate in bitrates]
+        gp = (utilities[-1] - 1) / (buffer_target / min_buffer - 1)
+        vp = min_buffer / gp
+
+        # Score of quality m at buffer level Q: offsets[m] - Q * slopes[m]
+        offsets = [vp * (utility + gp) / bitrate for utility, bitrate in zip(utilities, bitrates)]
+        slopes = [1 / bitrate for bitrate in bitrates]
+
+        def crossing(low: int, high: int) -> float:
+            # Buffer level from which quality `high` scores better than quality `low`
+            return (offsets[low] - offsets[high]) / (slopes[low] - slopes[high])
+
+        hull: List[int] = []
+        for quality in range(len(bitrates)):
+            # Of the representations with the same bitrate only the first one is selected
+            if quality > 0 and bitrates[quality] == bitrates[quality - 1]:
+                continue
+            while len(hull) >= 2 and crossing(hull[-2], quality) <= crossing(hull[-2], hull[-1]):
+                hull.pop()
+            hull.append(quality)
+        self.qualities = hull
+        self.thresholds = [crossing(low, high) for low, high in zip(hull, hull[1:])]
+
+    def quality(self, buffer_level: float) -> int:
+        """
+        Returns
+        -------
+        quality: int
+            The rank of the BOLA decision at this buffer level
+        """
+        return self.qualities[bisect_right(self.thresholds, buffer_level)]
+
+
+@ModuleOption("bola", requires=[BufferManager])
+class BolaABRController(Module, ABRController):
+    """
+    BOLA-BASIC [1]. The quality is chosen from the buffer level only, with a Lyapunov utility maximization.
+
+    [1] K. Spiteri, R. Urgaonkar and R. K. Sitaraman, "BOLA: Near-optimal bitrate adaptation for online videos,"
+    IEEE INFOCOM 2016
+    """
+
+    log = logging.getLogger("BolaABRController")
+
+    def __init__(self, *, min_buffer=None, buffer_target=None):
+        """
+        Parameters
+        ----------
+        min_buffer:
+            The buffer level in seconds under which the lowest quality is selected. Defaults to the panic buffer level.
+        buffer_target:
+            The buffer level in seconds at which the highest quality is selected. Defaults to the buffer duration.
+        """
+        self.min_buffer = float(min_buffer) if min_buffer is not None else None
+        self.buffer_target = float(buffer_target) if buffer_target is not None else None
+        self._tables: Dict[int, BolaTable] = {}
+        self._last_selections: Optional[Dict[int, int]] = None
+
+    async def setup(self, config: PlayerConfig, buffer_manager: BufferManager, **kwargs):
+        self.buffer_manager = buffer_manager
+        if self.min_buffer is None:
+            self.min_buffer = config.panic_buffer_level
+        if self.buffer_target is None:
+            self.buffer_target = config.buffer_duration
+        assert 0 < self.min_buffer < self.buffer_target, "Minimum buffer should be positive and lower than the target"
+
+    def table(self, adaptation_set: AdaptationSet) -> BolaTable:
+        index = adaptation_set.representation_index
+        table = self._tables.get(adaptation_set.id)
+        if table is None or table.index is not index:
+            assert self.min_buffer is not None and self.buffer_target is not None
+            table = BolaTable(index, self.min_buffer, self.buffer_target)
+            self._tables[adaptation_set.id] = table
+        return table
+
+    def choose_quality(
+        self, table: BolaTable, buffer_level: float, adaptation_set: AdaptationSet, adaptation_sets: Dict[int, AdaptationSet]
+    ) -> int:
+        return table.quality(buffer_level)
+
+    def update_selection(self, adaptation_sets: Dict[int, AdaptationSet], index: int) -> Dict[int, int]:
+        buffer_level = self.buffer_manager.buffer_level
+        selections = {}
+        for adaptation_set in adaptation_sets.values():
+            table = self.table(adaptation_set)
+            quality = self.choose_quality(table, buffer_level, adaptation_set, adaptation_sets)
+            selections[adaptation_set.id] = table.index.representations[quality].id
+        self._last_selections = selections
+        self.log.info(f"Final selection at buffer level {buffer_level} is {selections}")
+        return selections
+
+
+@ModuleOption("bola_e", requires=[BandwidthMeter, BufferManager])
+class BolaEABRController(BolaABRController):
+    """
+    BOLA-E [1]. BOLA with the throughput estimate used where the buffer level alone is not enough:
+
+    - While nothing is buffered yet, the quality is chosen from the throughput.
+    - The quality is never switched up above what the throughput sustains, unless it was already selected, which
+      avoids the oscillations of BOLA when the throughput lies between two bitrates.
+
+    [1] K. Spiteri, R. Sitaraman and D. Sparacio, "From theory to practice: improving bitrate adaptation in the DASH
+    reference player," ACM MMSys 2018
+    """
+
+    log = logging.getLogger("BolaEABRController")
+
+    def __init__(self, *, safety_factor="0.9", **kwargs):
+        """
+        Parameters
+        ----------
+        safety_factor:
+            The fraction of the bandwidth estimate considered sustainable
+        """
+        super().__init__(**kwargs)
+        self.safety_factor = float(safety_factor)
+
+    async def setup(self, config: PlayerConfig, bandwidth_meter: BandwidthMeter, buffer_manager: BufferManager, **kwargs):
+        await super().setup(config, buffer_manager)
+        self.bandwidth_meter = bandwidth_meter
+
+    def available_bandwidth(self, adaptation_set: AdaptationSet, adaptation_sets: Dict[int, AdaptationSet]) -> float:
+        available_bandwidth = self.bandwidth_meter.bandwidth * self.safety_factor
+        num_videos = sum(1 for a in adaptation_sets.values() if a.content_type == "video")
+        num_audios = len(adaptation_sets) - num_videos
+        if num_videos == 0 or num_audios == 0:
+            return available_bandwidth / len(adaptation_sets)
+        if adaptation_set.content_type == "video":
+            return available_bandwidth * 0.8 / num_videos
+        return available_bandwidth * 0.2 / num_audios
+
+    def choose_quality(
+        self, table: BolaTable, buffer_level: float, adaptation_set: AdaptationSet, adaptation_sets: Dict[int, AdaptationSet]
+    ) -> int:
+        throughput_quality = table.index.rank_below(self.available_bandwidth(adaptation_set, adaptation_sets))
+        last_repr_id = self._last_selections.get(adaptation_set.id) if self._last_selections is not None else None
+        if last_repr_id is None or buffer_level <= 0:
+            return throughput_quality
+
+        quality = table.quality(buffer_level)
+        last_quality = table.index.rank(last_repr_id) if last_repr_id in adaptation_set.representations else 0
+        if quality > last_quality:
+            quality = min(quality, max(last_quality, throughput_quality))
+        return quality
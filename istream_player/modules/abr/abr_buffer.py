@@ -1,17 +1,19 @@
-from collections import OrderedDict
-from typing import Dict, Optional
+from bisect import bisect_left
+from typing import Dict, List, Tuple
 
 from istream_player.config.config import PlayerConfig
 from istream_player.core.abr import ABRController
 from istream_player.core.buffer import BufferManager
 from istream_player.core.module import Module, ModuleOption
 from istream_player.models import AdaptationSet
+from istream_player.models.mpd_objects import RepresentationIndex
 
 
 @ModuleOption("buffer", requires=[BufferManager])
 class BufferABRController(Module, ABRController):
     def __init__(self):
-        self.rate_map = None
+        # Rate map markers by adaptation set id, with the representation index they were computed for
+        self.rate_maps: Dict[int, Tuple[RepresentationIndex, List[float]]] = {}
 
         self.RESERVOIR = 0.1
         self.UPPER_RESERVOIR = 0.9
@@ -28,7 +30,7 @@ class BufferABRController(Module, ABRController):
 
         return final_selections
 
-    def choose_ideal_selection_buffer_based(self, adaptation_set) -> Optional[int]:
+    def choose_ideal_selection_buffer_based(self, adaptation_set: AdaptationSet) -> int:
         """
         Module that estimates the next bitrate based on the rate map.
         Rate Map: Buffer Occupancy vs. Bitrates:
@@ -39,51 +41,40 @@ class BufferABRController(Module, ABRController):
             if Buffer Occupancy > Cushion :
                 Maximum Bitrate
         Ref. Fig. 6 from [1]
-        :param current_buffer_occupancy: Current buffer occupancy in number of segments
-        :param bitrates: List of available bitrates [r_min, .... r_max]
-        :return:the bitrate for the next segment
+        :param adaptation_set: The adaptation set to choose
+        :return: the representation id for the next segment
         """
-        next_bitrate = None
-
-        bitrates = [representation.bandwidth for representation in adaptation_set.representations.values()]
-        bitrates.sort()
+        index = adaptation_set.representation_index
 
         # Calculate the current buffer occupancy percentage
         current_buffer_occupancy = self.buffer_manager.buffer_level
         buffer_percentage = current_buffer_occupancy / self.buffer_size
 
-        # Selecting the next bitrate based on the rate map
-        if self.rate_map is None:
-            self.rate_map = self.get_rate_map(bitrates)
-
-        if buffer_percentage <= self.RESERVOIR:
-            next_bitrate = bitrates[0]
-        elif buffer_percentage >= self.UPPER_RESERVOIR:
-            next_bitrate = bitrates[-1]
-        else:
-            for marker in reversed(self.rate_map.keys()):
-                if marker < buffer_percentage:
-                    break
-                next_bitrate = self.rate_map[marker]
+        # Selecting the next bitrate based on the rate map of the adaptation set
+        cached = self.rate_maps.get(adaptation_set.id)
+        if cached is None or cached[0] is not index:
+            cached = self.rate_maps[adaptation_set.id] = (index, self.get_rate_map(len(index)))
+        markers = cached[1]
 
-        representation_id = None
-        for representation in adaptation_set.representations.values():
-            if representation.bandwidth == next_bitrate:
-                representation_id = representation.id
+        # The lowest quality whose marker is not below the buffer occupancy
+        rank = min(bisect_left(markers, buffer_percentage), len(index) - 1)
+        return index.representations[rank].id
 
-        return representation_id
-
-    def get_rate_map(self, bitrates):
+    def get_rate_map(self, num_bitrates: int) -> List[float]:
         """
         Module to generate the rate map for the bitrates, reservoir, and cushion
+
+        Returns
+        -------
+        markers: List[float]
+            The buffer occupancy marker of every bitrate, lowest bitrate first
         """
-        rate_map = OrderedDict()
-        rate_map[self.RESERVOIR] = bitrates[0]
-        intermediate_levels = bitrates[1:-1]
-        marker_length = (self.UPPER_RESERVOIR - self.RESERVOIR) / (len(intermediate_levels) + 1)
+        markers = [self.RESERVOIR]
+        num_intermediate_levels = max(num_bitrates - 2, 0)
+        marker_length = (self.UPPER_RESERVOIR - self.RESERVOIR) / (num_intermediate_levels + 1)
         current_marker = self.RESERVOIR + marker_length
-        for bitrate in intermediate_levels:
-            rate_map[current_marker] = bitrate
+        for _ in range(num_intermediate_levels):
+            markers.append(current_marker)
             current_marker += marker_length
-        rate_map[self.UPPER_RESERVOIR] = bitrates[-1]
-        return rate_map
+        markers.append(self.UPPER_RESERVOIR)
+        return markers
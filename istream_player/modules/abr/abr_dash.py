@@ -48,13 +48,8 @@ class DashABRController(Module, ABRController):
         id: int
             The representation id
         """
-        representations = sorted(adaptation_set.representations.values(), key=lambda x: x.bandwidth, reverse=True)
-
-        for representation in representations:
-            if representation.bandwidth < bw:
-                return representation.id
-        # If there's no representation whose bitrate is lower than the estimate, return the lowest one
-        return representations[-1].id
+        # If there's no representation whose bitrate is lower than the estimate, the lowest one is returned
+        return adaptation_set.representation_index.highest_below(bw).id
 
     def update_selection(self, adaptation_sets: Dict[int, AdaptationSet], index: int) -> Dict[int, int]:
         assert self.mpd_provider.mpd is not None, "MPD File not downloaded"
@@ -20,10 +20,7 @@ class FixedABRController(Module, ABRController):
         final_selections = dict()
 
         def has_seg_id(rep: Representation):
-            for seg_id, _ in rep.segments.items():
-                if seg_id == index:
-                    return True
-            return False
+            return index in rep.segments
 
         for adaptation_set in adaptation_sets.values():
             repr = [rep for rep_id, rep in adaptation_set.representations.items() if has_seg_id(rep)]
@@ -0,0 +1,205 @@
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.abr import ABRController
+from istream_player.core.buffer import BufferManager
+from istream_player.core.bw_meter import BandwidthMeter, DownloadStats
+from istream_player.core.module import Module, ModuleOption
+from istream_player.core.mpd_provider import MPDProvider
+from istream_player.core.scheduler import Scheduler, SchedulerEventListener
+from istream_player.models.mpd_objects import AdaptationSet, Segment
+
+
+def combinations(num_qualities: int, horizon: int) -> np.ndarray:
+    """
+    Returns
+    -------
+    combinations: np.ndarray
+        All the sequences of `horizon` qualities out of `num_qualities`, in lexicographic order, as an array of shape
+        (num_qualities ** horizon, horizon)
+    """
+    grid = np.indices((num_qualities,) * horizon, dtype=np.intp)
+    return grid.reshape(horizon, -1).T
+
+
+def measured_throughput(stats: Dict[int, DownloadStats]) -> Optional[float]:
+    """
+    Returns
+    -------
+    throughput: float, optional
+        The throughput in bps of the downloads of a segment index, from the first start to the last byte. None if
+        it cannot be measured.
+    """
+    starts = [stat.start_time for stat in stats.values() if stat.start_time is not None]
+    ends = [end for stat in stats.values() if (end := stat.last_byte_at or stat.stop_time) is not None]
+    if not starts or not ends or max(ends) <= min(starts):
+        return None
+    return 8 * sum(stat.received_bytes for stat in stats.values()) / (max(ends) - min(starts))
+
+
+@ModuleOption("mpc", requires=[BandwidthMeter, BufferManager, MPDProvider, Scheduler])
+class MPCABRController(Module, ABRController, SchedulerEventListener):
+    """
+    RobustMPC [1]. Every sequence of qualities over the next `horizon` segments is scored with the QoE model
+
+        sum(bitrate) - smooth_penalty * sum(|bitrate switch|) - rebuffer_penalty * rebuffering time
+
+    simulating the buffer with the throughput prediction, and the first quality of the best sequence is selected.
+    The prediction is the estimate of the bandwidth meter, discounted by the largest relative error of the last
+    `window` predictions against the throughput measured over the segments downloaded next. Bitrates are in Mbps.
+
+    Only the rebuffering depends on the buffer level and the throughput. The score of the bitrates and switches of
+    every sequence is precomputed once per bitrate ladder and last quality, and the buffer is simulated level by
+    level over the tree of sequence prefixes, so a decision is a few NumPy operations on R ** horizon elements.
+
+    [1] X. Yin, A. Jindal, V. Sekar and B. Sinopoli, "A Control-Theoretic Approach for Dynamic Adaptive Video
+    Streaming over HTTP," ACM SIGCOMM 2015
+    """
+
+    log = logging.getLogger("MPCABRController")
+
+    def __init__(self, *, horizon="5", window="5", smooth_penalty="1", rebuffer_penalty=None):
+        """
+        Parameters
+        ----------
+        horizon:
+            The number of segments in the lookahead
+        window:
+            The number of past predictions whose error discounts the prediction
+        smooth_penalty:
+            The penalty of a bitrate switch, per Mbps of difference
+        rebuffer_penalty:
+            The penalty of a second of rebuffering. Defaults to the highest bitrate in Mbps.
+        """
+        self.horizon = int(horizon)
+        assert self.horizon >= 1, "Horizon should be at least one segment"
+        self.smooth_penalty = float(smooth_penalty)
+        self.rebuffer_penalty = float(rebuffer_penalty) if rebuffer_penalty is not None else None
+
+        self._errors: Deque[float] = deque(maxlen=int(window))
+        self._last_prediction: Optional[float] = None
+        self._last_selections: Dict[int, int] = {}
+
+        # Combination tables by (number of qualities, horizon)
+        self._combinations: Dict[Tuple[int, int], np.ndarray] = {}
+        # Score of the bitrates and switches of every combination, by (bitrates, horizon, last quality)
+        self._static_scores: Dict[Tuple[Tuple[int, ...], int, int], np.ndarray] = {}
+
+    async def setup(
+        self,
+        config: PlayerConfig,
+        bandwidth_meter: BandwidthMeter,
+        buffer_manager: BufferManager,
+        mpd_provider: MPDProvider,
+        scheduler: Scheduler,
+        **kwargs,
+    ):
+        self.bandwidth_meter = bandwidth_meter
+        self.buffer_manager = buffer_manager
+        self.mpd_provider = mpd_provider
+        scheduler.add_listener(self)
+
+    async def on_segment_download_complete(self, index: int, segments: Dict[int, Segment], stats: Dict[int, DownloadStats]):
+        throughput = measured_throughput(stats)
+        if self._last_prediction is not None and throughput is not None and throughput > 0:
+            self._errors.append(abs(self._last_prediction - throughput) / throughput)
+
+    def predict_bandwidth(self) -> float:
+        """
+        Returns
+        -------
+        bw: float
+            The throughput prediction in bps, discounted by the recent prediction errors
+        """
+        bw = self.bandwidth_meter.bandwidth
+        self._last_prediction = bw
+        max_error = max(self._errors) if self._errors else 0
+        return bw / (1 + max_error)
+
+    def combinations(self, num_qualities: int, horizon: int) -> np.ndarray:
+        key = (num_qualities, horizon)
+        table = self._combinations.get(key)
+        if table is None:
+            table = self._combinations[key] = combinations(num_qualities, horizon)
+        return table
+
+    def static_scores(self, bitrates: Tuple[int, ...], horizon: int, last_quality: int) -> np.ndarray:
+        key = (bitrates, horizon, last_quality)
+        scores = self._static_scores.get(key)
+        if scores is None:
+            rates = np.asarray(bitrates, dtype=np.float64)[self.combinations(len(bitrates), horizon)] / 1e6
+            previous = np.empty_like(rates)
+            previous[:, 0] = bitrates[last_quality] / 1e6
+            previous[:, 1:] = rates[:, :-1]
+            scores = rates.sum(axis=1) - self.smooth_penalty * np.abs(rates - previous).sum(axis=1)
+            self._static_scores[key] = scores
+        return scores
+
+    def rebuffering(self, download_times: np.ndarray, horizon: int, buffer_level: float, segment_duration: float):
+        """
+        Simulate the buffer over the tree of sequence prefixes
+
+        Returns
+        -------
+        rebuffering: np.ndarray
+            The rebuffering time of every combination, in the order of the combination table
+        """
+        buffer = np.array([buffer_level])
+        rebuffer = np.zeros(1)
+        for step in range(horizon):
+            remaining = (buffer[:, None] - download_times[None, :]).ravel()
+            rebuffer = np.repeat(rebuffer, len(download_times)) - np.minimum(remaining, 0)
+            if step < horizon - 1:
+                buffer = np.maximum(remaining, 0) + segment_duration
+        return rebuffer
+
+    def choose_quality(
+        self, bitrates: Tuple[int, ...], last_quality: int, horizon: int, bw: float, buffer_level: float, segment_duration: float
+    ) -> int:
+        if len(bitrates) == 1:
+            return 0
+        download_times = np.asarray(bitrates, dtype=np.float64) * segment_duration / max(bw, 1)
+        rebuffer_penalty = self.rebuffer_penalty if self.rebuffer_penalty is not None else bitrates[-1] / 1e6
+        scores = self.static_scores(bitrates, horizon, last_quality) - rebuffer_penalty * self.rebuffering(
+            download_times, horizon, buffer_level, segment_duration
+        )
+        best = int(np.argmax(scores))
+        return best // len(bitrates) ** (horizon - 1)
+
+    def update_selection(self, adaptation_sets: Dict[int, AdaptationSet], index: int) -> Dict[int, int]:
+        assert self.mpd_provider.mpd is not None, "MPD File not downloaded"
+        segment_duration = self.mpd_provider.mpd.max_segment_duration
+        buffer_level = self.buffer_manager.buffer_level
+        available_bandwidth = self.predict_bandwidth()
+
+        num_videos = sum(1 for adaptation_set in adaptation_sets.values() if adaptation_set.content_type == "video")
+        num_audios = len(adaptation_sets) - num_videos
+
+        selections = {}
+        for adaptation_set in adaptation_sets.values():
+            if num_videos == 0 or num_audios == 0:
+                bw = available_bandwidth / len(adaptation_sets)
+            elif adaptation_set.content_type == "video":
+                bw = available_bandwidth * 0.8 / num_videos
+            else:
+                bw = available_bandwidth * 0.2 / num_audios
+
+            representations = adaptation_set.representation_index
+            bitrates = tuple(representations.bitrates)
+            last_id = self._last_selections.get(adaptation_set.id)
+            last_quality = representations.rank(last_id) if last_id in adaptation_set.representations else 0
+
+            horizon = self.horizon
+            if adaptation_set.last_segment_num is not None:
+                horizon = max(min(horizon, adaptation_set.last_segment_num - index + 1), 1)
+
+            quality = self.choose_quality(bitrates, last_quality, horizon, bw, buffer_level, segment_duration)
+            selections[adaptation_set.id] = representations.representations[quality].id
+
+        self._last_selections = selections
+        self.log.info(f"Final selection at {available_bandwidth} and buffer level {buffer_level} is {selections}")
+        return selections
@@ -0,0 +1,240 @@
+import heapq
+import logging
+import math
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.abr import ABRController
+from istream_player.core.bw_meter import BandwidthMeter
+from istream_player.core.module import Module, ModuleOption
+from istream_player.core.mpd_provider import MPDProvider
+from istream_player.models.mpd_objects import AdaptationSet, RepresentationIndex
+
+SRD_SCHEME = "urn:mpeg:dash:srd:2014"
+
+
+class Tile(NamedTuple):
+    """
+    The area of an equirectangular picture covered by an adaptation set, in degrees
+    """
+
+    # Yaw of the center, from -180 to 180
+    yaw: float
+
+    # Pitch of the center, from -90 (bottom) to 90 (top)
+    pitch: float
+
+    width: float
+    height: float
+
+    @staticmethod
+    def from_srd(value: str) -> "Tile":
+        """
+        Parse the value of a spatial relationship description:
+        "source_id, object_x, object_y, object_width, object_height, total_width, total_height"
+        """
+        fields = [int(field) for field in value.split(",")]
+        if len(fields) < 7:
+            raise ValueError(f"SRD without the total size is not supported: {value}")
+        _, x, y, width, height, total_width, total_height = fields[:7]
+        return Tile(
+            yaw=(x + width / 2) / total_width * 360 - 180,
+            pitch=90 - (y + height / 2) / total_height * 180,
+            width=width / total_width * 360,
+            height=height / total_height * 180,
+        )
+
+
+class ViewportTrace(object):
+    """
+    The viewing direction over time, read from a text file. Every line is "time yaw pitch", in seconds and degrees,
+    separated by spaces or commas. Empty lines and lines starting with # are ignored.
+    """
+
+    def __init__(self, samples: List[Tuple[float, float, float]]):
+        samples = sorted(samples)
+        assert len(samples) > 0, "Empty viewport trace"
+        self.times = [sample[0] for sample in samples]
+        self.directions = [(sample[1], sample[2]) for sample in samples]
+
+    @staticmethod
+    def load(path: str) -> "ViewportTrace":
+        samples = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                time, yaw, pitch = (float(field) for field in line.replace(",", " ").split()[:3])
+                samples.append((time, yaw, pitch))
+        return ViewportTrace(samples)
+
+    def direction_at(self, time: float) -> Tuple[float, float]:
+        """
+        Returns
+        -------
+        direction: Tuple[float, float]
+            The yaw and pitch of the last sample at or before the time, or of the first sample
+        """
+        return self.directions[max(bisect_right(self.times, time) - 1, 0)]
+
+
+class UpgradePath(object):
+    """
+    The upgrades of one tile worth considering, for a utility proportional to log(bitrate / lowest bitrate).
+
+    Only the ranks on the upper concave hull of (bitrate, utility) are kept, so the utility per bit of the
+    successive upgrades is decreasing, and a greedy allocation over all the tiles takes them in order.
+    """
+
+    __slots__ = ("index", "ranks", "costs", "gains")
+
+    def __init__(self, index: RepresentationIndex):
+        self.index = index
+        bitrates = index.bitrates
+        utilities = [math.log(bitrate / bitrates[0]) for bitrate in bitrates]
+
+        hull: List[int] = [0]
+        for rank in range(1, len(bitrates)):
+            if bitrates[rank] == bitrates[hull[-1]]:
+                continue
+            while len(hull) >= 2 and (utilities[rank] - utilities[hull[-2]]) * (bitrates[hull[-1]] - bitrates[hull[-2]]) >= (
+                utilities[hull[-1]] - utilities[hull[-2]]
+            ) * (bitrates[rank] - bitrates[hull[-2]]):
+                hull.pop()
+            hull.append(rank)
+
+        self.ranks = hull
+        # Extra bitrate and utility of the upgrade from ranks[i] to ranks[i + 1]
+        self.costs = [bitrates[high] - bitrates[low] for low, high in zip(hull, hull[1:])]
+        self.gains = [utilities[high] - utilities[low] for low, high in zip(hull, hull[1:])]
+
+
+def allocate(paths: List[UpgradePath], weights: List[float], budget: float) -> List[int]:
+    """
+    Choose one representation per tile, maximizing the sum of weight * log(bitrate / lowest bitrate) with the sum of
+    the bitrates within the budget. This is a multiple-choice knapsack, solved greedily: every tile starts at its
+    lowest bitrate, then the upgrade with the most utility per bit that still fits is applied, till none fits.
+
+    Returns
+    -------
+    ranks: List[int]
+        The rank of the chosen representation of every tile
+    """
+    steps = [0] * len(paths)
+    remaining = budget - sum(path.index.bitrates[0] for path in paths)
+
+    heap: List[Tuple[float, int]] = [
+        (-weight * path.gains[0] / path.costs[0], tile) for tile, (path, weight) in enumerate(zip(paths, weights)) if path.costs
+    ]
+    heapq.heapify(heap)
+    while heap and remaining > 0:
+        _, tile = heapq.heappop(heap)
+        path, step = paths[tile], steps[tile]
+        if path.costs[step] > remaining:
+            # The next upgrades of this tile cost even more
+            continue
+        remaining -= path.costs[step]
+        step = steps[tile] = step + 1
+        if step < len(path.costs):
+            heapq.heappush(heap, (-weights[tile] * path.gains[step] / path.costs[step], tile))
+
+    return [path.ranks[step] for path, step in zip(paths, steps)]
+
+
+@ModuleOption("viewport", requires=[BandwidthMeter, MPDProvider])
+class ViewportABRController(Module, ABRController):
+    """
+    Tile-based ABR for 360 videos.
+
+    The adaptation sets with a spatial relationship description are tiles of an equirectangular picture. For every
+    segment index the tiles are put in priority classes by the distance to the viewing direction from the viewport
+    trace: in the field of view, within `margin` degrees of it, or outside. The bandwidth is then allocated over all
+    the tiles at once, with the utility of a tile weighted by its class, so the bits go where the viewer is looking.
+    Adaptation sets without a spatial relationship description, like audio, are always in the first class.
+    """
+
+    log = logging.getLogger("ViewportABRController")
+
+    def __init__(self, *, trace=None, fov="100x90", margin="30", weights="16,4,1", safety_factor="0.9"):
+        """
+        Parameters
+        ----------
+        trace:
+            The viewport trace file. Without it the viewer looks at yaw 0 and pitch 0.
+        fov:
+            The field of view in degrees, horizontal x vertical
+        margin:
+            The extent in degrees around the field of view of the second priority class
+        weights:
+            The utility weights of the priority classes, comma separated
+        safety_factor:
+            The fraction of the bandwidth estimate allocated to the tiles
+        """
+        self.trace = ViewportTrace.load(trace) if trace is not None else ViewportTrace([(0, 0, 0)])
+        fov_yaw, fov_pitch = fov.split("x")
+        self.fov_yaw = float(fov_yaw)
+        self.fov_pitch = float(fov_pitch)
+        self.margin = float(margin)
+        self.weights = [float(weight) for weight in weights.split(",")]
+        assert len(self.weights) == 3, "Expected weights for 3 priority classes"
+        self.safety_factor = float(safety_factor)
+
+        self._tiles: Dict[int, Optional[Tile]] = {}
+        self._paths: Dict[int, UpgradePath] = {}
+
+    async def setup(self, config: PlayerConfig, bandwidth_meter: BandwidthMeter, mpd_provider: MPDProvider, **kwargs):
+        self.bandwidth_meter = bandwidth_meter
+        self.mpd_provider = mpd_provider
+
+    def tile(self, adaptation_set: AdaptationSet) -> Optional[Tile]:
+        if adaptation_set.id not in self._tiles:
+            srd = adaptation_set.supplemental_properties.get(SRD_SCHEME)
+            self._tiles[adaptation_set.id] = Tile.from_srd(srd) if srd is not None else None
+        return self._tiles[adaptation_set.id]
+
+    def upgrade_path(self, adaptation_set: AdaptationSet) -> UpgradePath:
+        index = adaptation_set.representation_index
+        path = self._paths.get(adaptation_set.id)
+        if path is None or path.index is not index:
+            path = self._paths[adaptation_set.id] = UpgradePath(index)
+        return path
+
+    def priority_class(self, tile: Optional[Tile], yaw: float, pitch: float) -> int:
+        """
+        Returns
+        -------
+        priority: int
+            0 if the tile overlaps the field of view, 1 if it overlaps the margin around it, else 2
+        """
+        if tile is None:
+            return 0
+        yaw_distance = abs((tile.yaw - yaw + 180) % 360 - 180) - tile.width / 2
+        pitch_distance = abs(tile.pitch - pitch) - tile.height / 2
+        if yaw_distance < self.fov_yaw / 2 and pitch_distance < self.fov_pitch / 2:
+            return 0
+        if yaw_distance < self.fov_yaw / 2 + self.margin and pitch_distance < self.fov_pitch / 2 + self.margin:
+            return 1
+        return 2
+
+    def segment_time(self, adaptation_sets: Dict[int, AdaptationSet], index: int) -> float:
+        for adaptation_set in adaptation_sets.values():
+            segment = adaptation_set.representation_index.lowest.segments.get(index)
+            if segment is not None:
+                return segment.start_time
+        assert self.mpd_provider.mpd is not None, "MPD File not downloaded"
+        return index * self.mpd_provider.mpd.max_segment_duration
+
+    def update_selection(self, adaptation_sets: Dict[int, AdaptationSet], index: int) -> Dict[int, int]:
+        yaw, pitch = self.trace.direction_at(self.segment_time(adaptation_sets, index))
+        budget = self.bandwidth_meter.bandwidth * self.safety_factor
+
+        ids = list(adaptation_sets.keys())
+        paths = [self.upgrade_path(adaptation_sets[as_id]) for as_id in ids]
+        classes = [self.priority_class(self.tile(adaptation_sets[as_id]), yaw, pitch) for as_id in ids]
+        ranks = allocate(paths, [self.weights[priority] for priority in classes], budget)
+
+        selections = {as_id: path.index.representations[rank].id for as_id, path, rank in zip(ids, paths, ranks)}
+        self.log.info(f"Final selection at {budget} looking at ({yaw}, {pitch}) is {selections}")
+        return selections
@@ -8,7 +8,7 @@ from pathlib import Path
 import sys
 from os.path import join
 import traceback
-from typing import Any, Dict, List, Optional, TextIO, Tuple
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
 from matplotlib.patches import Rectangle
 
 import matplotlib.pyplot as plt
@@ -46,6 +46,9 @@ class AnalyzerSegment:
     received_bytes: Optional[int] = None
     stopped_bytes: Optional[int] = None
 
+    # Seconds the link was idle before the first byte of this segment index arrived
+    idle_gap: Optional[float] = None
+
     @property
     def stop_ratio(self) -> Optional[float]:
         if self.total_bytes is not None and self.stopped_bytes is not None:
@@ -88,6 +91,7 @@ class PlaybackAnalyzer(
         self._segments_by_url: Dict[str, AnalyzerSegment] = {}
         self._position = 0
         self._stalls: List[Stall] = []
+        self._link_busy_until: Optional[float] = None
 
         self.plots_dir = plots_dir
 
@@ -166,6 +170,7 @@ class PlaybackAnalyzer(
             )
 
     async def on_segment_download_complete(self, index: int, segments: Dict[int, Segment], stats: Dict[int, DownloadStats]):
+        idle_gap = self._idle_gap(stats.values())
         for segment, stat in zip(segments.values(), stats.values()):
             assert stat.stop_time is not None and stat.start_time is not None
             analyzer_segment = self._segments_by_url[segment.url]
@@ -180,10 +185,30 @@ class PlaybackAnalyzer(
             analyzer_segment.stopped_bytes = stat.stopped_bytes
 
             analyzer_segment.segment_throughput = (stat.received_bytes * 8) / (stat.stop_time - stat.start_time)
+            analyzer_segment.idle_gap = idle_gap
+
+    def _idle_gap(self, stats: Iterable[DownloadStats]) -> Optional[float]:
+        """
+        Seconds between the last byte received for previous segment indices and the first byte of this one.
+        For the first index it is the time to first byte. Overlapping transfers give 0.
+        """
+        first_byte_at = min((stat.first_byte_at for stat in stats if stat.first_byte_at is not None), default=None)
+        last_byte_at = max((stat.last_byte_at for stat in stats if stat.last_byte_at is not None), default=None)
+        if first_byte_at is None or last_byte_at is None:
+            return None
+        if self._link_busy_until is None:
+            idle_since = min(stat.start_time for stat in stats if stat.start_time is not None)
+        else:
+            idle_since = self._link_busy_until
+        self._link_busy_until = max(last_byte_at, self._link_busy_until or last_byte_at)
+        return max(0.0, first_byte_at - idle_since)
 
     async def on_bandwidth_update(self, bw: int) -> None:
         self._throughputs.append((self._seconds_since(self._start_time), bw))
 
+    async def on_continuous_bw_update(self, bw: int) -> None:
+        self._cont_bw.append((self._seconds_since(self._start_time), bw))
+
     def save(self, output: io.TextIOBase | TextIO) -> None:
         if self._mpd_provider.mpd is None:
             self.log.error("MPD not found. Aborting analysis")
@@ -254,6 +279,10 @@ class PlaybackAnalyzer(
         # Number of quality switches
         output.write(f"Number of quality switches: {quality_switches}\n")
 
+        # Link idle time between segment indices
+        total_idle_gap = sum(self._idle_gaps().values())
+        output.write(f"Total link idle seconds: {total_idle_gap:.3f}\n")
+
         if self.plots_dir is not None:
             self.save_plots()
 
@@ -267,6 +296,12 @@ class PlaybackAnalyzer(
             self._cont_bw,
         )
 
+    def _idle_gaps(self) -> Dict[int, float]:
+        """Idle gap per segment index"""
+        return {
+            segment.index: segment.idle_gap for segment in self._segments_by_url.values() if segment.idle_gap is not None
+        }
+
     def dump_results(
         self,
         segments: Dict[str, AnalyzerSegment],
@@ -287,6 +322,7 @@ class PlaybackAnalyzer(
             "states": [{"time": time, "state": str(state), "position": pos} for time, state, pos in states],
             "bandwidth_estimate": [{"time": bw[0], "bandwidth": bw[1]} for bw in cont_bw],
             "buffer_level": list(map(asdict, self._buffer_levels)),
+            "idle_gaps": [{"index": index, "idle_gap": gap} for index, gap in sorted(self._idle_gaps().items())],
         }
 
         if self.dump_results_path is not None:
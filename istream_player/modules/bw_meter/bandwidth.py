@@ -1,10 +1,11 @@
 import logging
 import time
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
 
 from istream_player.config.config import PlayerConfig
 from istream_player.core.bw_meter import BandwidthMeter, DownloadStats
-from istream_player.core.downloader import DownloadEventListener, DownloadManager
+from istream_player.core.downloader import ChunkEvent, DownloadEventListener, DownloadManager
 from istream_player.core.module import Module, ModuleOption
 from istream_player.core.scheduler import Scheduler, SchedulerEventListener
 from istream_player.models.mpd_objects import Segment
@@ -12,18 +13,51 @@ from istream_player.models.mpd_objects import Segment
 
 @ModuleOption("bw_meter", default=True, requires=["segment_downloader", Scheduler])
 class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener, SchedulerEventListener):
+    """
+    Estimates the bandwidth once every segment index is downloaded.
+
+    The throughput is the number of bytes received divided by the time the link was busy, i.e. the union of the
+    intervals in which at least one transfer was active. So concurrent transfers are neither double counted nor
+    leave the idle time between segments in the measurement.
+
+    Download stats are kept per URL. They are active from the start of the transfer till it ends, then kept till the
+    scheduler consumes them with the completed segment index, and are then retained for the last `retained_stats`
+    URLs so they can still be looked up.
+
+    Received chunks are delivered in batches, every `batch_interval_ms`, with the time each chunk was received.
+    """
+
     log = logging.getLogger("BandwidthMeterImpl")
 
-    def __init__(self):
+    def __init__(self, *, retained_stats="256", batch_interval_ms="10"):
+        """
+        Parameters
+        ----------
+        retained_stats:
+            The number of consumed download stats still available from get_stats
+        batch_interval_ms:
+            The interval over which received chunks are batched, in milliseconds. 0 to receive them one by one.
+        """
         super().__init__()
+        self.retained_stats = int(retained_stats)
+        self.batch_interval = float(batch_interval_ms) / 1000
+
+        # Stats of the transfers that are active or not yet consumed
         self.stats: Dict[str, DownloadStats] = {}
+        # Stats of consumed transfers, least recently consumed first
+        self._retired_stats: OrderedDict[str, DownloadStats] = OrderedDict()
+        self._active_urls: Set[str] = set()
+
+        # Bytes received and link busy time since the last estimate
         self.total_bytes = 0
-        self.start_time = 0
+        self._busy_time = 0.0
+        # Start of the current busy period. None if no transfer is active.
+        self._busy_since: Optional[float] = None
 
     async def setup(self, config: PlayerConfig, segment_downloader: DownloadManager, scheduler: Scheduler):
         self._bw = config.static.max_initial_bitrate
         self.smooth_factor = config.static.smoothing_factor
-        segment_downloader.add_listener(self)
+        segment_downloader.add_listener(self, batch_interval=self.batch_interval if self.batch_interval > 0 else None)
         scheduler.add_listener(self)
 
     @property
@@ -31,9 +65,20 @@ class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener, Schedule
         return self._bw
 
     async def on_transfer_start(self, url) -> None:
-        if self.start_time == 0:
-            self.start_time = time.time()
-        self.stats[url] = DownloadStats(start_time=time.time())
+        now = time.time()
+        self.stats[url] = DownloadStats(start_time=now)
+        self._retired_stats.pop(url, None)
+        if not self._active_urls:
+            self._busy_since = now
+        self._active_urls.add(url)
+
+    def _transfer_finished(self, url: str, now: float):
+        if url not in self._active_urls:
+            return
+        self._active_urls.remove(url)
+        if not self._active_urls and self._busy_since is not None:
+            self._busy_time += now - self._busy_since
+            self._busy_since = None
 
     async def on_transfer_end(self, size: int, url: str) -> None:
         stats = self.stats.get(url)
@@ -42,8 +87,9 @@ class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener, Schedule
         stats.stop_time = time.time()
         if stats.stopped_bytes is not None:
             stats.stopped_bytes = size
+        self._transfer_finished(url, stats.stop_time)
 
-    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes) -> None:
+    def _bytes_received(self, length: int, url: str, size: int, time_at: float):
         stats = self.stats.get(url)
         if stats is None:
             return
@@ -51,10 +97,15 @@ class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener, Schedule
         stats.received_bytes += length
         stats.total_bytes = size
         if stats.first_byte_at is None:
-            stats.first_byte_at = time.time()
-            stats.last_byte_at = stats.first_byte_at
-        else:
-            stats.last_byte_at = time.time()
+            stats.first_byte_at = time_at
+        stats.last_byte_at = time_at
+
+    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes) -> None:
+        self._bytes_received(length, url, size, time.time())
+
+    async def on_bytes_transferred_batch(self, events: List[ChunkEvent]) -> None:
+        for event in events:
+            self._bytes_received(event.length, event.url, event.size, event.time)
 
     async def on_transfer_canceled(self, url: str, position: int, size: int) -> None:
         stats = self.stats.get(url)
@@ -62,17 +113,62 @@ class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener, Schedule
             return
         stats.stopped_bytes = stats.received_bytes
         stats.stop_time = time.time()
+        self._transfer_finished(url, stats.stop_time)
 
     def get_stats(self, url: str) -> DownloadStats:
-        return self.stats[url]
+        stats = self.stats.get(url)
+        if stats is not None:
+            return stats
+        return self._retired_stats[url]
+
+    def _retire_stats(self, url: str):
+        stats = self.stats.pop(url, None)
+        if stats is None:
+            return
+        self._retired_stats[url] = stats
+        self._retired_stats.move_to_end(url)
+        while len(self._retired_stats) > self.retained_stats:
+            self._retired_stats.popitem(last=False)
+
+    def _busy_time_since_last_estimate(self, now: float) -> float:
+        busy_time = self._busy_time
+        if self._busy_since is not None:
+            busy_time += now - self._busy_since
+        return busy_time
+
+    def estimate(self, throughput: float, download_time: float) -> float:
+        """
+        Update the bandwidth estimate with the throughput measured over the last segment index.
+        Subclasses override it to use other estimators.
+
+        Parameters
+        ----------
+        throughput: float
+            The measured throughput in bps
+        download_time: float
+            The time over which the throughput was measured, in seconds
+
+        Returns
+        -------
+        bw: float
+            The new bandwidth estimate in bps
+        """
+        return self._bw * self.smooth_factor + throughput * (1 - self.smooth_factor)
 
     async def on_segment_download_complete(self, index: int, segments: Dict[int, Segment], stats: Dict[int, DownloadStats]):
-        curr_bw = 8 * self.total_bytes / (time.time() - self.start_time)
-        self._bw = self._bw * self.smooth_factor + curr_bw * (1 - self.smooth_factor)
+        now = time.time()
+        download_time = self._busy_time_since_last_estimate(now)
+        if download_time > 0:
+            curr_bw = 8 * self.total_bytes / download_time
+            self._bw = self.estimate(curr_bw, download_time)
         for listener in self.listeners:
             await listener.on_bandwidth_update(self._bw)
 
-        # Clear last segments
-        self.stats.clear()
+        # Start measuring the next estimate. Transfers still active continue the busy period from now.
         self.total_bytes = 0
-        self.start_time = 0
+        self._busy_time = 0.0
+        if self._busy_since is not None:
+            self._busy_since = now
+
+        for segment in segments.values():
+            self._retire_stats(segment.url)
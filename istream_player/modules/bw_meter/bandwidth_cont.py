@@ -1,113 +1,147 @@
 import logging
-import operator
 import time
+from typing import List, Optional
 
 from istream_player.config.config import PlayerConfig
-from istream_player.core.bw_meter import (BandwidthMeter,
-                                          BandwidthUpdateListener)
-from istream_player.core.downloader import (DownloadEventListener,
-                                            DownloadManager)
-from istream_player.core.module import Module, ModuleOption
-
-
-@ModuleOption("bw_cont", requires=["segment_downloader"])
-class BandwidthMeterImpl(Module, BandwidthMeter, DownloadEventListener):
-    log = logging.getLogger("BandwidthMeterImpl")
-
-    def __init__(self):
-        super().__init__()
-
-        self.last_byte_at = 0
-        self.bytes_transferred = 0
-        self.transmission_start_time = None
-        self.transmission_end_time = None
-        self.extra_stats = {}
-        self.first_byte_in_segment = True
-        self._cont_bw = []
-        self.last_cont_bw = None
-        self.downloading_url = None
-
-    async def setup(self, config: PlayerConfig, segment_downloader: DownloadManager, **kwargs):
-        self._bw = config.static.max_initial_bitrate
-        self.smooth_factor = config.static.smoothing_factor
-        self.max_packet_delay = config.static.max_packet_delay
-        self.cont_bw_window = config.static.cont_bw_window
-
-        segment_downloader.add_listener(self)
+from istream_player.core.downloader import ChunkEvent, DownloadManager
+from istream_player.core.module import ModuleOption
+from istream_player.core.scheduler import Scheduler
+from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+
+
+class ThroughputWindow(object):
+    """
+    Sliding time window of throughput samples, stored in a fixed-capacity ring buffer.
+
+    A sample is the number of bytes received between two instants. The sums of the bytes and of the durations of
+    the samples in the window are kept up to date, so adding a sample and reading the throughput are O(1).
+    """
+
+    def __init__(self, duration: float, capacity: int, min_samples: int = 2):
+        """
+        Parameters
+        ----------
+        duration: float
+            Samples that ended more than `duration` seconds before the latest one are evicted
+        capacity: int
+            The maximum number of samples. When it is full the oldest sample is overwritten, so on very bursty
+            links the window can be shorter than `duration`.
+        min_samples: int
+            The throughput is only available with at least this number of samples. They are kept even if they are
+            older than `duration`.
+        """
+        assert capacity >= min_samples >= 1
+        self.duration = duration
+        self.capacity = capacity
+        self.min_samples = min_samples
+
+        self._starts: List[float] = [0.0] * capacity
+        self._ends: List[float] = [0.0] * capacity
+        self._bytes: List[int] = [0] * capacity
+        # Position of the oldest sample
+        self._head = 0
+        self._count = 0
+
+        self._total_bytes = 0
+        self._total_time = 0.0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, start: float, end: float, num_bytes: int):
+        """
+        Add a sample of `num_bytes` bytes received from `start` to `end`, and evict the samples out of the window
+        """
+        if self._count == self.capacity:
+            self._pop()
+        position = (self._head + self._count) % self.capacity
+        self._starts[position] = start
+        self._ends[position] = end
+        self._bytes[position] = num_bytes
+        self._count += 1
+        self._total_bytes += num_bytes
+        self._total_time += end - start
+
+        window_start = end - self.duration
+        while self._count > self.min_samples and self._ends[self._head] < window_start:
+            self._pop()
+
+    def _pop(self):
+        self._total_bytes -= self._bytes[self._head]
+        self._total_time -= self._ends[self._head] - self._starts[self._head]
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        if self._count == 0:
+            # Do not carry rounding errors over
+            self._total_time = 0.0
 
-    async def on_transfer_start(self, url) -> None:
-        self.transmission_start_time = time.time()
-        self.bytes_transferred = 0
-        self.first_byte_in_segment = True
-        self.downloading_url = url
-        self.log.info("Transmission starts. URL: " + url)
+    @property
+    def throughput(self) -> Optional[float]:
+        """
+        Returns
+        -------
+        throughput: Optional[float]
+            The mean throughput over the window in bps. None if there are not enough samples.
+        """
+        if self._count < self.min_samples or self._total_time <= 0:
+            return None
+        return 8 * self._total_bytes / self._total_time
+
+
+@ModuleOption("bw_cont", requires=["segment_downloader", Scheduler])
+class ContinuousBandwidthMeterImpl(BandwidthMeterImpl):
+    """
+    Bandwidth meter that also estimates the throughput continuously, over a sliding window of the received chunks.
+    The continuous estimate is delivered to `BandwidthUpdateListener.on_continuous_bw_update` once per batch of
+    chunks, or on every chunk if batching is disabled.
+    """
+
+    log = logging.getLogger("ContinuousBandwidthMeterImpl")
+
+    def __init__(self, *, window_capacity="4096", **kwargs):
+        """
+        Parameters
+        ----------
+        window_capacity:
+            The maximum number of chunks in the sliding window
+        """
+        super().__init__(**kwargs)
+        self.window_capacity = int(window_capacity)
+        self.last_byte_at: Optional[float] = None
+        self.last_cont_bw: Optional[int] = None
+
+    async def setup(self, config: PlayerConfig, segment_downloader: DownloadManager, scheduler: Scheduler):
+        await super().setup(config, segment_downloader, scheduler)
+        self.window = ThroughputWindow(config.static.cont_bw_window, self.window_capacity)
 
-    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content) -> None:
-        # if url == self.downloading_url:
-        self.bytes_transferred += length
-        t = time.time()
-        await self.update_cont_bw(length, t)
+    async def on_transfer_start(self, url) -> None:
+        await super().on_transfer_start(url)
+        # The gap before the first byte of a transfer is not transfer time
+        self.last_byte_at = None
 
-    async def on_transfer_end(self, size: int, url: str) -> None:
-        self.transmission_end_time = time.time()
-        self.update_bandwidth()
-        self.bytes_transferred = 0
+    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes) -> None:
+        await super().on_bytes_transferred(length, url, position, size, content)
+        await self.update_cont_bw(length, time.time())
 
-        for listener in self.listeners:
-            await listener.on_bandwidth_update(self._bw)
+    async def on_bytes_transferred_batch(self, events: List[ChunkEvent]) -> None:
+        await super().on_bytes_transferred_batch(events)
+        for event in events:
+            self._add_cont_sample(event.length, event.time)
+        await self._notify_cont_bw()
 
-    # async def on_transfer_canceled(self, url: str, position: int, size: int) -> None:
-    #     return await self.on_transfer_end(position, url)
+    async def update_cont_bw(self, bytes_transferred: int, time_at: float):
+        self._add_cont_sample(bytes_transferred, time_at)
+        await self._notify_cont_bw()
 
-    @property
-    def bandwidth(self) -> float:
-        return self._bw
+    def _add_cont_sample(self, bytes_transferred: int, time_at: float):
+        if self.last_byte_at is not None:
+            self.window.add(self.last_byte_at, time_at, bytes_transferred)
+        self.last_byte_at = time_at
 
-    async def update_cont_bw(self, bytes_transferred: int, time_at: float):
-        min_values = 2
-        if self.first_byte_in_segment:
-            self.first_byte_in_segment = False
-        else:
-            # est_bw = 8*bytes_transferred/(time_at - self.last_byte_at)
-            # if est_bw < 10000000000:
-            # if self.max_packet_delay > (time_at - self.last_byte_at) > 0.001:
-            if True:
-                self._cont_bw.append((self.last_byte_at, time_at, bytes_transferred))
-                if len(self._cont_bw) >= min_values:
-                    window_start = time_at - self.cont_bw_window
-                    window_values = []
-                    for bw in self._cont_bw[::-1]:
-                        if bw[1] < window_start and len(window_values) >= min_values:
-                            break
-                        window_values.append(bw)
-                    # window = self._cont_bw[max(0, len(self._cont_bw)-self.rolling_mean_window):]
-                    total_bytes = sum(list(map(operator.itemgetter(2), window_values)))
-                    total_time = sum(list(map(lambda bw: (bw[1] - bw[0]), window_values)))
-                    window_mean = int(8 * total_bytes / total_time)
-                    self.last_cont_bw = window_mean
+    async def _notify_cont_bw(self):
+        throughput = self.window.throughput
+        if throughput is not None:
+            self.last_cont_bw = round(throughput)
         if self.last_cont_bw is not None:
             for listener in self.listeners:
                 await listener.on_continuous_bw_update(self.last_cont_bw)
-        self.last_byte_at = time_at
-
-    def update_bandwidth(self):
-        assert self.transmission_end_time is not None and self.transmission_start_time is not None
-        self._bw = self._bw * self.smooth_factor + (8 * self.bytes_transferred) / (
-            self.transmission_end_time - self.transmission_start_time
-        ) * (1 - self.smooth_factor)
-        # print(f"Bandwith updated : {self._bw}")
-        # if self.last_cont_bw is not None:
-        #     self._bw = (self._bw + self.last_cont_bw)/2
-        # self._bw = self.last_cont_bw
-        self.extra_stats = {
-            "_bw": self._bw,
-            "smooth_factor": self.smooth_factor,
-            "bytes_transferred": self.bytes_transferred,
-            "transmission_end_time": self.transmission_end_time,
-            "transmission_start_time": self.transmission_start_time,
-        }
-        # self.log.info(f"************* Updated stats : {self.extra_stats}")
-
-    def add_listener(self, listener: BandwidthUpdateListener):
-        if listener not in self.listeners:
-            self.listeners.append(listener)
@@ -0,0 +1,51 @@
+import logging
+
+from istream_player.core.module import ModuleOption
+from istream_player.core.scheduler import Scheduler
+from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+
+
+@ModuleOption("bw_ewma", requires=["segment_downloader", Scheduler])
+class EWMABandwidthMeterImpl(BandwidthMeterImpl):
+    """
+    Dual-rate EWMA bandwidth estimator, as in the throughput rule of dash.js.
+
+    A fast and a slow exponentially weighted moving average are kept, where every sample is weighted by its download
+    time and the half-lives are in seconds of download time. The estimate is the smaller one of the two, so a drop of
+    the throughput is followed quickly while a single fast segment is not trusted.
+    Both averages start from zero and are corrected for that bias, so the first samples are not underestimated.
+    """
+
+    log = logging.getLogger("EWMABandwidthMeterImpl")
+
+    def __init__(self, *, fast_half_life="3", slow_half_life="8", **kwargs):
+        """
+        Parameters
+        ----------
+        fast_half_life:
+            Half-life of the fast average in seconds
+        slow_half_life:
+            Half-life of the slow average in seconds
+        """
+        super().__init__(**kwargs)
+        self.fast_half_life = float(fast_half_life)
+        self.slow_half_life = float(slow_half_life)
+        assert self.fast_half_life > 0 and self.slow_half_life > 0, "Half-lives should be positive"
+
+        self._fast = 0.0
+        self._slow = 0.0
+        self._total_weight = 0.0
+
+    def estimate(self, throughput: float, download_time: float) -> float:
+        if download_time <= 0:
+            return self._bw
+        fast_alpha = 0.5 ** (download_time / self.fast_half_life)
+        slow_alpha = 0.5 ** (download_time / self.slow_half_life)
+        self._fast = fast_alpha * self._fast + (1 - fast_alpha) * throughput
+        self._slow = slow_alpha * self._slow + (1 - slow_alpha) * throughput
+        self._total_weight += download_time
+
+        # Zero-bias correction
+        fast = self._fast / (1 - 0.5 ** (self._total_weight / self.fast_half_life))
+        slow = self._slow / (1 - 0.5 ** (self._total_weight / self.slow_half_life))
+        return min(fast, slow)
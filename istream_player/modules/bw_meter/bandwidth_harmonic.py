@@ -0,0 +1,40 @@
+import logging
+from collections import deque
+from typing import Deque
+
+from istream_player.core.module import ModuleOption
+from istream_player.core.scheduler import Scheduler
+from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+
+
+@ModuleOption("bw_harmonic", requires=["segment_downloader", Scheduler])
+class HarmonicBandwidthMeterImpl(BandwidthMeterImpl):
+    """
+    Estimates the bandwidth as the harmonic mean of the throughputs of the last `window` segment indices.
+    A single very fast segment barely moves the harmonic mean, a slow one lowers it.
+    """
+
+    log = logging.getLogger("HarmonicBandwidthMeterImpl")
+
+    def __init__(self, *, window="5", **kwargs):
+        """
+        Parameters
+        ----------
+        window:
+            The number of last segment indices in the mean
+        """
+        super().__init__(**kwargs)
+        self.window = int(window)
+        assert self.window >= 1, "Window should hold at least one segment"
+        self._samples: Deque[float] = deque(maxlen=self.window)
+        # Sum of the inverse of the throughputs in the window
+        self._inverse_sum = 0.0
+
+    def estimate(self, throughput: float, download_time: float) -> float:
+        if throughput <= 0:
+            return self._bw
+        if len(self._samples) == self.window:
+            self._inverse_sum -= 1 / self._samples[0]
+        self._samples.append(throughput)
+        self._inverse_sum += 1 / throughput
+        return len(self._samples) / self._inverse_sum
@@ -0,0 +1,49 @@
+import logging
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, List
+
+from istream_player.core.module import ModuleOption
+from istream_player.core.scheduler import Scheduler
+from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+
+
+@ModuleOption("bw_percentile", requires=["segment_downloader", Scheduler])
+class PercentileBandwidthMeterImpl(BandwidthMeterImpl):
+    """
+    Estimates the bandwidth as a percentile of the throughputs of the last `window` segment indices.
+
+    The window is kept both in arrival order, to know which sample to evict, and sorted, so the percentile is read
+    by index. Outliers in either direction do not move the estimate.
+    """
+
+    log = logging.getLogger("PercentileBandwidthMeterImpl")
+
+    def __init__(self, *, window="10", percentile="50", **kwargs):
+        """
+        Parameters
+        ----------
+        window:
+            The number of last segment indices in the window
+        percentile:
+            The percentile of the window used as the estimate, between 0 and 100. Lower is more conservative.
+        """
+        super().__init__(**kwargs)
+        self.window = int(window)
+        self.percentile = float(percentile)
+        assert self.window >= 1, "Window should hold at least one segment"
+        assert 0 <= self.percentile <= 100, "Percentile should be between 0 and 100"
+
+        self._samples: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    def estimate(self, throughput: float, download_time: float) -> float:
+        if len(self._samples) == self.window:
+            oldest = self._samples.popleft()
+            del self._sorted[bisect_left(self._sorted, oldest)]
+        self._samples.append(throughput)
+        insort(self._sorted, throughput)
+
+        # Nearest-rank percentile
+        rank = round(self.percentile / 100 * (len(self._sorted) - 1))
+        return self._sorted[rank]
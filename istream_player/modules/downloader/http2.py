@@ -0,0 +1,418 @@
+import asyncio
+import logging
+import ssl
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import ConnectionTerminated, DataReceived, ResponseReceived, StreamEnded, StreamReset
+from h2.exceptions import ProtocolError, StreamClosedError
+from h2.settings import SettingCodes
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadManager, DownloadRequest, DownloadType
+from istream_player.core.module import Module, ModuleOption
+from istream_player.utils.chunked_buffer import ChunkedBuffer
+
+# Default stream weight of HTTP/2
+DEFAULT_WEIGHT = 16
+
+# Weight of the requests the playback waits for: MPD and initialization segments
+BLOCKING_WEIGHT = 256
+
+
+class OriginConnection(object):
+    """
+    One HTTP/2 connection to an origin, and its streams
+    """
+
+    __slots__ = ("origin", "conn", "reader", "writer", "task", "streams", "requests", "pending", "closing")
+
+    def __init__(
+        self, origin: Tuple[str, str, int], conn: H2Connection, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.origin = origin
+        self.conn = conn
+        self.reader = reader
+        self.writer = writer
+        self.task: Optional[asyncio.Task] = None
+        # URL of the open streams, by stream id
+        self.streams: Dict[int, str] = {}
+        # Request of every stream sent, by stream id
+        self.requests: Dict[int, DownloadRequest] = {}
+        # Requests waiting for the number of concurrent streams to go under the limit of the server
+        self.pending: Deque[DownloadRequest] = deque()
+        # Set when the server sent a GOAWAY frame, the connection is closed once its streams complete
+        self.closing = False
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and not self.writer.is_closing():
+            self.writer.write(data)
+
+
+@ModuleOption("h2")
+class H2ClientImpl(Module, DownloadManager):
+    """
+    HTTP/2 downloader. The requests to an origin are multiplexed over a single connection, as streams weighted by
+    adaptation set, so the segments of the adaptation sets that matter most get the bandwidth first, like over QUIC.
+    Stopping or dropping a request resets its stream without touching the others.
+    """
+
+    log = logging.getLogger("H2ClientImpl")
+
+    def __init__(self, *, weights=None, window="4194304", connection_window="16777216"):
+        """
+        Parameters
+        ----------
+        weights:
+            The stream weights of the segments by adaptation set id, from 1 to 256, like "0:256;1:32". The other
+            adaptation sets get the default weight of 16. The MPD and the initialization segments get 256.
+        window:
+            The initial flow control window of every stream, in bytes
+        connection_window:
+            The flow control window of the whole connection, in bytes
+        """
+        super().__init__()
+        self.weights: Dict[int, int] = {}
+        if weights is not None:
+            for weight in str(weights).split(";"):
+                as_id, value = weight.split(":")
+                self.weights[int(as_id)] = int(value)
+        assert all(1 <= weight <= 256 for weight in self.weights.values()), "Stream weights should be from 1 to 256"
+        self.window = int(window)
+        self.connection_window = int(connection_window)
+
+        self._connections: Dict[Tuple[str, str, int], OriginConnection] = {}
+        self._connect_lock = asyncio.Lock()
+        # Requests waiting for a new connection after a GOAWAY, by URL
+        self._resubmitted: Dict[str, DownloadRequest] = {}
+        # Connection and stream id of the requests in flight, by URL
+        self._url_streams: Dict[str, Tuple[OriginConnection, int]] = {}
+
+        self._completed_urls: Set[str] = set()
+        self._partially_accepted_urls: Set[str] = set()
+        self._cancelled_urls: Set[str] = set()
+
+        self._headers: Dict[str, Dict[str, str]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._content: Dict[str, ChunkedBuffer] = {}
+        self._waiting_urls: Dict[str, asyncio.Event] = {}
+
+    async def setup(self, config: PlayerConfig, **kwargs):
+        self.ssl_keylog_file = config.ssl_keylog_file
+
+    async def cleanup(self) -> None:
+        await self.close()
+
+    @property
+    def is_busy(self):
+        return len(self._url_streams) > 0 or len(self._resubmitted) > 0
+
+    def weight(self, request: DownloadRequest) -> int:
+        if request.req_type != DownloadType.SEGMENT:
+            return BLOCKING_WEIGHT
+        if request.as_id is None:
+            return DEFAULT_WEIGHT
+        return self.weights.get(request.as_id, DEFAULT_WEIGHT)
+
+    async def _connect(self, origin: Tuple[str, str, int]) -> OriginConnection:
+        scheme, host, port = origin
+        ssl_context = None
+        if scheme == "https":
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+            ssl_context.set_alpn_protocols(["h2"])
+            if self.ssl_keylog_file is not None:
+                ssl_context.keylog_filename = self.ssl_keylog_file
+        # Plain http is HTTP/2 with prior knowledge
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
+        if ssl_context is not None:
+            ssl_object = writer.get_extra_info("ssl_object")
+            if ssl_object is None or ssl_object.selected_alpn_protocol() != "h2":
+                writer.close()
+                raise Exception(f"The server at {host}:{port} does not support HTTP/2")
+
+        conn = H2Connection(config=H2Configuration(client_side=True, header_encoding="utf-8"))
+        conn.initiate_connection()
+        conn.update_settings({SettingCodes.INITIAL_WINDOW_SIZE: self.window, SettingCodes.ENABLE_PUSH: 0})
+        if self.connection_window > conn.inbound_flow_control_window:
+            conn.increment_flow_control_window(self.connection_window - conn.inbound_flow_control_window)
+
+        connection = OriginConnection(origin, conn, reader, writer)
+        connection.flush()
+        connection.task = asyncio.create_task(self._read_loop(connection), name=f"TASK_H2_READ_{host}:{port}")
+        self.log.info(f"Connected to {scheme}://{host}:{port}")
+        return connection
+
+    async def _connection(self, url: str) -> OriginConnection:
+        parsed = urlparse(url)
+        port = parsed.port if parsed.port is not None else (443 if parsed.scheme == "https" else 80)
+        origin = (parsed.scheme, parsed.hostname or "localhost", port)
+        async with self._connect_lock:
+            connection = self._connections.get(origin)
+            if connection is None or connection.writer.is_closing():
+                connection = self._connections[origin] = await self._connect(origin)
+        return connection
+
+    async def warm_up(self, url: str):
+        try:
+            await self._connection(url)
+        except Exception as e:
+            self.log.info(f"Cannot warm up the connection to {url}: {e}")
+
+    async def download(self, request: DownloadRequest, save: bool = False) -> Optional[bytes]:
+        url = request.url
+        # Forget the outcome of a previous request of the URL
+        self._completed_urls.discard(url)
+        self._partially_accepted_urls.discard(url)
+        self._cancelled_urls.discard(url)
+        self._waiting_urls[url] = asyncio.Event()
+        self._content[url] = ChunkedBuffer()
+        connection = await self._connection(url)
+
+        await self.events.transfer_start(url)
+        self._submit(connection, request)
+        if save:
+            await self._waiting_urls[url].wait()
+            return self._content[url].getvalue()
+        return None
+
+    def _submit(self, connection: OriginConnection, request: DownloadRequest):
+        if connection.conn.open_outbound_streams < connection.conn.remote_settings.max_concurrent_streams:
+            self._send_request(connection, request)
+        else:
+            connection.pending.append(request)
+
+    async def _resubmit(self, request: DownloadRequest):
+        """
+        Send again a request the server did not process, over a new connection
+        """
+        try:
+            connection = await self._connection(request.url)
+        except Exception as e:
+            if self._resubmitted.pop(request.url, None) is not None:
+                self.log.info(f"Cannot send {request.url} again: {e}")
+                self._cancel(request.url)
+                await self.events.transfer_canceled(request.url, 0, 0)
+            return
+        # Not stopped or dropped meanwhile
+        if self._resubmitted.pop(request.url, None) is not None:
+            self._submit(connection, request)
+
+    def _send_request(self, connection: OriginConnection, request: DownloadRequest):
+        parsed = urlparse(request.url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        stream_id = connection.conn.get_next_available_stream_id()
+        headers = [
+            (":method", "GET"),
+            (":scheme", parsed.scheme),
+            (":authority", parsed.netloc),
+            (":path", path),
+        ] + [(key.lower(), value) for key, value in request.headers.items()]
+        connection.conn.send_headers(stream_id, headers, end_stream=True, priority_weight=self.weight(request))
+        connection.flush()
+        connection.streams[stream_id] = request.url
+        connection.requests[stream_id] = request
+        self._url_streams[request.url] = (connection, stream_id)
+
+    def _send_pending(self, connection: OriginConnection):
+        while connection.pending and connection.conn.open_outbound_streams < connection.conn.remote_settings.max_concurrent_streams:
+            self._send_request(connection, connection.pending.popleft())
+
+    async def _read_loop(self, connection: OriginConnection):
+        try:
+            while True:
+                data = await connection.reader.read(65536)
+                if not data:
+                    break
+                try:
+                    events = connection.conn.receive_data(data)
+                except ProtocolError as e:
+                    self.log.error(f"HTTP/2 protocol error: {e}")
+                    break
+                for event in events:
+                    if isinstance(event, ResponseReceived):
+                        self._on_response(connection, event)
+                    elif isinstance(event, DataReceived):
+                        await self._on_data(connection, event)
+                    elif isinstance(event, StreamEnded):
+                        await self._on_stream_end(connection, event.stream_id)
+                    elif isinstance(event, StreamReset):
+                        await self._on_stream_reset(connection, event.stream_id)
+                    elif isinstance(event, ConnectionTerminated):
+                        self.log.info(f"Connection terminated by the server: {event.error_code}")
+                        self._on_goaway(connection, event.last_stream_id)
+                connection.flush()
+                if connection.closing and not connection.streams:
+                    break
+        finally:
+            connection.writer.close()
+            if self._connections.get(connection.origin) is connection:
+                del self._connections[connection.origin]
+            # The requests still in flight will not complete
+            for stream_id in list(connection.streams):
+                await self._on_stream_reset(connection, stream_id)
+            for request in connection.pending:
+                self._cancel(request.url)
+                await self.events.transfer_canceled(request.url, 0, 0)
+            connection.pending.clear()
+
+    def _on_goaway(self, connection: OriginConnection, last_stream_id: Optional[int]):
+        """
+        No new stream can be opened on the connection after a GOAWAY frame. The next requests go over a new connection,
+        with the pending ones and the ones the server did not process. The streams the server processes still complete.
+        """
+        connection.closing = True
+        if self._connections.get(connection.origin) is connection:
+            del self._connections[connection.origin]
+        requests = list(connection.pending)
+        connection.pending.clear()
+        for stream_id in sorted(connection.streams):
+            if last_stream_id is None or stream_id > last_stream_id:
+                url = connection.streams.pop(stream_id)
+                self._url_streams.pop(url, None)
+                requests.append(connection.requests.pop(stream_id))
+        for request in requests:
+            self._resubmitted[request.url] = request
+            asyncio.create_task(self._resubmit(request))
+
+    def _on_response(self, connection: OriginConnection, event: ResponseReceived):
+        url = connection.streams.get(event.stream_id)
+        if url is None:
+            return
+        headers = dict(event.headers)
+        self._headers[url] = headers
+        # A "304 Not Modified" response to a conditional request has no body
+        size = 0 if headers.get(":status") == "304" else int(headers.get("content-length", 0))
+        self._sizes[url] = size
+        self._content[url] = ChunkedBuffer(size)
+
+    async def _on_data(self, connection: OriginConnection, event: DataReceived):
+        connection.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        url = connection.streams.get(event.stream_id)
+        if url is None or not event.data:
+            return
+        content = self._content[url]
+        content.append(event.data)
+        await self.events.bytes_transferred(len(event.data), url, len(content), self._sizes.get(url, 0), event.data)
+
+    async def _on_stream_end(self, connection: OriginConnection, stream_id: int):
+        url = connection.streams.pop(stream_id, None)
+        connection.requests.pop(stream_id, None)
+        self._send_pending(connection)
+        if url is None:
+            return
+        self._url_streams.pop(url, None)
+        self._completed_urls.add(url)
+        self._waiting_urls[url].set()
+        await self.events.transfer_end(len(self._content[url]), url)
+
+    async def _on_stream_reset(self, connection: OriginConnection, stream_id: int):
+        url = connection.streams.pop(stream_id, None)
+        connection.requests.pop(stream_id, None)
+        self._send_pending(connection)
+        if url is None:
+            return
+        self.log.info(f"Stream of {url} reset")
+        self._url_streams.pop(url, None)
+        self._cancel(url)
+        await self.events.transfer_canceled(url, len(self._content[url]), self._sizes.get(url, 0))
+
+    def _cancel(self, url: str):
+        self._cancelled_urls.add(url)
+        if url in self._waiting_urls:
+            self._waiting_urls[url].set()
+
+    def _reset_stream(self, url: str) -> bool:
+        """
+        Reset the stream of the URL with a RST_STREAM frame, or take the request out of the pending ones
+
+        Returns
+        -------
+        in_flight: bool
+            True if the request was in flight
+        """
+        stream = self._url_streams.pop(url, None)
+        if stream is None:
+            if self._resubmitted.pop(url, None) is not None:
+                return True
+            for connection in self._connections.values():
+                for request in connection.pending:
+                    if request.url == url:
+                        connection.pending.remove(request)
+                        return True
+            return False
+        connection, stream_id = stream
+        connection.streams.pop(stream_id, None)
+        connection.requests.pop(stream_id, None)
+        try:
+            connection.conn.reset_stream(stream_id, ErrorCodes.CANCEL)
+            connection.flush()
+        except StreamClosedError:
+            pass
+        self._send_pending(connection)
+        return True
+
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
+        # If url is in partially accepted set, return read bytes and length
+        if url in self._partially_accepted_urls:
+            self._partially_accepted_urls.remove(url)
+            content = self._content[url]
+            return content.getvalue(), self._sizes.get(url, len(content))
+        # If the url has been dropped, return None
+        if url in self._cancelled_urls:
+            return None
+        # Wait the url to be completed
+        if url not in self._completed_urls:
+            await self._waiting_urls[url].wait()
+        if url in self._partially_accepted_urls:
+            self._partially_accepted_urls.remove(url)
+            content = self._content[url]
+            return content.getvalue(), self._sizes.get(url, len(content))
+        # If the url has been canceled, return None
+        if url in self._cancelled_urls:
+            self._cancelled_urls.remove(url)
+            return None
+        self._completed_urls.discard(url)
+        content = self._content[url]
+        return content.getvalue(), self._sizes.get(url, len(content))
+
+    def response_headers(self, url: str) -> Optional[Dict[str, str]]:
+        return self._headers.get(url)
+
+    def cancel_read_url(self, url: str):
+        return
+
+    async def stop(self, url: str):
+        self.log.info("STOP DOWNLOADING: " + url)
+        if not self._reset_stream(url):
+            return
+        self._partially_accepted_urls.add(url)
+        self._waiting_urls[url].set()
+        await self.events.transfer_end(len(self._content[url]), url)
+
+    async def drop_url(self, url: str):
+        if not self._reset_stream(url):
+            return
+        self._cancel(url)
+        await self.events.transfer_canceled(url, len(self._content[url]), self._sizes.get(url, 0))
+
+    async def close(self):
+        connections = list(self._connections.values())
+        self._connections.clear()
+        for connection in connections:
+            try:
+                connection.conn.close_connection()
+                connection.flush()
+            except ProtocolError:
+                pass
+            if connection.task is not None:
+                connection.task.cancel()
+            connection.writer.close()
@@ -1,36 +1,59 @@
 import asyncio
-from collections import defaultdict
+import os
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 
 from istream_player.config.config import PlayerConfig
-from istream_player.core.downloader import (DownloadEventListener,
-                                            DownloadManager, DownloadRequest)
+from istream_player.core.downloader import DownloadManager, DownloadRequest
 from istream_player.core.module import Module, ModuleOption
+from istream_player.modules.downloader.network_emulator import NetworkEmulator, NetworkProfile
+from istream_player.utils.chunked_buffer import ChunkedBuffer
 
 
 @ModuleOption("local", default=True)
 class LocalClient(Module, DownloadManager):
-    def __init__(self, *, bw="100000000000") -> None:
+    def __init__(self, *, bw="100000000000", profile=None, burst="20000", seed=None) -> None:
+        """
+        Parameters
+        ----------
+        bw:
+            Constant transfer rate in bytes per second, when there is no network profile
+        profile:
+            Network profile to emulate, in the format of NetworkManager: one line per second with the bandwidth in
+            kbit/s, the latency in ms and the drop rate in %
+        burst:
+            Size in bytes of the token bucket of the emulated link
+        seed:
+            Seed of the emulated packet drops
+        """
         super().__init__()
-        self.bw = int(bw)  # Not implemented
+        self.bw = int(bw)
         self.max_packet_size = 20_000
+        self.profile = NetworkProfile.load(profile) if profile is not None else None
+        self.burst = int(burst)
+        self.seed = int(seed) if seed is not None else None
+        self.emulator: Optional[NetworkEmulator] = None
 
         self.transfer_queue: asyncio.Queue[tuple[str, bytes | None]] = asyncio.Queue()
-        self.content: Dict[str, bytearray] = defaultdict(bytearray)
+        self.content: Dict[str, ChunkedBuffer] = {}
         self.transfer_size: Dict[str, int] = {}
         self.transfer_compl: Dict[str, asyncio.Event] = {}
+        self.file_stats: Dict[str, Tuple[os.stat_result, bool]] = {}
         self.downloader_task: Optional[asyncio.Task] = None
 
     async def setup(self, config: PlayerConfig, **kwargs):
-        self.downloader_task = asyncio.create_task(self.throttled_download(), name="TASK_LOCAL_DOWNLOADER")
         self.time_factor = config.time_factor
+        if self.profile is not None:
+            self.emulator = NetworkEmulator(self.profile, self.time_factor, self.burst, self.seed)
+            self.emulator.start()
+        self.downloader_task = asyncio.create_task(self.throttled_download(), name="TASK_LOCAL_DOWNLOADER")
 
     async def cleanup(self):
         if self.downloader_task:
             self.downloader_task.cancel()
 
-    async def wait_complete(self, url: str) -> Tuple[bytes, int]:
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         """
         Wait the stream to complete
 
@@ -45,12 +68,42 @@ class LocalClient(Module, DownloadManager):
             It could be a tuple, the bytes as the first element and size as the second element.
         """
         await self.transfer_compl[url].wait()
-        content = self.content[url]
+        content = self.content[url].getvalue()
         del self.content[url]
         del self.transfer_compl[url]
         del self.transfer_size[url]
         return content, len(content)
 
+    def response_headers(self, url: str) -> Optional[Dict[str, str]]:
+        if url not in self.file_stats:
+            return None
+        stat, modified = self.file_stats[url]
+        return {
+            ":status": "200" if modified else "304",
+            "content-length": str(stat.st_size if modified else 0),
+            "etag": self.etag(stat),
+            "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        }
+
+    @staticmethod
+    def etag(stat: os.stat_result) -> str:
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    @classmethod
+    def is_modified(cls, request: DownloadRequest, stat: os.stat_result) -> bool:
+        """
+        Evaluate the conditional headers of the request against the file, like an HTTP server would
+        """
+        headers = {key.lower(): value for key, value in request.headers.items()}
+        if "if-none-match" in headers:
+            return cls.etag(stat) not in [tag.strip() for tag in headers["if-none-match"].split(",")]
+        if "if-modified-since" in headers:
+            try:
+                return int(stat.st_mtime) > parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return True
+        return True
+
     def cancel_read_url(self, url: str):
         raise Exception("Local Downloader : Cannot cancel download")
 
@@ -66,15 +119,21 @@ class LocalClient(Module, DownloadManager):
 
     async def download(self, request: DownloadRequest, save: bool = False) -> Optional[bytes]:
         url = request.url
+        stat = Path(url).stat()
+        modified = self.is_modified(request, stat)
+        self.file_stats[url] = (stat, modified)
         self.transfer_compl[url] = asyncio.Event()
-        self.transfer_size[url] = Path(url).stat().st_size
-        for listener in self.listeners:
-            await listener.on_transfer_start(url)
-        asyncio.create_task(self.request_read(url), name=f"TASK_LOCAL_REQREAD_{url.rsplit('/', 1)[-1]}")
+        self.transfer_size[url] = stat.st_size if modified else 0
+        self.content[url] = ChunkedBuffer(self.transfer_size[url])
+        await self.events.transfer_start(url)
+        if modified:
+            asyncio.create_task(self.request_read(url), name=f"TASK_LOCAL_REQREAD_{url.rsplit('/', 1)[-1]}")
+        else:
+            # Not modified, there is no body to transfer
+            await self.transfer_queue.put((url, b""))
         if save:
             await self.transfer_compl[url].wait()
-            content = self.content[url]
-            return content
+            return self.content[url].getvalue()
         else:
             return None
 
@@ -84,12 +143,10 @@ class LocalClient(Module, DownloadManager):
     async def stop(self, url: str):
         pass
 
-    def add_listener(self, listener: DownloadEventListener):
-        if listener not in self.listeners:
-            self.listeners.append(listener)
-
     async def request_read(self, url: str):
         # print(f"Request : {url}")
+        if self.emulator is not None:
+            await self.emulator.request_latency()
         with open(url, "rb") as f:
             while True:
                 data = f.read(self.max_packet_size)
@@ -102,15 +159,14 @@ class LocalClient(Module, DownloadManager):
         while True:
             # print("Getting response from transfer_queue")
             url, chunk = await self.transfer_queue.get()
+            if chunk and self.emulator is not None:
+                await self.emulator.transmit(len(chunk))
             if chunk:
-                self.content[url].extend(chunk)
-                for listener in self.listeners:
-                    await listener.on_bytes_transferred(
-                        len(chunk), url, len(self.content[url]), self.transfer_size[url], chunk
-                    )
+                self.content[url].append(chunk)
+                await self.events.bytes_transferred(len(chunk), url, len(self.content[url]), self.transfer_size[url], chunk)
             else:
                 self.transfer_compl[url].set()
-                for listener in self.listeners:
-                    await listener.on_transfer_end(self.transfer_size[url], url)
-            await asyncio.sleep(self.time_factor * self.max_packet_size / self.bw)
+                await self.events.transfer_end(self.transfer_size[url], url)
+            if self.emulator is None:
+                await asyncio.sleep(self.time_factor * self.max_packet_size / self.bw)
 
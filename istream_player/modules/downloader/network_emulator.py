@@ -0,0 +1,149 @@
+import asyncio
+import random
+from typing import List, NamedTuple, Optional
+
+
+class NetworkCondition(NamedTuple):
+    # Bandwidth in bytes per second
+    bw: float
+
+    # One-way latency in seconds
+    latency: float
+
+    # Probability of a packet to be dropped, from 0 to 1
+    drop: float
+
+
+class NetworkProfile(object):
+    """
+    Network conditions changing over time, in the format of the bandwidth profiles of NetworkManager: one line per
+    `interval` seconds with the bandwidth in kbit/s, the latency in ms and the drop rate in %, separated by spaces.
+    The last condition is kept after the end of the profile.
+    """
+
+    def __init__(self, conditions: List[NetworkCondition], interval: float = 1):
+        assert len(conditions) > 0, "Empty network profile"
+        assert conditions[-1].bw > 0, "The last condition of a network profile should have some bandwidth"
+        self.conditions = conditions
+        self.interval = interval
+
+    @staticmethod
+    def load(path: str, interval: float = 1) -> "NetworkProfile":
+        conditions = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                [bw, latency, drop] = line.split()[:3]
+                conditions.append(NetworkCondition(float(bw) * 1000 / 8, float(latency) / 1000, float(drop) / 100))
+        return NetworkProfile(conditions, interval)
+
+    def at(self, time: float) -> NetworkCondition:
+        """
+        Returns
+        -------
+        condition: NetworkCondition
+            The network condition at this time in seconds since the start of the profile
+        """
+        return self.conditions[min(max(int(time // self.interval), 0), len(self.conditions) - 1)]
+
+    def transmission_end(self, start: float, num_bytes: float) -> float:
+        """
+        Returns
+        -------
+        end: float
+            The time at which `num_bytes` bytes sent from `start` are received, following the bandwidth changes
+        """
+        time = start
+        while num_bytes > 0:
+            index = int(time // self.interval)
+            bw = self.at(time).bw
+            if index >= len(self.conditions) - 1:
+                return time + num_bytes / bw
+            boundary = (index + 1) * self.interval
+            sendable = bw * (boundary - time)
+            if sendable >= num_bytes:
+                return time + num_bytes / bw
+            num_bytes -= sendable
+            time = boundary
+        return time
+
+
+class NetworkEmulator(object):
+    """
+    Emulate a network profile in process.
+
+    All the transfers share one link, shaped by a token bucket whose rate follows the profile: the link transmits
+    the chunks one after the other at the bandwidth of the moment, and a bucket of up to `burst` bytes fills while it
+    is idle. As with netem on the server, the latency delays the responses: every request waits for it before its
+    first byte, and a dropped chunk is sent again after it, like a retransmission.
+
+    The emulator runs on a virtual clock, which goes 1 / time_factor times faster than the event loop clock, so an
+    experiment can run faster than real time. With a time factor of 0 the virtual clock follows the event loop clock
+    and the emulator never waits, as the player does not wait either.
+    """
+
+    # Real seconds a timer may fire late. A chunk coming that late after the link got free continues the transfer
+    # instead of finding the link idle, so the timer jitter, scaled by the clock, does not slow down the link.
+    TIMER_SLACK = 0.002
+
+    def __init__(self, profile: NetworkProfile, time_factor: float = 1, burst: int = 20_000, seed: Optional[int] = None):
+        self.profile = profile
+        self.time_factor = time_factor
+        # Real seconds per virtual second
+        self._clock_scale = time_factor if time_factor > 0 else 1
+        self.burst = burst
+        self.random = random.Random(seed)
+
+        self._start: Optional[float] = None
+        self._tokens = float(burst)
+        # Virtual time at which the link is done with the chunks it was given
+        self._link_free_at = 0.0
+
+    def start(self):
+        self._start = asyncio.get_running_loop().time()
+
+    @property
+    def now(self) -> float:
+        """Seconds of virtual time since the start of the emulation"""
+        if self._start is None:
+            self.start()
+        assert self._start is not None
+        return (asyncio.get_running_loop().time() - self._start) / self._clock_scale
+
+    async def _sleep_until(self, time: float):
+        if self.time_factor == 0:
+            return
+        delay = time - self.now
+        if delay > 0:
+            await asyncio.sleep(delay * self.time_factor)
+
+    async def request_latency(self):
+        """
+        Wait for the latency of a request before its first byte is sent
+        """
+        now = self.now
+        await self._sleep_until(now + self.profile.at(now).latency)
+
+    async def transmit(self, num_bytes: int):
+        """
+        Wait until a chunk of `num_bytes` bytes went through the link
+        """
+        now = self.now
+        if self._link_free_at < now - self.TIMER_SLACK / self._clock_scale:
+            # The bucket filled while the link was idle
+            self._tokens = min(self.burst, self._tokens + (now - self._link_free_at) * self.profile.at(now).bw)
+            self._link_free_at = now
+
+        condition = self.profile.at(self._link_free_at)
+        size = float(num_bytes)
+        delay = 0.0
+        if condition.drop > 0 and self.random.random() < condition.drop:
+            size *= 2
+            delay = condition.latency
+
+        from_bucket = min(self._tokens, size)
+        self._tokens -= from_bucket
+        self._link_free_at = self.profile.transmission_end(self._link_free_at, size - from_bucket) + delay
+        await self._sleep_until(self._link_free_at)
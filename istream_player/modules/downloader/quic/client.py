@@ -1,56 +1,119 @@
 import asyncio
+import dataclasses
+import functools
 import logging
+import os
+import pickle
 import ssl
-from typing import AsyncIterator, Optional, Set, Tuple, cast
-from urllib.parse import urlparse
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple, Union, cast
+from urllib.parse import quote, urlparse
 
 from aioquic.asyncio.client import connect
 from aioquic.h3.connection import H3_ALPN
-from aioquic.h3.events import H3Event
+from aioquic.h3.events import DataReceived, H3Event, HeadersReceived
 from aioquic.quic.configuration import QuicConfiguration
 from aioquic.tls import SessionTicket
 
 from istream_player.config.config import PlayerConfig
-from istream_player.core.downloader import (DownloadEventListener,
-                                            DownloadManager, DownloadRequest)
+from istream_player.core.downloader import DownloadManager, DownloadRequest, DownloadType
 from istream_player.core.module import Module, ModuleOption
 from istream_player.modules.downloader.quic.event_parser import \
     H3EventParserImpl
 from istream_player.modules.downloader.quic.protocol import HttpProtocol
 
 
+# Scheme, host and port of an origin
+Origin = Tuple[str, str, int]
+
+
+class QuicConnection(object):
+    """
+    One QUIC connection of the pool, and the requests in flight over it
+    """
+
+    __slots__ = ("origin", "protocol", "up", "close_event", "closed", "task", "urls", "sent", "idle_handle")
+
+    def __init__(self, origin: Origin):
+        self.origin = origin
+        self.protocol: Optional[HttpProtocol] = None
+        # Set once the protocol is created, the requests can be sent before the handshake completes
+        self.up = asyncio.Event()
+        # When this close_event got set, the connection is closed
+        self.close_event = asyncio.Event()
+        # Set once the connection is closed, also when it could not be established
+        self.closed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.urls: Set[str] = set()
+        # The URLs whose request was sent, the others are waiting for the handshake
+        self.sent: Set[str] = set()
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+
+
 @ModuleOption("quic")
 class QuicClientImpl(Module, DownloadManager):
     """
-    QuickClientImpl will use only one thread, but be multiplexing by tuning a queue
+    QuickClientImpl will use only one thread, but be multiplexing the requests over QUIC connections.
+
+    The connections are pooled by origin, so the MPDs with BaseURLs on several hosts work. An origin gets a new
+    connection when all of its connections carry the maximum number of streams, up to the maximum number of
+    connections, after which the requests wait for a stream to complete. A connection without requests is closed
+    after the idle timeout.
+
+    The HTTP events of the protocols are appended to a deque from the protocol callbacks and parsed in order by a single
+    dispatch task, so a DATA frame costs no task, future or queue operation on its way to the event parser.
+
+    With a ticket directory, the TLS session tickets are kept across runs, one file per server. A connection to a
+    server with a valid ticket resumes the session and sends the MPD request as 0-RTT early data, saving the
+    handshake round trip before the first byte. The other requests wait for the handshake, since early data can be
+    replayed.
     """
 
     log = logging.getLogger("QuicClientImpl")
 
-    def __init__(self):
-        super().__init__()
-        self._client: Optional[HttpProtocol] = None
-
-        self._close_event: Optional[asyncio.Event] = None
-        self.event_parser = H3EventParserImpl(listeners=[])
+    def __init__(self, *, ticket_dir=None, max_streams="100", max_connections="4", idle_timeout="30"):
         """
-        When this _close_event got set, the client will stop the connection completely.
+        Parameters
+        ----------
+        ticket_dir:
+            The directory where the session tickets are cached. Without it the tickets are only kept in memory.
+        max_streams:
+            The maximum number of requests in flight over one connection
+        max_connections:
+            The maximum number of connections to one origin
+        idle_timeout:
+            The time in seconds after which a connection without requests is closed
         """
+        super().__init__()
+        self.ticket_dir = os.path.expanduser(ticket_dir) if ticket_dir is not None else None
+        self.max_streams = int(max_streams)
+        self.max_connections = int(max_connections)
+        self.idle_timeout = float(idle_timeout)
+        assert self.max_streams > 0 and self.max_connections > 0, "max_streams and max_connections should be positive"
+        self._session_tickets: Dict[str, SessionTicket] = {}
+
+        self._connections: Dict[Origin, List[QuicConnection]] = {}
+        # Notified when a stream completes or a connection closes, for the requests waiting for a stream
+        self._pool_changed = asyncio.Condition()
+        # Connection of the requests in flight, by URL
+        self._url_connections: Dict[str, QuicConnection] = {}
+
+        self.event_parser = H3EventParserImpl(self.events)
 
         self._canceled_urls: Set[str] = set()
-        self._event_queue: Optional[asyncio.Queue[Tuple[H3Event, str]]] = None
-        self._download_queue: asyncio.Queue[DownloadRequest] = asyncio.Queue()
+        # HTTP events waiting to be parsed, with their URL
+        self._events: Deque[Tuple[str, H3Event]] = deque()
+        self._events_ready = asyncio.Event()
+        self._dispatch_task: Optional[asyncio.Task] = None
 
-    async def setup(self, *, config: PlayerConfig, **kwargs) -> None:
+    async def setup(self, config: PlayerConfig, **kwargs) -> None:
         secrets_log_file = open(config.ssl_keylog_file, "a") if config.ssl_keylog_file is not None else None
 
         self.quic_configuration = QuicConfiguration(
             alpn_protocols=H3_ALPN, is_client=True, verify_mode=ssl.CERT_NONE, **{"secrets_log_file": secrets_log_file}
         )
-
-    def add_listener(self, listener: DownloadEventListener):
-        super().add_listener(listener)
-        self.event_parser.add_listener(listener)
+        if self.ticket_dir is not None:
+            os.makedirs(self.ticket_dir, exist_ok=True)
 
     @property
     def is_busy(self):
@@ -65,117 +128,299 @@ class QuicClientImpl(Module, DownloadManager):
         """
         return False
 
-    async def wait_complete(self, url) -> Optional[Tuple[bytes, int]]:
+    async def wait_complete(self, url) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         return await self.event_parser.wait_complete(url)
 
+    def response_headers(self, url: str) -> Optional[Dict[str, str]]:
+        return self.event_parser.headers(url)
+
     async def close(self):
-        # This is to close the whole connection
-        if self._close_event is not None:
-            self._close_event.set()
+        # This is to close all the connections
+        for connections in list(self._connections.values()):
+            for connection in connections:
+                connection.close_event.set()
+        tasks = [
+            connection.task
+            for connections in self._connections.values()
+            for connection in connections
+            if connection.task is not None
+        ]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._dispatch_task is not None:
+            self._dispatch_task.cancel()
+            self._dispatch_task = None
 
     async def stop(self, url: str):
         # This is to stop only one stream
-        if self._client is not None:
-            await self._client.close_stream_of_url(url)
+        connection = self._url_connections.get(url)
+        if connection is None:
+            return
+        if url in connection.sent:
+            assert connection.protocol is not None
+            await connection.protocol.close_stream_of_url(url)
             await self.event_parser.close_stream(url)
-
-    def save_session_ticket(self, ticket: SessionTicket) -> None:
+            await self._release(url)
+        else:
+            # Stopped before the request was sent, nothing was received
+            await self._release(url)
+            await self.event_parser.drop_stream(url)
+
+    def ticket_path(self, host: str) -> Optional[str]:
+        if self.ticket_dir is None:
+            return None
+        return os.path.join(self.ticket_dir, quote(host, safe="") + ".ticket")
+
+    def save_session_ticket(self, ticket: SessionTicket, host: Optional[str] = None) -> None:
         """
         Callback which is invoked by the TLS engine when a new session ticket
         is received.
         """
-        self.log.info("New session ticket received from server: " + ticket.server_name)
-        self.quic_configuration.session_ticket = ticket
-
-    async def _download_internal(self, request: DownloadRequest) -> AsyncIterator[Tuple[H3Event, str]]:
-        url = request.url
-        self.log.info(f"Downloading Internal: {url}")
-        assert self._client is not None
-        async for event in self._client.get(url, headers=request.headers):
-            yield event, url
-
-    # @critical_task()
-    async def _download_loop(self):
-        queue = asyncio.Queue()
-
-        async def drain(iterator: AsyncIterator):
-            async for i in iterator:
-                await queue.put(i)
-
-        async def read_new_request():
-            while True:
-                req = await self._download_queue.get()
-                it = self._download_internal(req)
-                asyncio.create_task(drain(it))
-
-        asyncio.create_task(read_new_request())
+        host = host if host is not None else ticket.server_name
+        self.log.info(f"New session ticket received from server: {host}")
+        if host is None:
+            return
+        self._session_tickets[host] = ticket
+        path = self.ticket_path(host)
+        if path is not None:
+            # Written aside and renamed, so a concurrent run never reads a partial ticket
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(ticket, f)
+            os.replace(path + ".tmp", path)
+
+    def load_session_ticket(self, host: str) -> Optional[SessionTicket]:
+        """
+        Returns
+        -------
+        ticket: SessionTicket, optional
+            The last session ticket of the server, if it is still valid
+        """
+        ticket = self._session_tickets.get(host)
+        path = self.ticket_path(host)
+        if ticket is None and path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    ticket = pickle.load(f)
+            except Exception as e:
+                self.log.info(f"Cannot read the session ticket of {host}: {e}")
+        if ticket is None or not isinstance(ticket, SessionTicket) or not ticket.is_valid:
+            return None
+        return ticket
+
+    def _on_http_event(self, url: str, event: H3Event):
+        self._events.append((url, event))
+        self._events_ready.set()
+
+    async def _dispatch_events(self):
         while True:
-            event, url = await queue.get()
-            await self.event_parser.parse(url, event)
-
-    async def start(self, host, port, client_up_event=None):
+            await self._events_ready.wait()
+            self._events_ready.clear()
+            while self._events:
+                url, event = self._events.popleft()
+                if url not in self._url_connections:
+                    # Stopped, dropped or canceled with its connection
+                    continue
+                await self.event_parser.parse(url, event)
+                if isinstance(event, (HeadersReceived, DataReceived)) and event.stream_ended:
+                    await self._release(url)
+
+    async def _run_connection(self, connection: QuicConnection):
         """
-        Start the QUIC Client
+        Keep the QUIC connection open until it is closed or terminated by the server
 
         Parameters
         ----------
-        host: str
-            The hostname of the remote endpoint
-        port: int
-            The UDP port to connect to the remote endpoint
-        client_up_event: asyncio.Event, optional
-            If event is not None, set the event when the client is up
-        """
-
-        self._close_event = asyncio.Event()
-        self._event_queue = asyncio.Queue()
-
-        async with connect(
-            host,
-            port,
-            configuration=self.quic_configuration,
-            create_protocol=HttpProtocol,
-            session_ticket_handler=self.save_session_ticket,
-            local_port=0,
-            wait_connected=False,
-        ) as client:
-            self._client = cast(HttpProtocol, client)
-            task = asyncio.create_task(self._download_loop())
-            if client_up_event is not None:
-                client_up_event.set()
-            await self._close_event.wait()
-            task.cancel()
-
-        self._client = None
-        self._close_event = None
-        self._event_queue = None
+        connection: QuicConnection
+            The connection to run, which is removed from the pool when closed
+        """
+        scheme, host, port = connection.origin
+        # Every connection gets its own configuration, which connect() completes with the server name
+        session_ticket = self.load_session_ticket(host)
+        configuration = dataclasses.replace(self.quic_configuration, session_ticket=session_ticket)
+        if session_ticket is not None:
+            self.log.info(f"Resuming the TLS session with {host}")
+
+        try:
+            async with connect(
+                host,
+                port,
+                configuration=configuration,
+                create_protocol=HttpProtocol,
+                session_ticket_handler=functools.partial(self.save_session_ticket, host=host),
+                local_port=0,
+                wait_connected=False,
+            ) as client:
+                connection.protocol = cast(HttpProtocol, client)
+                connection.protocol.event_handler = self._on_http_event
+                connection.up.set()
+                self.log.info(f"Connected to {scheme}://{host}:{port}")
+                closed = asyncio.create_task(connection.protocol.wait_closed())
+                close_requested = asyncio.create_task(connection.close_event.wait())
+                await asyncio.wait([closed, close_requested], return_when=asyncio.FIRST_COMPLETED)
+                closed.cancel()
+                close_requested.cancel()
+        finally:
+            if connection.idle_handle is not None:
+                connection.idle_handle.cancel()
+            async with self._pool_changed:
+                connections = self._connections.get(connection.origin, [])
+                if connection in connections:
+                    connections.remove(connection)
+                if not connections:
+                    self._connections.pop(connection.origin, None)
+                self._pool_changed.notify_all()
+            # Unblock the requests waiting for the connection to come up or for the handshake
+            connection.closed.set()
+            connection.up.set()
+            # The requests still in flight will not complete
+            for url in list(connection.urls):
+                if self._url_connections.get(url) is connection:
+                    del self._url_connections[url]
+                    self.log.info(f"Transfer of {url} canceled, the connection closed")
+                    await self.event_parser.drop_stream(url)
+            connection.urls.clear()
+            connection.sent.clear()
+            self.log.info(f"Connection to {scheme}://{host}:{port} closed")
+
+    def _open_connection(self, origin: Origin) -> QuicConnection:
+        if self._dispatch_task is None:
+            self._dispatch_task = asyncio.create_task(self._dispatch_events())
+        connection = QuicConnection(origin)
+        self._connections.setdefault(origin, []).append(connection)
+        connection.task = asyncio.create_task(self._run_connection(connection), name=f"TASK_QUIC_{origin[1]}:{origin[2]}")
+        return connection
+
+    def _open_connections(self, origin: Origin) -> List[QuicConnection]:
+        """
+        The connections of the pool to the origin that new requests can use. A connection asked to close stays in the
+        pool until it is closed, but does not take new requests.
+        """
+        return [
+            connection
+            for connection in self._connections.get(origin, [])
+            if not connection.close_event.is_set() and not connection.closed.is_set()
+        ]
+
+    @staticmethod
+    def origin(url: str) -> Origin:
+        parsed = urlparse(url)
+        return parsed.scheme, parsed.hostname or "localhost", parsed.port if parsed.port is not None else 443
+
+    async def _acquire(self, url: str) -> QuicConnection:
+        """
+        Pick the least loaded connection of the origin of the URL with a free stream, open a new one if there is
+        none and the origin is under the maximum number of connections, or wait for a stream to complete.
+        """
+        origin = self.origin(url)
+        async with self._pool_changed:
+            while True:
+                connections = self._open_connections(origin)
+                available = [connection for connection in connections if len(connection.urls) < self.max_streams]
+                if available:
+                    connection = min(available, key=lambda c: len(c.urls))
+                    break
+                if len(connections) < self.max_connections:
+                    connection = self._open_connection(origin)
+                    break
+                await self._pool_changed.wait()
+            connection.urls.add(url)
+            self._url_connections[url] = connection
+            if connection.idle_handle is not None:
+                connection.idle_handle.cancel()
+                connection.idle_handle = None
+        await connection.up.wait()
+        return connection
+
+    async def _release(self, url: str):
+        connection = self._url_connections.pop(url, None)
+        if connection is None:
+            return
+        async with self._pool_changed:
+            connection.urls.discard(url)
+            connection.sent.discard(url)
+            if not connection.urls:
+                self._schedule_idle_close(connection)
+            self._pool_changed.notify_all()
+
+    def _schedule_idle_close(self, connection: QuicConnection):
+        if connection.idle_handle is not None:
+            connection.idle_handle.cancel()
+        connection.idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, connection.close_event.set)
+
+    async def _wait_handshake(self, connection: QuicConnection):
+        """
+        Wait for the handshake of the connection to complete
+
+        Raises
+        ------
+        Exception
+            If the connection closed before, e.g. because the server is unreachable
+        """
+        protocol = connection.protocol
+        if protocol is not None and not protocol.handshake_completed.is_set():
+            handshake = asyncio.create_task(protocol.handshake_completed.wait())
+            closed = asyncio.create_task(connection.closed.wait())
+            await asyncio.wait([handshake, closed], return_when=asyncio.FIRST_COMPLETED)
+            handshake.cancel()
+            closed.cancel()
+        if protocol is None or not protocol.handshake_completed.is_set():
+            scheme, host, port = connection.origin
+            raise Exception(f"Cannot connect to {scheme}://{host}:{port}")
+
+    async def warm_up(self, url: str):
+        origin = self.origin(url)
+        try:
+            async with self._pool_changed:
+                connections = self._open_connections(origin)
+                if connections:
+                    connection = connections[0]
+                else:
+                    connection = self._open_connection(origin)
+                    self._schedule_idle_close(connection)
+            await connection.up.wait()
+            await self._wait_handshake(connection)
+        except Exception as e:
+            self.log.info(f"Cannot warm up the connection to {url}: {e}")
+            return
+        assert connection.protocol is not None
+        handshake = connection.protocol.handshake
+        assert handshake is not None
+        self.log.info(
+            f"Connection to {url} warmed up, session resumed: {handshake.session_resumed}, "
+            f"early data accepted: {handshake.early_data_accepted}"
+        )
 
     async def download(self, request: DownloadRequest, save=False) -> Optional[bytes]:
         url = request.url
-        # Client hasn't been started. Start the client.
-        if self._client is None:
-            parsed = urlparse(url)
-            host = parsed.hostname
-            if parsed.port is not None:
-                port = parsed.port
-            else:
-                port = 443
-            event = asyncio.Event()
-            asyncio.create_task(self.start(host, port, client_up_event=event))
-            await event.wait()
-
-        for listener in self.listeners:
-            await listener.on_transfer_start(url)
-        await self._download_queue.put(request)
+        connection = await self._acquire(url)
+        try:
+            if connection.protocol is None or request.req_type != DownloadType.MPD:
+                # Only the MPD request may go in 0-RTT early data, which the network could replay
+                await self._wait_handshake(connection)
+        except Exception:
+            await self._release(url)
+            raise
+        assert connection.protocol is not None
+        if self._url_connections.get(url) is not connection:
+            self.log.info(f"Stopped before the request was sent: {url}")
+            return None
+
+        connection.sent.add(url)
+        await self.events.transfer_start(url)
+        self.log.info(f"Downloading: {url}")
+        connection.protocol.get(url, headers=request.headers)
         return None
 
     def cancel_read_url(self, url: str):
-        if self._client is not None:
-            self._client.cancel_read(url)
+        connection = self._url_connections.get(url)
+        if connection is not None and connection.protocol is not None:
+            connection.protocol.cancel_read(url)
+            # The end of the stream is not seen anymore, so its slot is given back now
+            asyncio.create_task(self._release(url))
 
     async def drop_url(self, url: str):
-        if self._client is not None:
-            await self._client.close_stream_of_url(url)
+        connection = self._url_connections.get(url)
+        if connection is not None and url in connection.sent:
+            assert connection.protocol is not None
+            await connection.protocol.close_stream_of_url(url)
+        await self._release(url)
         await self.event_parser.drop_stream(url)
-
-
@@ -1,16 +1,17 @@
 import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Set, Tuple, cast
+from typing import Dict, List, Optional, Set, Tuple, Union, cast
 
 from aioquic.h3.events import DataReceived, H3Event, HeadersReceived
 
-from istream_player.core.downloader import DownloadEventListener
+from istream_player.core.downloader import DownloadEventBus, DownloadEventListener
+from istream_player.utils.chunked_buffer import ChunkedBuffer
 
 
 class H3EventParser(ABC):
     @abstractmethod
-    async def wait_complete(self, url: str) -> Optional[Tuple[bytes, int]]:
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         """
         Wait the stream to complete
 
@@ -26,6 +27,10 @@ class H3EventParser(ABC):
         """
         pass
 
+    @abstractmethod
+    def headers(self, url: str) -> Optional[Dict[str, str]]:
+        pass
+
     @abstractmethod
     async def parse(self, url: str, event: H3Event):
         pass
@@ -54,13 +59,14 @@ class H3EventParser(ABC):
 class H3EventParserImpl(H3EventParser):
     log = logging.getLogger("H3EventParserImpl")
 
-    def __init__(self, listeners: List[DownloadEventListener]):
-        self.listeners = listeners if listeners is not None else []
+    def __init__(self, events: Optional[DownloadEventBus] = None):
+        self.events = events if events is not None else DownloadEventBus()
 
         self._completed_urls = set()
         self._waiting_urls: Dict[str, asyncio.Event] = dict()
         self._content_lengths: Dict[str, int] = dict()
-        self._contents: Dict[str, bytearray] = dict()
+        self._headers: Dict[str, Dict[str, str]] = dict()
+        self._contents: Dict[str, ChunkedBuffer] = dict()
         self._partially_accepted_urls: Set[str] = set()
         self._canceled_urls: Set[str] = set()
 
@@ -72,11 +78,11 @@ class H3EventParserImpl(H3EventParser):
             result[key.decode('utf-8')] = value.decode('utf-8')
         return result
 
-    async def wait_complete(self, url: str) -> Optional[Tuple[bytes, int]]:
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         # If url is in partially accepted set, return read bytes and length
         if url in self._partially_accepted_urls:
             content = self._contents[url]
-            return bytes(content), self._content_lengths[url]
+            return content.getvalue(), self._content_lengths[url]
         # If the url has been dropped, return None
         if url in self._canceled_urls:
             return None
@@ -93,50 +99,59 @@ class H3EventParserImpl(H3EventParser):
             self._completed_urls.remove(url)
         content = self._contents[url]
         size = self._content_lengths[url]
-        return bytes(content), size
+        return content.getvalue(), size
+
+    def headers(self, url: str) -> Optional[Dict[str, str]]:
+        return self._headers.get(url)
 
     async def parse(self, url: str, event: H3Event):
-        self.log.info(f"Event {event.__class__.__name__} received for {url}")
+        self.log.debug("Event %s received for %s", event.__class__.__name__, url)
         if isinstance(event, HeadersReceived):
             headers = self.parse_headers(event.headers)
+            self._headers[url] = headers
             size = int(headers.get("content-length", 0))
             self._content_lengths[url] = size
+            self._contents[url] = ChunkedBuffer(size)
+            if event.stream_ended:
+                # No body, e.g. "304 Not Modified"
+                await self._complete(url, size)
         else:
             event = cast(DataReceived, event)
             size = self._content_lengths[url]
 
             if url not in self._contents:
-                self._contents[url] = bytearray()
+                self._contents[url] = ChunkedBuffer()
 
-            self._contents[url].extend(event.data)
+            self._contents[url].append(event.data)
             position = len(self._contents[url])
 
-            for listener in self.listeners:
-                await listener.on_bytes_transferred(len(event.data), url, position, size, event.data)
+            await self.events.bytes_transferred(len(event.data), url, position, size, event.data)
 
             if url in self._partially_accepted_urls:
                 return
 
             if size == position:
-                self._completed_urls.add(url)
-                if url in self._waiting_urls:
-                    self._waiting_urls[url].set()
-                for listener in self.listeners:
-                    await listener.on_transfer_end(size, url)
+                await self._complete(url, size)
+
+    async def _complete(self, url: str, size: int):
+        self._completed_urls.add(url)
+        if url in self._waiting_urls:
+            self._waiting_urls[url].set()
+        await self.events.transfer_end(size, url)
 
     def add_listener(self, listener: DownloadEventListener):
-        self.listeners.append(listener)
+        self.events.add_listener(listener)
 
     async def close_stream(self, url: str):
         self._partially_accepted_urls.add(url)
         if url in self._waiting_urls:
             self._waiting_urls[url].set()
-        for listener in self.listeners:
-            await listener.on_transfer_end(len(self._contents[url]), url)
+        await self.events.transfer_end(len(self._contents[url]), url)
 
     async def drop_stream(self, url: str):
         self._canceled_urls.add(url)
         if url in self._waiting_urls:
             self._waiting_urls[url].set()
-        for listener in self.listeners:
-            await listener.on_transfer_canceled(url, len(self._contents[url]), self._content_lengths[url])
+        # The headers may not have been received yet
+        content = self._contents.get(url)
+        await self.events.transfer_canceled(url, len(content) if content is not None else 0, self._content_lengths.get(url, 0))
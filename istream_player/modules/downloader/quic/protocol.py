@@ -1,7 +1,7 @@
 import asyncio
 import logging
 from collections import deque
-from typing import Callable, Deque, Dict, Optional, Union, AsyncIterator
+from typing import Callable, Deque, Dict, Optional, Union
 from urllib.parse import urlparse
 
 import aioquic
@@ -16,7 +16,7 @@ from aioquic.h3.events import (
     HeadersReceived,
     PushPromiseReceived,
 )
-from aioquic.quic.events import QuicEvent
+from aioquic.quic.events import HandshakeCompleted, QuicEvent
 
 logger = logging.getLogger("client")
 
@@ -130,33 +130,65 @@ class HttpProtocol(QuicConnectionProtocol):
 
         self.pushes: Dict[int, Deque[H3Event]] = {}
         self._http: Optional[HttpConnection] = None
-        self._request_events: Dict[int, asyncio.Queue[H3Event]] = {}
         self._websockets: Dict[int, WebSocket] = {}
         self._url_stream_id: Dict[str, int] = {}
-        self._requests_tasks: Dict[str, asyncio.Task] = {}
+        # URL of the requests whose events are still delivered, by stream id
+        self._stream_urls: Dict[int, str] = {}
+
+        # Called with the URL and the event for every HTTP event of a request, from the protocol callback
+        self.event_handler: Optional[Callable[[str, H3Event], None]] = None
+
+        # Set when the TLS handshake completes. Requests sent before go in 0-RTT early data if the session is resumed.
+        self.handshake_completed = asyncio.Event()
+        self.handshake: Optional[HandshakeCompleted] = None
 
         if self._quic.configuration.alpn_protocols[0].startswith("hq-"):
             self._http = H0Connection(self._quic)
         else:
             self._http = H3Connection(self._quic)
 
-    async def get(self, url: str, headers=None) -> AsyncIterator[H3Event]:
+    def request(self, request: HttpRequest) -> int:
+        """
+        Send a request. Its events are passed to the event handler as they arrive, without going through a queue.
+
+        Returns
+        -------
+        stream_id: int
+            The stream of the request
+        """
+        stream_id = self._quic.get_next_available_stream_id()
+        self._url_stream_id[request.url.url] = stream_id
+        self._stream_urls[stream_id] = request.url.url
+        self.log.info(f"Use stream id {stream_id} for url {request.url.url}")
+        self._http.send_headers(
+            stream_id=stream_id,
+            headers=[
+                        (b":method", request.method.encode()),
+                        (b":scheme", request.url.scheme.encode()),
+                        (b":authority", request.url.authority.encode()),
+                        (b":path", request.url.full_path.encode()),
+                        (b"user-agent", USER_AGENT.encode()),
+                    ] + [(k.encode(), v.encode()) for (k, v) in request.headers.items()],
+        )
+        self._http.send_data(stream_id=stream_id, data=request.content, end_stream=True)
+        self.transmit()
+        return stream_id
+
+    def get(self, url: str, headers=None) -> int:
         """
         Perform a GET request.
         """
         if headers is None:
             headers = {}
-        async for event in self._request(HttpRequest(method="GET", url=URL(url), headers=headers)):
-            yield event
+        return self.request(HttpRequest(method="GET", url=URL(url), headers=headers))
 
-    async def post(self, url: str, data: bytes, headers=None) -> Deque[H3Event]:
+    def post(self, url: str, data: bytes, headers=None) -> int:
         """
         Perform a POST request.
         """
         if headers is None:
             headers = {}
-        async for event in self._request(HttpRequest(method="POST", url=URL(url), content=data, headers=headers)):
-            yield event
+        return self.request(HttpRequest(method="POST", url=URL(url), content=data, headers=headers))
 
     async def websocket(self, url: str, subprotocols=None) -> WebSocket:
         """
@@ -194,9 +226,13 @@ class HttpProtocol(QuicConnectionProtocol):
     def http_event_received(self, event: H3Event) -> None:
         if isinstance(event, (HeadersReceived, DataReceived)):
             stream_id = event.stream_id
-            if stream_id in self._request_events:
+            url = self._stream_urls.get(stream_id)
+            if url is not None:
                 # http
-                asyncio.ensure_future(self._request_events[event.stream_id].put(event))
+                if event.stream_ended:
+                    del self._stream_urls[stream_id]
+                if self.event_handler is not None:
+                    self.event_handler(url, event)
             elif stream_id in self._websockets:
                 # websocket
                 websocket = self._websockets[stream_id]
@@ -211,51 +247,27 @@ class HttpProtocol(QuicConnectionProtocol):
             self.pushes[event.push_id].append(event)
 
     def quic_event_received(self, event: QuicEvent) -> None:
+        if isinstance(event, HandshakeCompleted):
+            self.handshake = event
+            self.handshake_completed.set()
         #  pass event to the HTTP layer
         if self._http is not None:
             for http_event in self._http.handle_event(event):
                 self.http_event_received(http_event)
 
-    async def _request(self, request: HttpRequest) -> AsyncIterator[H3Event]:
-        stream_id = self._quic.get_next_available_stream_id()
-        self._url_stream_id[request.url.url] = stream_id
-        self.log.info(f"Use stream id {stream_id} for url {request.url.url}")
-        self._http.send_headers(
-            stream_id=stream_id,
-            headers=[
-                        (b":method", request.method.encode()),
-                        (b":scheme", request.url.scheme.encode()),
-                        (b":authority", request.url.authority.encode()),
-                        (b":path", request.url.full_path.encode()),
-                        (b"user-agent", USER_AGENT.encode()),
-                    ] + [(k.encode(), v.encode()) for (k, v) in request.headers.items()],
-        )
-        self._http.send_data(stream_id=stream_id, data=request.content, end_stream=True)
-
-        queue = asyncio.Queue()
-        self._request_events[stream_id] = queue
-        self.transmit()
-
-        while True:
-            task = asyncio.create_task(queue.get())
-            self._requests_tasks[request.url.url] = task
-            try:
-                event = await task
-                yield event
-                if isinstance(event, DataReceived):
-                    if event.stream_ended:
-                        return
-            except asyncio.CancelledError:
-                self.log.info(f"Cancel Reading {request.url.url}")
-                return
-
     async def close_stream_of_url(self, url):
         stream_id = self._url_stream_id.get(url, None)
         assert stream_id is not None
         self.log.info(f"Send STOP_SENDING, stream id: {stream_id}, URL: {url}")
-        print(aioquic.__file__)
+        self._stream_urls.pop(stream_id, None)
         self._quic.stop_stream(stream_id, 0)
+        self.transmit()
 
     def cancel_read(self, url):
+        """
+        Stop passing the events of the request to the event handler
+        """
         self.log.info(f"cancel_read: {url}")
-        self._requests_tasks[url].cancel()
+        stream_id = self._url_stream_id.get(url)
+        if stream_id is not None:
+            self._stream_urls.pop(stream_id, None)
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 import ssl
-from typing import Optional, Tuple
+from typing import Dict, Optional, Set, Tuple, Union
 
 import aiohttp
 
@@ -9,27 +9,47 @@ from istream_player.config.config import PlayerConfig
 from istream_player.core.downloader import DownloadManager, DownloadRequest
 from istream_player.core.module import Module, ModuleOption
 from istream_player.utils.async_utils import critical_task
+from istream_player.utils.chunked_buffer import ChunkedBuffer
 
 
 @ModuleOption("tcp")
 class TCPClientImpl(Module, DownloadManager):
     log = logging.getLogger("TCPClientImpl")
 
-    def __init__(self):
+    def __init__(self, *, concurrent="true", max_conn_per_host="6", keepalive_timeout="30"):
+        """
+        Parameters
+        ----------
+        concurrent:
+            If true, every queued request is transferred in its own task so segments of different
+            adaptation sets are fetched in parallel. If false, requests are transferred one at a time.
+        max_conn_per_host:
+            Size of the per-host connection pool. 0 means unlimited.
+        keepalive_timeout:
+            Seconds an idle connection is kept in the pool for reuse
+        """
         super().__init__()
+        self.concurrent = str(concurrent).lower() in ("true", "1", "yes")
+        self.max_conn_per_host = int(max_conn_per_host)
+        self.keepalive_timeout = float(keepalive_timeout)
+
         self._download_queue: asyncio.Queue[DownloadRequest] = asyncio.Queue()
         self._session = None
         self._session_close_event = asyncio.Event()
-        self._is_busy = False
-        self._downloading_task = None  # type: Optional[asyncio.Task]
-        self._downloading_task_resp = None
+
+        # Requests waiting in the queue, a stopped one is skipped when dequeued
+        self._queued_urls: Set[str] = set()
+        # In-flight transfers and their responses, by URL
+        self._downloading_tasks: Dict[str, asyncio.Task] = {}
+        self._downloading_resps: Dict[str, aiohttp.ClientResponse] = {}
 
         self._completed_urls = set()
         self._partially_accepted_urls = set()
         self._cancelled_urls = set()
 
         self._headers = {}
-        self._content = {}
+        self._statuses: Dict[str, int] = {}
+        self._content: Dict[str, ChunkedBuffer] = {}
 
         self._waiting_urls = {}
 
@@ -39,19 +59,19 @@ class TCPClientImpl(Module, DownloadManager):
     async def cleanup(self) -> None:
         await self.close()
 
-    async def wait_complete(self, url: str) -> Optional[Tuple[bytes, int]]:
+    async def wait_complete(self, url: str) -> Optional[Tuple[Union[bytes, bytearray], int]]:
         # If url is in partially accepted set, return read bytes and length
         if url in self._partially_accepted_urls:
+            self._partially_accepted_urls.remove(url)
             content = self._content[url]
-            return bytes(content), int(self._headers[url]["CONTENT-LENGTH"])
+            headers = self._headers.get(url)
+            return content.getvalue(), int(headers["Content-Length"]) if headers is not None else len(content)
         # If the url has been dropped, return None
         if url in self._cancelled_urls:
             return None
         # Wait the url to be completed
         if url not in self._completed_urls:
-            self._waiting_urls[url] = asyncio.Event()
             await self._waiting_urls[url].wait()
-            del self._waiting_urls[url]
         # If the url has been canceled, return None
         if url in self._cancelled_urls:
             self._cancelled_urls.remove(url)
@@ -59,8 +79,16 @@ class TCPClientImpl(Module, DownloadManager):
         if url in self._completed_urls:
             self._completed_urls.remove(url)
         content = self._content[url]
-        size = int(self._headers[url]["Content-Length"])
-        return bytes(content), size
+        size = int(self._headers[url].get("Content-Length", len(content)))
+        return content.getvalue(), size
+
+    def response_headers(self, url: str) -> Optional[Dict[str, str]]:
+        headers = self._headers.get(url)
+        if headers is None:
+            return None
+        result = {key.lower(): value for key, value in headers.items()}
+        result[":status"] = str(self._statuses[url])
+        return result
 
     def cancel_read_url(self, url: str):
         return
@@ -70,19 +98,19 @@ class TCPClientImpl(Module, DownloadManager):
 
     @property
     def is_busy(self):
-        return self._is_busy
+        return len(self._queued_urls) > 0 or len(self._downloading_tasks) > 0
 
     async def download(self, request: DownloadRequest, save: bool = False) -> Optional[bytes]:
         url = request.url
         self._waiting_urls[url] = asyncio.Event()
-        self._content[url] = bytearray()
+        self._content[url] = ChunkedBuffer()
         if self._session is None:
             session_start_event = asyncio.Event()
             asyncio.create_task(self._create_session(session_start_event))
             await session_start_event.wait()
 
-        for listener in self.listeners:
-            await listener.on_transfer_start(url)
+        await self.events.transfer_start(url)
+        self._queued_urls.add(url)
         await self._download_queue.put(request)
         return None
 
@@ -90,41 +118,54 @@ class TCPClientImpl(Module, DownloadManager):
     async def _download_inner(self, request: DownloadRequest):
         assert self._session is not None
         url = request.url
-        async with self._session.get(url, headers=request.headers) as resp:
-            self._downloading_task_resp = resp
-            self._headers[url] = dict(resp.headers)
-            try:
-                size = int(resp.headers["CONTENT-LENGTH"])
-            except KeyError:
-                self.log.info(resp.headers)
-                self.log.info(await resp.content.read())
-                exit(1)
-            async for chunk in resp.content.iter_any():
-                self._content[url] += bytearray(chunk)
-                self.log.info(
-                    f"Bytes transferred: length: {len(chunk)}, position: {len(self._content[url])}, size: {size}, url: {url}"
-                )
-                for listener in self.listeners:
-                    await listener.on_bytes_transferred(len(chunk), url, len(self._content[url]), size, chunk)
+        try:
+            async with self._session.get(url, headers=request.headers) as resp:
+                self._downloading_resps[url] = resp
+                self._headers[url] = resp.headers
+                self._statuses[url] = resp.status
+                try:
+                    # A "304 Not Modified" response to a conditional request has no body
+                    size = 0 if resp.status == 304 else int(resp.headers["Content-Length"])
+                except KeyError:
+                    self.log.info(resp.headers)
+                    self.log.info(await resp.content.read())
+                    exit(1)
+                content = self._content[url] = ChunkedBuffer(size)
+                async for chunk in resp.content.iter_any():
+                    content.append(chunk)
+                    self.log.debug(f"Bytes transferred: length: {len(chunk)}, position: {len(content)}, size: {size}, url: {url}")
+                    await self.events.bytes_transferred(len(chunk), url, len(content), size, chunk)
+        finally:
+            self._downloading_resps.pop(url, None)
+            self._downloading_tasks.pop(url, None)
         self.log.info(f"Transfer ends: {len(self._content[url])}")
         self._completed_urls.add(url)
         self._waiting_urls[url].set()
-        for listener in self.listeners:
-            await listener.on_transfer_end(len(self._content[url]), url)
+        await self.events.transfer_end(len(self._content[url]), url)
 
     async def _download_task(self):
         while True:
-            self._is_busy = False
-            req_url = await self._download_queue.get()
-            self._is_busy = True
-
-            self._downloading_task = asyncio.create_task(self._download_inner(req_url))
+            req = await self._download_queue.get()
+            if req.url not in self._queued_urls:
+                # Stopped before its transfer started
+                continue
+            self._queued_urls.discard(req.url)
+            task = asyncio.create_task(self._download_inner(req), name=f"TASK_TCP_DOWNLOAD_{req.url.rsplit('/', 1)[-1]}")
+            self._downloading_tasks[req.url] = task
+            if not self.concurrent:
+                await asyncio.wait([task])
 
     async def _create_session(self, session_start_event):
         ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_SERVER, verify_mode=ssl.CERT_NONE)
         ssl_context.verify_mode = ssl.CERT_NONE
         # ssl_context.keylog_filename = self.ssl_keylog_file
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_context,
+            limit=0,
+            limit_per_host=self.max_conn_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        async with aiohttp.ClientSession(connector=connector) as session:
             self._session = session
             session_start_event.set()
             task = asyncio.create_task(self._download_task())
@@ -137,15 +178,14 @@ class TCPClientImpl(Module, DownloadManager):
 
     async def stop(self, url: str):
         self.log.info("STOP DOWNLOADING: " + url)
-        if self._downloading_task is not None:
-            self._downloading_task.cancel()
-            if (
-                self._downloading_task_resp is not None
-                and self._downloading_task_resp.connection is not None
-                and self._downloading_task_resp.connection.transport is not None
-            ):
-                self._downloading_task_resp.connection.transport.abort()
+        self._queued_urls.discard(url)
+        task = self._downloading_tasks.pop(url, None)
+        if task is not None:
+            task.cancel()
+        resp = self._downloading_resps.pop(url, None)
+        if resp is not None:
+            # Closing the response drops its connection instead of returning a half-read one to the pool
+            resp.close()
         self._partially_accepted_urls.add(url)
         self._waiting_urls[url].set()
-        for listener in self.listeners:
-            await listener.on_transfer_end(len(self._content), url)
+        await self.events.transfer_end(len(self._content[url]), url)
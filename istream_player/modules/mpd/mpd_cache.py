@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from typing import Optional
+
+from istream_player.models.mpd_objects import MPD
+
+
+class MPDCache(object):
+    """
+    On-disk cache of parsed MPD models.
+
+    Entries are pickle files named by a hash of the MPD URL and content, so a changed manifest never hits a stale
+    entry. Reading an entry refreshes its modification time, and the least recently used entries are removed once
+    the total size of the cache is over the limit.
+    """
+
+    log = logging.getLogger("MPDCache")
+
+    FORMAT_VERSION = 4
+    """
+    Bump it when the MPD model changes, so entries pickled by older versions are not used
+    """
+
+    SUFFIX = ".mpd.pickle"
+
+    def __init__(self, cache_dir: str, max_size: int):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            The directory of the cache files. Created if it does not exist.
+        max_size: int
+            The maximum total size of the cache files in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, url: str, content: bytes) -> str:
+        digest = hashlib.sha256(f"{self.FORMAT_VERSION}\0{url}\0".encode("utf-8"))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[MPD]:
+        """
+        Returns
+        -------
+        mpd: Optional[MPD]
+            The cached MPD. None if there is no valid entry for the key.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                mpd = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.log.warning(f"Removing unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        if not isinstance(mpd, MPD):
+            self._remove(path)
+            return None
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return mpd
+
+    def put(self, key: str, mpd: MPD):
+        # Write to a temporary file first, so concurrent players never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(mpd, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries till the total size is within the limit
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.log.debug(f"Evicting {path}")
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,15 +1,19 @@
+import asyncio
 import logging
+import re
 import time
 from asyncio import Task
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 from istream_player.config.config import PlayerConfig
 from istream_player.core.downloader import (DownloadManager, DownloadRequest,
                                             DownloadType)
 from istream_player.core.module import Module, ModuleOption
 from istream_player.core.mpd_provider import MPDProvider
-from istream_player.models.mpd_objects import MPD, Segment
-from istream_player.modules.mpd.parser import DefaultMPDParser
+from istream_player.models.mpd_objects import MPD, Segment, SegmentSequence
+from istream_player.modules.mpd.mpd_cache import MPDCache
+from istream_player.modules.mpd.parser import DefaultMPDParser, MPDParser
+from istream_player.modules.mpd.stream_parser import StreamingMPDParser
 from istream_player.utils.async_utils import AsyncResource, critical_task
 
 
@@ -17,13 +21,40 @@ from istream_player.utils.async_utils import AsyncResource, critical_task
 class MPDProviderImpl(Module, MPDProvider):
     log = logging.getLogger("MPDProviderImpl")
 
-    def __init__(self):
-        self.parser = DefaultMPDParser()
+    _DIGITS = re.compile(r"\d+")
+
+    def __init__(self, *, parser="default", cache_dir=None, cache_size_mb="100"):
+        """
+        Parameters
+        ----------
+        parser:
+            "default" builds the whole XML tree before reading it.
+            "stream" reads the XML incrementally, for very large manifests.
+        cache_dir:
+            If set, parsed static MPDs are cached in this directory and reused by later runs on the same manifest
+        cache_size_mb:
+            The maximum size of the cache directory in MB. Least recently used entries are removed beyond it.
+        """
+        if parser == "default":
+            self.parser: MPDParser = DefaultMPDParser()
+        elif parser == "stream":
+            self.parser = StreamingMPDParser()
+        else:
+            raise ValueError(f"Unknown MPD parser: {parser}")
+        self.cache = MPDCache(cache_dir, int(float(cache_size_mb) * 1e6)) if cache_dir else None
         self.last_updated = 0
 
         self._mpd_res: AsyncResource[Optional[MPD]] = AsyncResource(None)
         self._segments_by_url: Dict[str, Optional[Segment]] = {}
+        # Segment sequences by the URL text before and after the segment number
+        self._sequences_by_affixes: Dict[Tuple[str, str], SegmentSequence] = {}
+        # Sequences whose segment number cannot be told apart from the digits around it, looked up one by one
+        self._other_sequences: List[SegmentSequence] = []
         self._task: Optional[Task] = None
+        # Validators of the last downloaded MPD, for conditional requests
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._mpd_update_cond = asyncio.Condition()
         # self._repr_quality: Dict[int, int] = {}
 
     async def setup(self, config: PlayerConfig, mpd_downloader: DownloadManager, **kwargs):
@@ -35,6 +66,10 @@ class MPDProviderImpl(Module, MPDProvider):
     def mpd(self) -> Optional[MPD]:
         return self._mpd_res.value
 
+    @property
+    def mpd_update_cond(self) -> asyncio.Condition:
+        return self._mpd_update_cond
+
     # def repr_to_quality(self, repr: int):
     #     return self._repr_quality[repr]
 
@@ -44,37 +79,186 @@ class MPDProviderImpl(Module, MPDProvider):
         return value
 
     def segment_by_url(self, url: str) -> Optional[Segment]:
-        return self._segments_by_url[url]
+        try:
+            return self._segments_by_url[url]
+        except KeyError:
+            pass
+        assert self.mpd is not None
+        candidates = self._other_sequences
+        # The segment number is one of the runs of digits in the URL
+        for match in self._DIGITS.finditer(url):
+            segments = self._sequences_by_affixes.get((url[: match.start()], url[match.end() :]))
+            if segments is not None:
+                candidates = [segments]
+                break
+        for segments in candidates:
+            number = segments.number_of(url)
+            if number is not None:
+                # Segments are expanded lazily. Cache the ones that are looked up.
+                segment = self._segments_by_url[url] = segments[number]
+                return segment
+        raise KeyError(url)
+
+    def _index_sequences(self):
+        """
+        Index the segment sequences of the MPD by the URL text around the segment number, for segment_by_url
+        """
+        assert self.mpd is not None
+        self._sequences_by_affixes = {}
+        self._other_sequences = []
+        for adap_set in self.mpd.adaptation_sets.values():
+            for repr in adap_set.representations.values():
+                affixes = repr.segments.url_affixes
+                if affixes is None or affixes[0][-1:].isdigit() or affixes[1][:1].isdigit():
+                    self._other_sequences.append(repr.segments)
+                else:
+                    self._sequences_by_affixes[affixes] = repr.segments
+
+    @property
+    def refresh_interval(self) -> float:
+        """
+        Seconds between two refreshes of a dynamic MPD. The minimumUpdatePeriod of the MPD if specified.
+        """
+        if self.mpd is not None and self.mpd.minimum_update_period > 0:
+            return self.mpd.minimum_update_period
+        return self.update_interval
 
     @critical_task()
     async def update(self):
-        if self.mpd is not None and (time.time() - self.last_updated) < self.update_interval:
+        if self.mpd is not None and (time.time() - self.last_updated) < self.refresh_interval:
             return
-        await self.download_manager.download(DownloadRequest(self.mpd_url, DownloadType.MPD), save=True)
+        await self._refresh()
+
+    async def _refresh(self):
+        # Conditional request, so the server only sends the MPD if it changed since the last download
+        headers = {}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+        await self.download_manager.download(DownloadRequest(self.mpd_url, DownloadType.MPD, headers), save=True)
         content, size = await self.download_manager.wait_complete(self.mpd_url)
-        text = content.decode("utf-8")
-        mpd = self.parser.parse(text, url=self.mpd_url)
-        self._mpd_res.value = mpd
+        self.last_updated = time.time()
+
+        if self.mpd is not None:
+            response_headers = self.download_manager.response_headers(self.mpd_url) or {}
+            if response_headers.get(":status") == "304":
+                self.log.debug("MPD not modified")
+                return
+
+        mpd = self._parse(content)
+        if mpd.type == "dynamic":
+            # Validators for the conditional requests of the next refreshes
+            response_headers = self.download_manager.response_headers(self.mpd_url) or {}
+            self._etag = response_headers.get("etag")
+            self._last_modified = response_headers.get("last-modified")
+        if self.mpd is None:
+            self._mpd_res.value = mpd
+            for adap_set in mpd.adaptation_sets.values():
+                for repr in adap_set.representations.values():
+                    self._segments_by_url[repr.initialization] = None
+        else:
+            self._merge(mpd)
+        self._index_sequences()
+
+        async with self._mpd_update_cond:
+            self._mpd_update_cond.notify_all()
+
+    def _parse(self, content: bytes) -> MPD:
+        if self.cache is None:
+            return self.parser.parse(content.decode("utf-8"), url=self.mpd_url)
+
+        key = self.cache.key(self.mpd_url, content)
+        mpd = self.cache.get(key)
+        if mpd is not None:
+            self.log.info(f"Parsed MPD loaded from cache: {key}")
+            return mpd
+        mpd = self.parser.parse(content.decode("utf-8"), url=self.mpd_url)
+        # Dynamic MPDs change on every refresh
+        if mpd.type == "static":
+            self.cache.put(key, mpd)
+        return mpd
+
+    def _merge(self, new_mpd: MPD):
+        """
+        Merge a refreshed MPD into the current one in place.
+
+        Only the segments after the last known one are appended to each representation. Segments that are no longer
+        listed, or fell out of the time shifting window, are evicted, so the model does not grow during a live session.
+        """
+        mpd = self.mpd
+        assert mpd is not None
+        mpd.content = new_mpd.content
+        mpd.type = new_mpd.type
+        mpd.media_presentation_duration = new_mpd.media_presentation_duration
+        mpd.max_segment_duration = new_mpd.max_segment_duration
+        mpd.min_buffer_time = new_mpd.min_buffer_time
+        mpd.minimum_update_period = new_mpd.minimum_update_period
+        mpd.time_shift_buffer_depth = new_mpd.time_shift_buffer_depth
+        mpd.attrib = new_mpd.attrib
+
+        for as_id in [as_id for as_id in mpd.adaptation_sets if as_id not in new_mpd.adaptation_sets]:
+            del mpd.adaptation_sets[as_id]
+        for as_id, new_adap_set in new_mpd.adaptation_sets.items():
+            adap_set = mpd.adaptation_sets.get(as_id)
+            if adap_set is None:
+                mpd.adaptation_sets[as_id] = new_adap_set
+                continue
+            removed = [repr_id for repr_id in adap_set.representations if repr_id not in new_adap_set.representations]
+            for repr_id in removed:
+                del adap_set.representations[repr_id]
+            added = False
+            for repr_id, new_repr in new_adap_set.representations.items():
+                repr = adap_set.representations.get(repr_id)
+                if repr is None:
+                    adap_set.representations[repr_id] = new_repr
+                    added = True
+                    continue
+                segments = repr.segments
+                segments.extend(new_repr.segments)
+                if mpd.time_shift_buffer_depth is not None:
+                    end_time = segments.end_time
+                    if end_time is not None:
+                        segments.evict_ended_before(end_time - mpd.time_shift_buffer_depth)
+                elif new_repr.segments.first_number is not None:
+                    segments.evict_before(new_repr.segments.first_number)
+                repr.update_segment_bounds()
+            if removed or added:
+                adap_set.update_representations()
+            adap_set.update_segment_bounds()
+
+        # Drop the cached lookups of evicted segments and removed representations
+        segments_by_url: Dict[str, Optional[Segment]] = {}
         for adap_set in mpd.adaptation_sets.values():
             for repr in adap_set.representations.values():
-                for seg in repr.segments.values():
-                    self._segments_by_url[seg.url] = seg
-                    self._segments_by_url[seg.init_url] = None
+                segments_by_url[repr.initialization] = None
+        for url, segment in self._segments_by_url.items():
+            if segment is None:
+                continue
+            adap_set = mpd.adaptation_sets.get(segment.as_id)
+            repr = adap_set.representations.get(segment.repr_id) if adap_set is not None else None
+            if repr is not None and repr.segments.number_of(url) is not None:
+                segments_by_url[url] = segment
+        self._segments_by_url = segments_by_url
 
-        self.last_updated = time.time()
-
-    # @critical_task()
-    # async def update_repeatedly(self):
-    #     assert self._mpd is not None
-    #     while self._mpd.type == "dynamic":
-    #         await self.update()
-    #         await asyncio.sleep(self.update_interval)
-    #     self.log.info(f"MPD file changed from dynamic to {self._mpd.type}")
+    @critical_task()
+    async def update_repeatedly(self):
+        assert self.mpd is not None
+        while self.mpd.type == "dynamic":
+            await asyncio.sleep(self.refresh_interval)
+            await self._refresh()
+        self.log.info(f"MPD file changed from dynamic to {self.mpd.type}")
 
     async def run(self):
         assert self.mpd_url is not None
         await self.update()
         assert self.mpd is not None
+        if self.mpd.type == "dynamic":
+            self._task = asyncio.create_task(self.update_repeatedly(), name="TASK_MPD_UPDATE")
+
+    async def cleanup(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
 
     async def stop(self):
         self.log.info("Stopping MPD Provider")
@@ -1,13 +1,14 @@
 import logging
 import os
 import re
+import sys
 from abc import ABC, abstractmethod
 from math import ceil
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional, Tuple
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 
-from istream_player.models.mpd_objects import MPD, AdaptationSet, Representation, Segment
+from istream_player.models.mpd_objects import MPD, AdaptationSet, Representation, SegmentSequence
 
 
 class MPDParsingException(BaseException):
@@ -51,20 +52,8 @@ class DefaultMPDParser(MPDParser):
         content = self.remove_namespace_from_content(content)
         root = ElementTree.fromstring(content)
 
-        type_ = root.attrib["type"]
-        assert type_ == "static" or type_ == "dynamic"
-
         # media presentation duration
         media_presentation_duration = self.parse_iso8601_time(root.attrib.get("mediaPresentationDuration", ""))
-        self.log.info(f"{media_presentation_duration=}")
-
-        # min buffer duration
-        min_buffer_time = self.parse_iso8601_time(root.attrib.get("minBufferTime", ""))
-        self.log.info(f"{min_buffer_time=}")
-
-        # max segment duration
-        max_segment_duration = self.parse_iso8601_time(root.attrib.get("maxSegmentDuration", ""))
-        self.log.info(f"{max_segment_duration=}")
 
         period = root.find("Period")
 
@@ -82,7 +71,45 @@ class DefaultMPDParser(MPDParser):
                 )
                 adaptation_sets[adaptation_set.id] = adaptation_set
 
-        return MPD(content, url, type_, media_presentation_duration, max_segment_duration, min_buffer_time, adaptation_sets, root.attrib)
+        return self.make_mpd(content, url, root.attrib, adaptation_sets)
+
+    def make_mpd(self, content: str, url: str, attrib: Dict[str, str], adaptation_sets: Dict[int, AdaptationSet]) -> MPD:
+        """
+        Build the MPD from the attributes of the root element and the parsed adaptation sets
+        """
+        type_ = attrib["type"]
+        assert type_ == "static" or type_ == "dynamic"
+
+        # media presentation duration
+        media_presentation_duration = self.parse_iso8601_time(attrib.get("mediaPresentationDuration", ""))
+        self.log.info(f"{media_presentation_duration=}")
+
+        # min buffer duration
+        min_buffer_time = self.parse_iso8601_time(attrib.get("minBufferTime", ""))
+        self.log.info(f"{min_buffer_time=}")
+
+        # max segment duration
+        max_segment_duration = self.parse_iso8601_time(attrib.get("maxSegmentDuration", ""))
+        self.log.info(f"{max_segment_duration=}")
+
+        # Refresh period and time shifting window of live streams
+        minimum_update_period = self.parse_iso8601_time(attrib.get("minimumUpdatePeriod", ""))
+        time_shift_buffer_depth = (
+            self.parse_iso8601_time(attrib["timeShiftBufferDepth"]) if "timeShiftBufferDepth" in attrib else None
+        )
+
+        return MPD(
+            content,
+            url,
+            type_,
+            media_presentation_duration,
+            max_segment_duration,
+            min_buffer_time,
+            adaptation_sets,
+            attrib,
+            minimum_update_period,
+            time_shift_buffer_depth,
+        )
 
     def parse_adaptation_set(
         self, tree: Element, base_url, index: Optional[int], media_presentation_duration: float
@@ -108,7 +135,15 @@ class DefaultMPDParser(MPDParser):
                 representation_tree, id_, base_url, segment_template, media_presentation_duration
             )
             representations[representation.id] = representation
-        return AdaptationSet(int(id_), content_type, frame_rate, max_width, max_height, par, representations, tree.attrib)
+
+        supplemental_properties = {
+            prop.attrib["schemeIdUri"]: prop.attrib.get("value", "")
+            for prop in tree.findall("SupplementalProperty")
+            if "schemeIdUri" in prop.attrib
+        }
+        return AdaptationSet(
+            int(id_), content_type, frame_rate, max_width, max_height, par, representations, tree.attrib, supplemental_properties
+        )
 
     def parse_representation(
         self, tree: Element, as_id: int, base_url, segment_template: Optional[Element], media_presentation_duration: float
@@ -135,48 +170,42 @@ class DefaultMPDParser(MPDParser):
 
         initialization = segment_template.attrib["initialization"]
         initialization = initialization.replace("$RepresentationID$", id_)
-        initialization = base_url + initialization
-        segments: Dict[int, Segment] = {}
+        # Shared by all the segments of the representation
+        initialization = sys.intern(base_url + initialization)
 
         timescale = int(segment_template.attrib["timescale"])
         media = segment_template.attrib["media"].replace("$RepresentationID$", id_)
         start_number = int(segment_template.attrib["startNumber"])
+        segments = SegmentSequence(base_url + media, initialization, timescale, as_id, int(id_))
 
         segment_timeline = segment_template.find("SegmentTimeline")
         if segment_timeline is not None:
             num = start_number
             start_time = 0
-            for segment in segment_timeline:
-                duration = float(segment.attrib["d"]) / timescale
-                url = base_url + re.sub(r"\$Number(%\d+d)\$", r"\1", media) % num
-                if "t" in segment.attrib:
-                    start_time = float(segment.attrib["t"]) / timescale
-                segments[num] = Segment(url, initialization, duration, start_time, as_id, int(id_))
-                num += 1
-                start_time += duration
-
-                if "r" in segment.attrib:  # repeat
-                    for _ in range(int(segment.attrib["r"])):
-                        url = base_url + self.var_repl(media, {"Number": num})
-                        segments[num] = Segment(url, initialization, duration, start_time, as_id, int(id_))
-                        num += 1
-                        start_time += duration
+            for t, duration, repeat in self.timeline_entries(segment_timeline):
+                if t is not None:
+                    start_time = t
+                count = 1 + max(repeat, 0)
+                segments.add_run(num, start_time, duration, count)
+                num += count
+                start_time += count * duration
         else:
             # GPAC DASH format
-            num = start_number
-            start_time = 0
-            num_segments = ceil((media_presentation_duration * timescale) / int(segment_template.attrib["duration"]))
-            duration = float(segment_template.attrib["duration"]) / timescale
+            duration = int(segment_template.attrib["duration"])
+            num_segments = ceil((media_presentation_duration * timescale) / duration)
             self.log.debug(f"{num_segments=}, {duration=}")
-            for _ in range(num_segments):
-                url = base_url + self.var_repl(media, {"Number": num})
-                segments[num] = Segment(url, initialization, duration, start_time, as_id, int(id_))
-                num += 1
-                start_time += duration
-            # self.log.debug(segments)
+            segments.add_run(start_number, 0, duration, num_segments)
 
         return Representation(int(id_), mime, codec, bandwidth, width, height, initialization, segments, tree.attrib)
 
+    def timeline_entries(self, segment_timeline: Element) -> Iterable[Tuple[Optional[int], int, int]]:
+        """
+        Get the (t, d, r) values of the S elements of a SegmentTimeline. t is None if it is not specified.
+        """
+        for segment in segment_timeline:
+            t = int(segment.attrib["t"]) if "t" in segment.attrib else None
+            yield t, int(segment.attrib["d"]), int(segment.attrib.get("r", 0))
+
     @staticmethod
     def var_repl(s: str, vars: Dict[str, int | str]):
         def _repl(m) -> str:
@@ -0,0 +1,104 @@
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.etree.ElementTree import Element, XMLPullParser
+
+from istream_player.models.mpd_objects import MPD, AdaptationSet
+from istream_player.modules.mpd.parser import DefaultMPDParser, MPDParsingException
+
+
+class StreamingMPDParser(DefaultMPDParser):
+    """
+    MPD parser that reads the document incrementally instead of building the whole tree first.
+
+    Namespaces are stripped from every element as it is read, instead of rewriting the document. The S entries of
+    every SegmentTimeline are kept as tuples and their elements are dropped, and every AdaptationSet is parsed and
+    dropped as soon as it is complete. So the memory used does not depend on the length of the timelines.
+    """
+
+    log = logging.getLogger("StreamingMPDParser")
+
+    def __init__(self, chunk_size: int = 64 * 1024):
+        """
+        Parameters
+        ----------
+        chunk_size: int
+            Number of characters fed to the XML parser at a time
+        """
+        self.chunk_size = chunk_size
+        self._timelines: Dict[Element, List[Tuple[Optional[int], int, int]]] = {}
+
+    @staticmethod
+    def strip_namespace(element: Element):
+        if element.tag[0] == "{":
+            element.tag = element.tag.rpartition("}")[2]
+
+    def timeline_entries(self, segment_timeline: Element) -> Iterable[Tuple[Optional[int], int, int]]:
+        entries = self._timelines.pop(segment_timeline, None)
+        if entries is None:
+            return super().timeline_entries(segment_timeline)
+        return entries
+
+    def parse(self, content: str, url: str) -> MPD:
+        base_url = os.path.dirname(url) + "/"
+        parser = XMLPullParser(events=("start", "end"))
+
+        root: Optional[Element] = None
+        period: Optional[Element] = None
+        period_children = 0
+        media_presentation_duration = 0.0
+        adaptation_sets: Dict[int, AdaptationSet] = {}
+        # Ancestors of the element being read
+        stack: List[Element] = []
+
+        def handle_events():
+            nonlocal root, period, period_children, media_presentation_duration
+            for event, element in parser.read_events():
+                if event == "start":
+                    self.strip_namespace(element)
+                    if root is None:
+                        root = element
+                        media_presentation_duration = self.parse_iso8601_time(
+                            element.attrib.get("mediaPresentationDuration", "")
+                        )
+                    elif period is None and element.tag == "Period" and stack[-1] is root:
+                        # Only the first period is used
+                        period = element
+                    elif element.tag == "SegmentTimeline":
+                        self._timelines[element] = []
+                    stack.append(element)
+                    continue
+
+                stack.pop()
+                if not stack:
+                    continue
+                parent = stack[-1]
+                if element.tag == "S" and parent.tag == "SegmentTimeline" and parent in self._timelines:
+                    t = int(element.attrib["t"]) if "t" in element.attrib else None
+                    self._timelines[parent].append((t, int(element.attrib["d"]), int(element.attrib.get("r", 0))))
+                    parent.remove(element)
+                elif parent is period:
+                    index = period_children
+                    period_children += 1
+                    if element.tag == "AdaptationSet" and element.attrib.get("contentType", "video").lower() == "video":
+                        adaptation_set = self.parse_adaptation_set(element, base_url, index, media_presentation_duration)
+                        adaptation_sets[adaptation_set.id] = adaptation_set
+                    parent.remove(element)
+                elif parent is root and element.tag == "Period" and element is not period:
+                    parent.remove(element)
+
+        try:
+            for offset in range(0, len(content), self.chunk_size):
+                parser.feed(content[offset:offset + self.chunk_size])
+                handle_events()
+            parser.close()
+            handle_events()
+        finally:
+            self._timelines.clear()
+
+        if root is None:
+            raise MPDParsingException("Empty MPD")
+        if period is None:
+            raise MPDParsingException('Cannot find "Period" tag')
+
+        return self.make_mpd(content, url, root.attrib, adaptation_sets)
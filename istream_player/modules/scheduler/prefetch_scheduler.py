@@ -0,0 +1,138 @@
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict
+
+from istream_player.core.abr import ABRController
+from istream_player.core.buffer import BufferManager
+from istream_player.core.bw_meter import BandwidthMeter
+from istream_player.core.module import ModuleOption
+from istream_player.core.mpd_provider import MPDProvider
+from istream_player.models.mpd_objects import Segment
+from istream_player.modules.scheduler.scheduler import SchedulerImpl
+from istream_player.utils import critical_task
+
+
+@dataclass
+class InFlightIndex:
+    index: int
+    segments: Dict[int, Segment]
+
+    @property
+    def duration(self) -> float:
+        return max(segment.duration for segment in self.segments.values())
+
+
+@ModuleOption(
+    "prefetch", requires=["segment_downloader", BandwidthMeter, BufferManager, MPDProvider, ABRController]
+)
+class PrefetchSchedulerImpl(SchedulerImpl):
+    """
+    Scheduler that keeps requests for up to `depth` segment indices in flight.
+
+    The next index is requested as soon as there is room for it in the buffer, so the link is not idle
+    while waiting for the first bytes of every segment. Completed indices are still put into the buffer in order.
+    """
+
+    log = logging.getLogger("PrefetchSchedulerImpl")
+
+    def __init__(self, *, depth="2"):
+        super().__init__()
+        self.depth = int(depth)
+        assert self.depth >= 1, "Prefetch depth should be at least 1"
+
+        self._in_flight: Deque[InFlightIndex] = deque()
+
+    def _has_room(self) -> bool:
+        pending_duration = sum(pending.duration for pending in self._in_flight)
+        return self.buffer_manager.buffer_level + pending_duration <= self.max_buffer_duration
+
+    async def _fill_pipeline(self) -> bool:
+        """
+        Request new segment indices until `depth` of them are in flight or the buffer has no room for more
+
+        Returns
+        -------
+        has_more: bool
+            False if there are no more segments to request
+        """
+        assert self.mpd_provider.mpd is not None and self.adaptation_sets is not None
+        while len(self._in_flight) < self.depth and self._has_room():
+            if self.mpd_provider.mpd.type == "dynamic":
+                self.adaptation_sets = self.select_adaptation_sets(self.mpd_provider.mpd.adaptation_sets)
+
+            first_segment, last_segment = self.segment_limits(self.adaptation_sets)
+            if self._index < first_segment:
+                self.log.info(f"Segment {self._index} not in mpd, Moving to next segment")
+                self._index += 1
+                continue
+
+            if self.mpd_provider.mpd.type == "dynamic" and self._index > last_segment:
+                self.log.info(f"Waiting for more segments in mpd : {self.mpd_provider.mpd.type}")
+                return True
+
+            segments = await self._download_index(self._index)
+            if segments is None:
+                return False
+            self._in_flight.append(InFlightIndex(self._index, segments))
+            self._index += 1
+        return True
+
+    @critical_task()
+    async def run(self):
+        await self._wait_mpd()
+
+        # Start from the min segment index
+        self._index = self.segment_limits(self.adaptation_sets)[0]
+        has_more = True
+        while True:
+            if has_more:
+                has_more = await self._fill_pipeline()
+
+            if len(self._in_flight) == 0:
+                if not has_more:
+                    await self._set_end()
+                    return
+                if not self._has_room():
+                    await self._wait_buffer(self._has_room)
+                else:
+                    # The live MPD has no new segments yet
+                    await self._wait_segment_available(self._index)
+                continue
+
+            head = self._in_flight[0]
+            urls = [segment.url for segment in head.segments.values()]
+            self.log.info(f"Waiting for completion urls {urls}")
+            results = [await self.download_manager.wait_complete(url) for url in urls]
+            self.log.info(f"Completed downloading from urls {urls}")
+            self._in_flight.popleft()
+
+            if any([result is None for result in results]):
+                # Result is None means the stream got dropped. Request the index again at the lowest quality.
+                self._dropped_index = head.index
+                segments = await self._download_index(head.index)
+                assert segments is not None
+                self._in_flight.appendleft(InFlightIndex(head.index, segments))
+                continue
+
+            await self._complete_index(head.index, head.segments)
+
+    async def cancel_task(self, index: int):
+        """
+        Stop downloading the segments of an in-flight index
+
+        Parameters
+        ----------
+        index: int
+            The index of segment to cancel
+        """
+        # Do not cancel the task for the first index
+        if index == 0:
+            return
+
+        for pending in self._in_flight:
+            if pending.index == index:
+                for segment in pending.segments.values():
+                    self.log.debug(f"Stop current downloading URL: {segment.url}")
+                    await self.download_manager.stop(segment.url)
+                return
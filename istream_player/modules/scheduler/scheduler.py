@@ -1,8 +1,8 @@
 import asyncio
-import itertools
 import logging
+import time
 from asyncio import Task
-from typing import Dict, Optional, Set
+from typing import Callable, Dict, Optional, Set
 
 from istream_player.config.config import PlayerConfig
 from istream_player.core.abr import ABRController
@@ -14,6 +14,7 @@ from istream_player.core.module import Module, ModuleOption
 from istream_player.core.mpd_provider import MPDProvider
 from istream_player.core.scheduler import Scheduler, SchedulerEventListener
 from istream_player.models import AdaptationSet
+from istream_player.models.mpd_objects import Segment
 from istream_player.utils import critical_task
 
 
@@ -30,6 +31,7 @@ class SchedulerImpl(Module, Scheduler):
         self.started = False
 
         self._task: Optional[Task] = None
+        self._warm_up_task: Optional[Task] = None
         self._index = 0
         self._representation_initialized: Set[str] = set()
         self._current_selections: Optional[Dict[int, int]] = None
@@ -49,6 +51,7 @@ class SchedulerImpl(Module, Scheduler):
         self.max_buffer_duration = config.buffer_duration
         self.update_interval = config.static.update_interval
         self.time_factor = config.time_factor
+        self.mpd_url = config.input
 
         self.download_manager = segment_downloader
         self.bandwidth_meter = bandwidth_meter
@@ -71,33 +74,39 @@ class SchedulerImpl(Module, Scheduler):
             raise Exception("select_as should be of the format '<uint>-<uint>' or '<uint>'.")
 
     def segment_limits(self, adap_sets: Dict[int, AdaptationSet]) -> tuple[int, int]:
-        ids = [
-            [[seg_id for seg_id in repr.segments.keys()] for repr in as_val.representations.values()]
-            for as_val in adap_sets.values()
-        ]
-        ids = itertools.chain(*ids)
-        ids = list(itertools.chain(*ids))
-        # print(adap_sets, ids)
-        return min(ids), max(ids)
+        """
+        Get the first and the last segment number over the given adaptation sets.
+        It uses the bounds cached in the MPD model, so the cost does not depend on the number of segments.
+        """
+        firsts = [as_val.first_segment_num for as_val in adap_sets.values() if as_val.first_segment_num is not None]
+        lasts = [as_val.last_segment_num for as_val in adap_sets.values() if as_val.last_segment_num is not None]
+        return min(firsts), max(lasts)
 
-    @critical_task()
-    async def run(self):
+    async def _wait_mpd(self):
+        """
+        Wait for the MPD and select the adaptation sets to play
+        """
+        # Connect the segment downloader while the MPD is downloaded, the segments are usually on the same origin
+        self._warm_up_task = asyncio.create_task(self.download_manager.warm_up(self.mpd_url))
         await self.mpd_provider.available()
         assert self.mpd_provider.mpd is not None
         self.adaptation_sets = self.select_adaptation_sets(self.mpd_provider.mpd.adaptation_sets)
+
+    @critical_task()
+    async def run(self):
+        await self._wait_mpd()
         # print(f"{self.adaptation_sets=}")
 
         # Start from the min segment index
         self._index = self.segment_limits(self.adaptation_sets)[0]
         while True:
-            # Check buffer level
+            # Wait till the buffer has room for one more segment
             if self.buffer_manager.buffer_level > self.max_buffer_duration:
-                await asyncio.sleep(self.time_factor * self.update_interval)
-                continue
+                await self._wait_buffer(lambda: self.buffer_manager.buffer_level <= self.max_buffer_duration)
 
             assert self.mpd_provider.mpd is not None
             if self.mpd_provider.mpd.type == "dynamic":
-                await self.mpd_provider.update()
+                # The MPD provider keeps refreshing dynamic MPDs in background
                 self.adaptation_sets = self.select_adaptation_sets(self.mpd_provider.mpd.adaptation_sets)
 
             # last_segment = max(self.adaptation_sets[0].representations[0].segments.keys())
@@ -112,55 +121,16 @@ class SchedulerImpl(Module, Scheduler):
 
             if self.mpd_provider.mpd.type == "dynamic" and self._index > last_segment:
                 self.log.info(f"Waiting for more segments in mpd : {self.mpd_provider.mpd.type}")
-                await asyncio.sleep(self.time_factor * self.update_interval)
+                await self._wait_segment_available(self._index)
                 continue
 
             # Download one segment from each adaptation set
-            if self._index == self._dropped_index:
-                selections = self.abr_controller.update_selection_lowest(self.adaptation_sets)
-            else:
-                selections = self.abr_controller.update_selection(self.adaptation_sets, self._index)
-            self.log.info(f"Downloading index {self._index} at {selections}")
-            self._current_selections = selections
-
-            # All adaptation sets take the current bandwidth
-            adap_bw = {as_id: self.bandwidth_meter.bandwidth for as_id in selections.keys()}
-
-            # Get segments to download for each adaptation set
-            try:
-                segments = {
-                    adaptation_set_id: self.adaptation_sets[adaptation_set_id].representations[selection].segments[self._index]
-                    for adaptation_set_id, selection in selections.items()
-                }
-            except KeyError:
-                # No more segments left
-                self.log.info("No more segments left")
-                self._end = True
+            segments = await self._download_index(self._index)
+            if segments is None:
+                await self._set_end()
                 return
 
-            for listener in self.listeners:
-                await listener.on_segment_download_start(self._index, adap_bw, segments)
-
-            # duration = 0
-            urls = []
-            for adaptation_set_id, selection in selections.items():
-                adaptation_set = self.adaptation_sets[adaptation_set_id]
-                representation = adaptation_set.representations[selection]
-                representation_str = "%d:%d" % (adaptation_set_id, representation.id)
-                if representation_str not in self._representation_initialized:
-                    await self.download_manager.download(DownloadRequest(representation.initialization, DownloadType.STREAM_INIT))
-                    await self.download_manager.wait_complete(representation.initialization)
-                    self.log.info(f"Segment {self._index} Complete. Move to next segment")
-                    self._representation_initialized.add(representation_str)
-                try:
-                    segment = representation.segments[self._index]
-                except IndexError:
-                    self.log.info("Segments ended")
-                    self._end = True
-                    return
-                urls.append(segment.url)
-                await self.download_manager.download(DownloadRequest(segment.url, DownloadType.SEGMENT))
-                # duration = segment.duration
+            urls = [segment.url for segment in segments.values()]
             self.log.info(f"Waiting for completion urls {urls}")
             results = [await self.download_manager.wait_complete(url) for url in urls]
             self.log.info(f"Completed downloading from urls {urls}")
@@ -168,11 +138,94 @@ class SchedulerImpl(Module, Scheduler):
                 # Result is None means the stream got dropped
                 self._dropped_index = self._index
                 continue
-            download_stats = {as_id: self.bandwidth_meter.get_stats(segment.url) for as_id, segment in segments.items()}
-            for listener in self.listeners:
-                await listener.on_segment_download_complete(self._index, segments, download_stats)
+            await self._complete_index(self._index, segments)
             self._index += 1
-            await self.buffer_manager.enqueue_buffer(segments)
+
+    async def _wait_buffer(self, predicate: Callable[[], bool]):
+        """Block till the predicate on the buffer state holds. Re-evaluated on every buffer level change."""
+        async with self.buffer_manager.buffer_change_cond:
+            await self.buffer_manager.buffer_change_cond.wait_for(predicate)
+
+    async def _wait_segment_available(self, index: int):
+        """Block till a refreshed MPD contains the segment index, or the MPD is no longer dynamic"""
+
+        def available():
+            mpd = self.mpd_provider.mpd
+            assert mpd is not None
+            return mpd.type != "dynamic" or index <= self.segment_limits(self.select_adaptation_sets(mpd.adaptation_sets))[1]
+
+        async with self.mpd_provider.mpd_update_cond:
+            await self.mpd_provider.mpd_update_cond.wait_for(available)
+
+    async def _set_end(self):
+        self._end = True
+        # Wake up whoever is waiting on the buffer for the end of the stream
+        async with self.buffer_manager.buffer_change_cond:
+            self.buffer_manager.buffer_change_cond.notify_all()
+
+    async def _download_index(self, index: int) -> Optional[Dict[int, Segment]]:
+        """
+        Select the representations for a segment index and start downloading one segment from each adaptation set
+
+        Parameters
+        ----------
+        index: int
+            The segment index to download
+
+        Returns
+        -------
+        segments: Dict[int, Segment], optional
+            The segments being downloaded by adaptation set id. None if there are no more segments.
+        """
+        assert self.adaptation_sets is not None
+        decision_start = time.perf_counter()
+        if index == self._dropped_index:
+            selections = self.abr_controller.update_selection_lowest(self.adaptation_sets)
+        else:
+            selections = self.abr_controller.update_selection(self.adaptation_sets, index)
+        self.log.debug(f"ABR decision for index {index} took {(time.perf_counter() - decision_start) * 1000:.3f} ms")
+        self.log.info(f"Downloading index {index} at {selections}")
+        self._current_selections = selections
+
+        # All adaptation sets take the current bandwidth
+        adap_bw = {as_id: self.bandwidth_meter.bandwidth for as_id in selections.keys()}
+
+        # Get segments to download for each adaptation set
+        try:
+            segments = {
+                adaptation_set_id: self.adaptation_sets[adaptation_set_id].representations[selection].segments[index]
+                for adaptation_set_id, selection in selections.items()
+            }
+        except KeyError:
+            # No more segments left
+            self.log.info("No more segments left")
+            return None
+
+        for listener in self.listeners:
+            await listener.on_segment_download_start(index, adap_bw, segments)
+
+        for adaptation_set_id, selection in selections.items():
+            adaptation_set = self.adaptation_sets[adaptation_set_id]
+            representation = adaptation_set.representations[selection]
+            representation_str = "%d:%d" % (adaptation_set_id, representation.id)
+            if representation_str not in self._representation_initialized:
+                await self.download_manager.download(
+                    DownloadRequest(representation.initialization, DownloadType.STREAM_INIT, as_id=adaptation_set_id)
+                )
+                await self.download_manager.wait_complete(representation.initialization)
+                self.log.info(f"Segment {index} Complete. Move to next segment")
+                self._representation_initialized.add(representation_str)
+            await self.download_manager.download(
+                DownloadRequest(segments[adaptation_set_id].url, DownloadType.SEGMENT, as_id=adaptation_set_id)
+            )
+        return segments
+
+    async def _complete_index(self, index: int, segments: Dict[int, Segment]):
+        """Notify the listeners about a completely downloaded segment index and put it into the buffer"""
+        download_stats = {as_id: self.bandwidth_meter.get_stats(segment.url) for as_id, segment in segments.items()}
+        for listener in self.listeners:
+            await listener.on_segment_download_complete(index, segments, download_stats)
+        await self.buffer_manager.enqueue_buffer(segments)
 
     def select_adaptation_sets(self, adaptation_sets: Dict[int, AdaptationSet]):
         as_ids = adaptation_sets.keys()
@@ -185,6 +238,8 @@ class SchedulerImpl(Module, Scheduler):
         await self.download_manager.close()
         if self._task is not None:
             self._task.cancel()
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
 
     @property
     def is_end(self):
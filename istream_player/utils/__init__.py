@@ -1 +1,2 @@
 from .async_utils import *  # noqa
+from .chunked_buffer import *  # noqa
@@ -0,0 +1,57 @@
+from typing import List, Optional, Union
+
+
+class ChunkedBuffer:
+    """
+    Accumulates a response body chunk by chunk.
+
+    When the size is known upfront, chunks are written into a single preallocated bytearray, so every
+    received byte is copied exactly once. Otherwise the received chunks are only referenced and joined
+    once when the body is requested.
+
+    The body returned by getvalue() can be the internal bytearray, so it must be treated as read-only. It never
+    changes afterwards: the chunks appended later are kept aside.
+    """
+
+    def __init__(self, size_hint: Optional[int] = None) -> None:
+        self._length = 0
+        self._buffer: Optional[bytearray] = bytearray(size_hint) if size_hint else None
+        self._view: Optional[memoryview] = memoryview(self._buffer) if self._buffer is not None else None
+        self._chunks: List[memoryview] = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, chunk: bytes) -> None:
+        size = len(chunk)
+        if self._view is not None and self._length + size <= len(self._view):
+            self._view[self._length:self._length + size] = chunk
+        else:
+            if self._buffer is not None:
+                # Received more than announced. Fall back to referencing chunks.
+                self._flush_preallocated()
+            self._chunks.append(memoryview(chunk))
+        self._length += size
+
+    def _flush_preallocated(self):
+        assert self._buffer is not None and self._view is not None
+        self._view.release()
+        del self._buffer[self._length:]
+        self._chunks = [memoryview(self._buffer)]
+        self._buffer = None
+        self._view = None
+
+    def getvalue(self) -> Union[bytes, bytearray]:
+        """
+        Return the accumulated body, read-only.
+
+        The preallocated buffer is handed back as is (trimmed to the received length) without copying.
+        """
+        if self._buffer is not None:
+            # Stop writing into the buffer handed back, the next chunks are referenced aside
+            self._flush_preallocated()
+        if len(self._chunks) == 1:
+            chunk = self._chunks[0].obj
+            if isinstance(chunk, (bytes, bytearray)) and len(chunk) == self._length:
+                return chunk
+        return b"".join(self._chunks)
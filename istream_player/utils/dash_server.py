@@ -0,0 +1,447 @@
+import argparse
+import asyncio
+import datetime
+import functools
+import ipaddress
+import logging
+import mimetypes
+import os
+import ssl
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from aioquic.asyncio import QuicConnectionProtocol, serve
+from aioquic.asyncio.server import QuicServer
+from aioquic.h3.connection import H3_ALPN, H3Connection
+from aioquic.h3.events import HeadersReceived
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.events import ConnectionTerminated, ProtocolNegotiated, QuicEvent, StreamReset
+from aioquic.tls import SessionTicket
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import ConnectionTerminated as H2ConnectionTerminated
+from h2.events import RemoteSettingsChanged, RequestReceived, WindowUpdated
+from h2.events import StreamReset as H2StreamReset
+from h2.exceptions import ProtocolError
+
+from istream_player.modules.downloader.network_emulator import NetworkCondition, NetworkEmulator, NetworkProfile
+
+
+def generate_certificate(directory: str, host: str = "localhost") -> Tuple[str, str]:
+    """
+    Write a self-signed certificate for localhost and its private key to the directory
+
+    Returns
+    -------
+    files: Tuple[str, str]
+        The paths of the certificate and of the key, in PEM
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=7))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [
+                    x509.DNSName(host),
+                    x509.DNSName("localhost"),
+                    x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+                    x509.IPAddress(ipaddress.ip_address("::1")),
+                ]
+            ),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+        )
+    return certfile, keyfile
+
+
+class DashServer(object):
+    """
+    A static file server for DASH datasets, to test and benchmark the downloaders without a server container.
+
+    The files under `root` are served on localhost over HTTP/1.1 (aiohttp), HTTP/2 over TLS (h2) and
+    HTTP/3 (aioquic), with a self-signed certificate. Every protocol is started on its own port, 0 picking a free
+    one, and the URL of a file is `base_url(protocol) + path relative to root`.
+
+    All the responses share one emulated link, shaped with a network profile like LocalClient does: a request waits
+    for the latency before its first byte, and every chunk of the body waits for its transmission.
+    """
+
+    log = logging.getLogger("DashServer")
+
+    def __init__(
+        self,
+        root: str,
+        host: str = "127.0.0.1",
+        profile: Optional[NetworkProfile] = None,
+        time_factor: float = 1,
+        chunk_size: int = 16_384,
+    ):
+        """
+        Parameters
+        ----------
+        root: str
+            The dataset directory
+        host: str
+            The address to listen on
+        profile: NetworkProfile, optional
+            The network conditions to emulate. Without a profile the files are sent as fast as possible.
+        time_factor: float
+            The speed of the clock of the emulated network, as in the player configuration. With 0 the profile is
+            followed without waiting.
+        chunk_size: int
+            The size in bytes of the chunks the bodies are written in
+        """
+        self.root = Path(root).resolve()
+        self.host = host
+        self.chunk_size = chunk_size
+        self.emulator = NetworkEmulator(profile, time_factor) if profile is not None else None
+
+        self.ports: Dict[str, int] = {}
+        self._tempdir: Optional[tempfile.TemporaryDirectory] = None
+        self._certificate: Optional[Tuple[str, str]] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._h2_server: Optional[asyncio.AbstractServer] = None
+        self._h3_server: Optional[QuicServer] = None
+        # Session tickets issued by the HTTP/3 server, so the clients can resume their sessions with 0-RTT
+        self._session_tickets: Dict[bytes, SessionTicket] = {}
+
+    @staticmethod
+    def shaped(bw: float, latency: float = 0, drop: float = 0) -> NetworkProfile:
+        """
+        Returns
+        -------
+        profile: NetworkProfile
+            Constant network conditions, with the bandwidth in bytes per second and the one-way latency in seconds
+        """
+        return NetworkProfile([NetworkCondition(bw, latency, drop)])
+
+    @property
+    def certificate(self) -> Tuple[str, str]:
+        """The files of the self-signed certificate and of its key, generated on first use"""
+        if self._certificate is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="dash-server-")
+            self._certificate = generate_certificate(self._tempdir.name)
+        return self._certificate
+
+    def base_url(self, protocol: str) -> str:
+        """
+        Returns
+        -------
+        url: str
+            The URL of the root directory over "http", "h2" or "h3", ending with a slash
+        """
+        host = f"[{self.host}]" if ":" in self.host else self.host
+        scheme = "http" if protocol == "http" else "https"
+        return f"{scheme}://{host}:{self.ports[protocol]}/"
+
+    def resolve(self, path: str) -> Optional[Path]:
+        """
+        Returns
+        -------
+        file: Path, optional
+            The file of the request path, or None if it is not a file under the root
+        """
+        file = self.root.joinpath(path.split("?", 1)[0].lstrip("/")).resolve()
+        if not file.is_relative_to(self.root) or not file.is_file():
+            return None
+        return file
+
+    def headers(self, file: Path) -> Dict[str, str]:
+        content_type, _ = mimetypes.guess_type(file.name)
+        return {
+            "content-type": content_type or "application/octet-stream",
+            "content-length": str(file.stat().st_size),
+        }
+
+    def chunks(self, file: Path) -> Iterator[bytes]:
+        with open(file, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def request_latency(self):
+        if self.emulator is not None:
+            await self.emulator.request_latency()
+
+    async def transmit(self, chunk: bytes):
+        if self.emulator is not None:
+            await self.emulator.transmit(len(chunk))
+
+    async def start(self, http: Optional[int] = 0, h2: Optional[int] = None, h3: Optional[int] = 0):
+        """
+        Start the servers of the protocols whose port is not None
+        """
+        if self.emulator is not None:
+            self.emulator.start()
+        if http is not None:
+            await self.start_http(http)
+        if h2 is not None:
+            await self.start_h2(h2)
+        if h3 is not None:
+            await self.start_h3(h3)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._h2_server is not None:
+            self._h2_server.close()
+            self._h2_server = None
+        if self._h3_server is not None:
+            self._h3_server.close()
+            self._h3_server = None
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+            self._certificate = None
+        self.ports.clear()
+
+    async def __aenter__(self) -> "DashServer":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    # HTTP/1.1
+
+    async def start_http(self, port: int = 0) -> int:
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self._handle_http)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, port)
+        await site.start()
+        self.ports["http"] = self._runner.addresses[0][1]
+        self.log.info(f"HTTP/1.1 server listening on {self.base_url('http')}")
+        return self.ports["http"]
+
+    async def _handle_http(self, request: web.Request) -> web.StreamResponse:
+        file = self.resolve(request.path)
+        if file is None:
+            raise web.HTTPNotFound()
+        await self.request_latency()
+        response = web.StreamResponse(headers=self.headers(file))
+        await response.prepare(request)
+        for chunk in self.chunks(file):
+            await self.transmit(chunk)
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    # HTTP/2
+
+    async def start_h2(self, port: int = 0) -> int:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(*self.certificate)
+        ssl_context.set_alpn_protocols(["h2"])
+        loop = asyncio.get_running_loop()
+        self._h2_server = await loop.create_server(lambda: _H2ServerProtocol(self), self.host, port, ssl=ssl_context)
+        self.ports["h2"] = self._h2_server.sockets[0].getsockname()[1]
+        self.log.info(f"HTTP/2 server listening on {self.base_url('h2')}")
+        return self.ports["h2"]
+
+    # HTTP/3
+
+    def _fetch_session_ticket(self, label: bytes) -> Optional[SessionTicket]:
+        # A ticket is used once
+        return self._session_tickets.pop(label, None)
+
+    def _store_session_ticket(self, ticket: SessionTicket) -> None:
+        self._session_tickets[ticket.ticket] = ticket
+
+    async def start_h3(self, port: int = 0) -> int:
+        configuration = QuicConfiguration(alpn_protocols=H3_ALPN, is_client=False, max_datagram_frame_size=65536)
+        configuration.load_cert_chain(*self.certificate)
+        self._h3_server = await serve(
+            self.host,
+            port,
+            configuration=configuration,
+            create_protocol=functools.partial(_H3ServerProtocol, server=self),
+            session_ticket_fetcher=self._fetch_session_ticket,
+            session_ticket_handler=self._store_session_ticket,
+        )
+        self.ports["h3"] = self._h3_server._transport.get_extra_info("sockname")[1]
+        self.log.info(f"HTTP/3 server listening on {self.base_url('h3')}")
+        return self.ports["h3"]
+
+
+class _H2ServerProtocol(asyncio.Protocol):
+    def __init__(self, server: DashServer):
+        self.server = server
+        self.conn = H2Connection(config=H2Configuration(client_side=False, header_encoding="utf-8"))
+        self.transport: Optional[asyncio.Transport] = None
+        self.tasks: Dict[int, asyncio.Task] = {}
+        # Set when the peer opens its flow control windows
+        self.window_updated = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.flush()
+
+    def connection_lost(self, exc):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def data_received(self, data: bytes):
+        try:
+            events = self.conn.receive_data(data)
+        except ProtocolError:
+            self.flush()
+            if self.transport is not None:
+                self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, RequestReceived):
+                headers = dict(event.headers)
+                task = asyncio.create_task(self.respond(event.stream_id, headers))
+                self.tasks[event.stream_id] = task
+                task.add_done_callback(lambda _, stream_id=event.stream_id: self.tasks.pop(stream_id, None))
+            elif isinstance(event, (WindowUpdated, RemoteSettingsChanged)):
+                self.window_updated.set()
+            elif isinstance(event, H2StreamReset):
+                task = self.tasks.pop(event.stream_id, None)
+                if task is not None:
+                    task.cancel()
+            elif isinstance(event, H2ConnectionTerminated):
+                if self.transport is not None:
+                    self.transport.close()
+        self.flush()
+
+    async def respond(self, stream_id: int, headers: Dict[str, str]):
+        file = self.server.resolve(headers.get(":path", "/"))
+        if file is None:
+            self.conn.send_headers(stream_id, [(":status", "404")], end_stream=True)
+            self.flush()
+            return
+        await self.server.request_latency()
+        try:
+            self.conn.send_headers(stream_id, [(":status", "200")] + list(self.server.headers(file).items()))
+            self.flush()
+            for chunk in self.server.chunks(file):
+                await self.server.transmit(chunk)
+                while chunk:
+                    window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                    if window <= 0:
+                        self.window_updated.clear()
+                        await self.window_updated.wait()
+                        continue
+                    self.conn.send_data(stream_id, chunk[:window])
+                    chunk = chunk[window:]
+                    self.flush()
+            self.conn.end_stream(stream_id)
+            self.flush()
+        except ProtocolError:
+            # The stream was reset, or the connection is going away
+            pass
+
+
+class _H3ServerProtocol(QuicConnectionProtocol):
+    def __init__(self, *args, server: DashServer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server
+        self._http: Optional[H3Connection] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def quic_event_received(self, event: QuicEvent):
+        if isinstance(event, ProtocolNegotiated):
+            self._http = H3Connection(self._quic)
+        elif isinstance(event, StreamReset):
+            task = self._tasks.pop(event.stream_id, None)
+            if task is not None:
+                task.cancel()
+        elif isinstance(event, ConnectionTerminated):
+            for task in self._tasks.values():
+                task.cancel()
+            self._tasks.clear()
+
+        if self._http is None:
+            return
+        for http_event in self._http.handle_event(event):
+            if isinstance(http_event, HeadersReceived):
+                headers = {key.decode(): value.decode() for key, value in http_event.headers}
+                task = asyncio.create_task(self.respond(http_event.stream_id, headers))
+                self._tasks[http_event.stream_id] = task
+                task.add_done_callback(lambda _, stream_id=http_event.stream_id: self._tasks.pop(stream_id, None))
+
+    async def respond(self, stream_id: int, headers: Dict[str, str]):
+        assert self._http is not None
+        file = self.server.resolve(headers.get(":path", "/"))
+        if file is None:
+            self._http.send_headers(stream_id, [(b":status", b"404")], end_stream=True)
+            self.transmit()
+            return
+        await self.server.request_latency()
+        self._http.send_headers(
+            stream_id, [(b":status", b"200")] + [(k.encode(), v.encode()) for k, v in self.server.headers(file).items()]
+        )
+        for chunk in self.server.chunks(file):
+            await self.server.transmit(chunk)
+            self._http.send_data(stream_id, chunk, end_stream=False)
+            self.transmit()
+            # Let the other streams and the acknowledgements in
+            await asyncio.sleep(0)
+        self._http.send_data(stream_id, b"", end_stream=True)
+        self.transmit()
+
+
+async def main():
+    parser = argparse.ArgumentParser("Serve a DASH dataset over HTTP/1.1, HTTP/2 and HTTP/3 on localhost")
+    parser.add_argument("root", type=str, help="The dataset directory")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--http", type=int, default=8080, help="HTTP/1.1 port. -1 to disable")
+    parser.add_argument("--h2", type=int, default=8443, help="HTTP/2 port. -1 to disable")
+    parser.add_argument("--h3", type=int, default=4433, help="HTTP/3 port. -1 to disable")
+    parser.add_argument("--bw", type=float, help="Constant bandwidth in kbit/s")
+    parser.add_argument("--latency", type=float, default=0, help="One-way latency in ms, with --bw")
+    parser.add_argument("--profile", type=str, help="Network profile file, in the format of NetworkManager")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profile = None
+    if args.profile is not None:
+        profile = NetworkProfile.load(args.profile)
+    elif args.bw is not None:
+        profile = DashServer.shaped(args.bw * 1000 / 8, args.latency / 1000)
+
+    ports: List[Optional[int]] = [port if port >= 0 else None for port in (args.http, args.h2, args.h3)]
+    async with DashServer(args.root, args.host, profile) as server:
+        await server.start(*ports)
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
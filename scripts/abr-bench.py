@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.abr import ABRController
+from istream_player.core.buffer import BufferManager
+from istream_player.core.bw_meter import BandwidthMeter, DownloadStats
+from istream_player.core.module import Module
+from istream_player.core.module_composer import PlayerComposer, get_mod_name, get_mod_props
+from istream_player.core.mpd_provider import MPDProvider
+from istream_player.core.scheduler import Scheduler
+from istream_player.models.mpd_objects import MPD, Segment
+from istream_player.modules.mpd.parser import DefaultMPDParser
+
+
+class TraceBandwidthMeter(BandwidthMeter):
+    """
+    Bandwidth meter fed with the throughput of the simulated downloads, smoothed like the default meter
+    """
+
+    def __init__(self, initial_bw: float, smoothing_factor: float):
+        super().__init__()
+        self._bw = initial_bw
+        self.smoothing_factor = smoothing_factor
+
+    @property
+    def bandwidth(self) -> float:
+        return self._bw
+
+    def get_stats(self, url: str) -> DownloadStats:
+        raise KeyError(url)
+
+    async def add_sample(self, throughput: float):
+        self._bw = self._bw * self.smoothing_factor + throughput * (1 - self.smoothing_factor)
+        for listener in self.listeners:
+            await listener.on_bandwidth_update(self._bw)
+
+
+class SimulatedBuffer(BufferManager):
+    """
+    Buffer whose level is set by the simulation. The last segments of the simulated downloads that fit in the buffer
+    are queued, so an ABR can look at them, but the level does not follow them.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__()
+        self.level = 0.0
+        self._segments: Deque[Dict[int, Segment]] = deque(maxlen=max(capacity, 1))
+        self._buffer_change_cond = asyncio.Condition()
+
+    @property
+    def buffer_level(self) -> float:
+        return self.level
+
+    @property
+    def buffer_change_cond(self) -> asyncio.Condition:
+        return self._buffer_change_cond
+
+    async def enqueue_buffer(self, segments: Dict[int, Segment]) -> None:
+        self._segments.append(segments)
+
+    def get_next_segment(self) -> Tuple[Dict[int, Segment], float]:
+        segments = self._segments[0]
+        return segments, max(segment.duration for segment in segments.values())
+
+    async def dequeue_buffer(self):
+        self._segments.popleft()
+
+    def is_empty(self) -> bool:
+        return self.level <= 0
+
+
+class StaticMPDProvider(MPDProvider):
+    def __init__(self, mpd: MPD):
+        self._mpd = mpd
+        # Never notified, the MPD does not change
+        self._mpd_update_cond = asyncio.Condition()
+
+    @property
+    def mpd(self) -> Optional[MPD]:
+        return self._mpd
+
+    @property
+    def mpd_update_cond(self) -> asyncio.Condition:
+        return self._mpd_update_cond
+
+    async def stop(self):
+        pass
+
+    async def update(self):
+        pass
+
+    async def available(self) -> MPD:
+        return self._mpd
+
+    def segment_by_url(self, url: str) -> Optional[Segment]:
+        for adaptation_set in self._mpd.adaptation_sets.values():
+            for representation in adaptation_set.representations.values():
+                number = representation.segments.number_of(url)
+                if number is not None:
+                    return representation.segments[number]
+        raise KeyError(url)
+
+
+class SimulatedScheduler(Scheduler):
+    """
+    Scheduler whose listeners are notified of the simulated downloads
+    """
+
+    async def complete_index(self, index: int, segments: Dict[int, Segment], stats: Dict[int, DownloadStats]):
+        for listener in self.listeners:
+            await listener.on_segment_download_complete(index, segments, stats)
+
+    async def stop(self):
+        pass
+
+    @property
+    def is_end(self):
+        return False
+
+    async def cancel_task(self, index):
+        pass
+
+    async def drop_index(self, index):
+        pass
+
+
+def load_trace(path: str) -> List[float]:
+    """
+    Load the link throughput of every segment index, in bps, from the results dumped by PlaybackAnalyzer
+    """
+    with open(path) as f:
+        data = json.load(f)
+    throughputs: Dict[int, float] = {}
+    for segment in data["segments"]:
+        if segment.get("segment_throughput") is not None:
+            # Segments of one index are downloaded together and share the link
+            throughputs[segment["index"]] = throughputs.get(segment["index"], 0) + segment["segment_throughput"]
+    return [throughputs[index] for index in sorted(throughputs)]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(round(p / 100 * (len(sorted_values) - 1)), len(sorted_values) - 1)]
+
+
+async def run_session(
+    composer: PlayerComposer, abr_spec: str, mpd: MPD, trace: List[float], config: PlayerConfig, rebuffer_penalty: float
+) -> Tuple[List[float], Dict[str, float]]:
+    """
+    Play the MPD once with the ABR module, downloading every segment index at the throughput of the trace
+
+    Returns
+    -------
+    results: Tuple[List[float], Dict[str, float]]
+        The latency of every decision in seconds, and the QoE metrics of the session
+    """
+    abr: Module = composer.module_options["abr"][get_mod_name(abr_spec)](**get_mod_props(abr_spec))
+    assert isinstance(abr, ABRController)
+    bandwidth_meter = TraceBandwidthMeter(config.static.max_initial_bitrate, config.static.smoothing_factor)
+    buffer = SimulatedBuffer(math.ceil(config.buffer_duration / mpd.max_segment_duration))
+    mpd_provider = StaticMPDProvider(mpd)
+    scheduler = SimulatedScheduler()
+    fakes = {BandwidthMeter: bandwidth_meter, BufferManager: buffer, MPDProvider: mpd_provider, Scheduler: scheduler}
+    deps = []
+    for req in abr.__class__.__mod_requires__:
+        dep = next((fake for interface, fake in fakes.items() if not isinstance(req, str) and issubclass(interface, req)), None)
+        if dep is None:
+            raise Exception(f"Module dependency not simulated : {req}")
+        deps.append(dep)
+    await abr.setup(config, *deps)
+
+    adaptation_sets = mpd.adaptation_sets
+    first = min(a.first_segment_num for a in adaptation_sets.values() if a.first_segment_num is not None)
+    last = max(a.last_segment_num for a in adaptation_sets.values() if a.last_segment_num is not None)
+
+    latencies: List[float] = []
+    bitrates: List[float] = []
+    switches = 0.0
+    rebuffering = 0.0
+    last_selections: Optional[Dict[int, int]] = None
+    # Simulated time of the session, in seconds
+    clock = 0.0
+    for step, index in enumerate(range(first, last + 1)):
+        start = time.perf_counter()
+        selections = abr.update_selection(adaptation_sets, index)
+        latencies.append(time.perf_counter() - start)
+
+        bitrate = sum(adaptation_sets[as_id].representations[repr_id].bandwidth for as_id, repr_id in selections.items())
+        if last_selections is not None:
+            switches += sum(
+                abs(adaptation_sets[as_id].representations[repr_id].bandwidth
+                    - adaptation_sets[as_id].representations[last_selections[as_id]].bandwidth)
+                for as_id, repr_id in selections.items()
+                if as_id in last_selections
+            )
+        last_selections = selections
+        bitrates.append(bitrate)
+
+        # Download the segments of the index, then wait for room in the buffer
+        throughput = trace[step % len(trace)]
+        download_time = bitrate * mpd.max_segment_duration / throughput
+        rebuffering += max(download_time - buffer.level, 0)
+        buffer.level = min(max(buffer.level - download_time, 0) + mpd.max_segment_duration, config.buffer_duration)
+        segments: Dict[int, Segment] = {}
+        stats: Dict[int, DownloadStats] = {}
+        for as_id, repr_id in selections.items():
+            representation = adaptation_sets[as_id].representations[repr_id]
+            segment = representation.segments.get(index)
+            if segment is None:
+                continue
+            size = int(representation.bandwidth * segment.duration / 8)
+            segments[as_id] = segment
+            stats[as_id] = DownloadStats(
+                total_bytes=size,
+                received_bytes=size,
+                start_time=clock,
+                stop_time=clock + download_time,
+                first_byte_at=clock,
+                last_byte_at=clock + download_time,
+            )
+        clock += download_time
+        await scheduler.complete_index(index, segments, stats)
+        if segments:
+            await buffer.enqueue_buffer(segments)
+        await bandwidth_meter.add_sample(throughput)
+
+    qoe = {
+        "avg_bitrate": statistics.mean(bitrates),
+        "switches": switches,
+        "rebuffering": rebuffering,
+        "qoe": (sum(bitrates) - switches) / 1e6 - rebuffer_penalty * rebuffering,
+    }
+    return latencies, qoe
+
+
+async def main():
+    parser = argparse.ArgumentParser("Benchmark ABR modules offline, without a player")
+    parser.add_argument("mpd", type=str, help="The MPD file")
+    parser.add_argument(
+        "--abr", type=str, nargs="*", help="ABR modules to compare, with their props like bola:min_buffer=2. Default: all"
+    )
+    parser.add_argument("--trace", type=str, help="Results dumped by the data_collector analyzer to replay")
+    parser.add_argument(
+        "--bandwidth", type=float, nargs="*", default=[1_000_000], help="Throughput of the successive indices in bps, without a trace"
+    )
+    parser.add_argument("--sessions", type=int, default=20, help="Number of playbacks of the MPD per module")
+    parser.add_argument("--buffer-duration", type=float, default=PlayerConfig.buffer_duration, help="Buffer size in seconds")
+    parser.add_argument("--rebuffer-penalty", type=float, default=4.3, help="QoE penalty of a second of rebuffering")
+    args = parser.parse_args()
+
+    with open(args.mpd) as f:
+        mpd = DefaultMPDParser().parse(f.read(), url=args.mpd)
+    trace = load_trace(args.trace) if args.trace is not None else args.bandwidth
+    config = PlayerConfig(input=args.mpd, buffer_duration=args.buffer_duration)
+
+    composer = PlayerComposer()
+    composer.register_core_modules()
+    abr_specs = args.abr if args.abr else [name for name in composer.module_options["abr"] if name != "fixed"]
+
+    print(
+        f"{'ABR':<30} {'decisions':>9} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} "
+        f"{'bitrate (kbps)':>14} {'rebuf (s)':>9} {'QoE':>9}"
+    )
+    for abr_spec in abr_specs:
+        latencies: List[float] = []
+        qoes: List[Dict[str, float]] = []
+        for _ in range(args.sessions):
+            session_latencies, qoe = await run_session(composer, abr_spec, mpd, trace, config, args.rebuffer_penalty)
+            latencies.extend(session_latencies)
+            qoes.append(qoe)
+        latencies.sort()
+        print(
+            f"{abr_spec:<30} {len(latencies):>9} {percentile(latencies, 50) * 1e3:>9.3f} "
+            f"{percentile(latencies, 90) * 1e3:>9.3f} {percentile(latencies, 99) * 1e3:>9.3f} {latencies[-1] * 1e3:>9.3f} "
+            f"{statistics.mean(q['avg_bitrate'] for q in qoes) / 1e3:>14.1f} "
+            f"{statistics.mean(q['rebuffering'] for q in qoes):>9.2f} {statistics.mean(q['qoe'] for q in qoes):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
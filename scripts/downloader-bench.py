@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadEventListener, DownloadManager, DownloadRequest, DownloadType
+from istream_player.core.module_composer import PlayerComposer, get_mod_name, get_mod_props
+from istream_player.modules.downloader.network_emulator import NetworkProfile
+from istream_player.utils.dash_server import DashServer
+
+# Protocol of the bundled server used by every downloader, None for the files on disk
+DOWNLOADER_PROTOCOLS: Dict[str, Optional[str]] = {
+    "tcp": "http",
+    "h2": "h2",
+    "quic": "h3",
+    "local": None,
+}
+
+
+class EventCounter(DownloadEventListener):
+    """
+    Count the chunk events of the downloader, which is its unit of work per byte
+    """
+
+    def __init__(self) -> None:
+        self.events = 0
+
+    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes) -> None:
+        self.events += 1
+
+
+def make_dataset(directory: str, segments: int, segment_size: int) -> List[str]:
+    """
+    Write `segments` files of random bytes, as a synthetic dataset
+
+    Returns
+    -------
+    paths: List[str]
+        The paths of the segments relative to the directory
+    """
+    paths = []
+    for index in range(segments):
+        path = f"chunk-{index:05d}.m4s"
+        with open(os.path.join(directory, path), "wb") as f:
+            f.write(os.urandom(segment_size))
+        paths.append(path)
+    return paths
+
+
+def serve(root: str, profile: Optional[str], bw: Optional[float], latency: float, protocols: List[str], conn) -> None:
+    """
+    Run the bundled server in its own process, so its CPU time is not counted for the downloaders.
+    The ports are sent over the pipe once the server is up.
+    """
+
+    async def run():
+        shaping = None
+        if profile is not None:
+            shaping = NetworkProfile.load(profile)
+        elif bw is not None:
+            shaping = DashServer.shaped(bw * 1000 / 8, latency / 1000)
+        async with DashServer(root, profile=shaping) as server:
+            await server.start(*(0 if protocol in protocols else None for protocol in ("http", "h2", "h3")))
+            conn.send(dict(server.ports))
+            await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+    asyncio.run(run())
+
+
+async def run_round(downloader: DownloadManager, urls: List[str], concurrency: int) -> int:
+    """
+    Download all the urls, at most `concurrency` at a time
+
+    Returns
+    -------
+    size: int
+        The number of bytes downloaded
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    sizes: List[int] = []
+
+    async def fetch(url: str):
+        async with semaphore:
+            await downloader.download(DownloadRequest(url, DownloadType.SEGMENT))
+            result = await downloader.wait_complete(url)
+            assert result is not None, f"Download dropped : {url}"
+            sizes.append(len(result[0]))
+
+    await asyncio.gather(*(fetch(url) for url in urls))
+    return sum(sizes)
+
+
+async def bench(
+    composer: PlayerComposer, spec: str, urls: List[str], rounds: int, concurrency: int
+) -> Tuple[List[float], float, int, int]:
+    """
+    Returns
+    -------
+    results: Tuple[List[float], float, int, int]
+        The wall clock time of every round in seconds, the CPU time of all the rounds in seconds, the bytes
+        downloaded per round and the chunk events of all the rounds
+    """
+    downloader = composer.module_options["downloader"][get_mod_name(spec)](**get_mod_props(spec))
+    assert isinstance(downloader, DownloadManager)
+    await downloader.setup(PlayerConfig(input=urls[0], time_factor=1))
+    counter = EventCounter()
+    downloader.add_listener(counter)
+
+    # Warm up: connection, handshake and the first requests
+    await run_round(downloader, urls[:concurrency], concurrency)
+
+    durations = []
+    size = 0
+    counter.events = 0
+    cpu_start = time.process_time()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = await run_round(downloader, urls, concurrency)
+        durations.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+
+    await downloader.close()
+    await downloader.cleanup()
+    return durations, cpu, size, counter.events
+
+
+async def main():
+    parser = argparse.ArgumentParser("Benchmark the downloaders against the bundled server on localhost")
+    parser.add_argument(
+        "--downloader", type=str, nargs="*", help="Downloader modules to compare, with their props like tcp:concurrent=false"
+    )
+    parser.add_argument("--root", type=str, help="Dataset directory. Default: a synthetic dataset")
+    parser.add_argument("--pattern", type=str, default="**/*.m4s", help="Segments to download in the dataset directory")
+    parser.add_argument("--segments", type=int, default=100, help="Number of segments of the synthetic dataset")
+    parser.add_argument("--segment-size", type=int, default=500_000, help="Size in bytes of the synthetic segments")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of downloads of all the segments")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of downloads in flight")
+    parser.add_argument("--bw", type=float, help="Bandwidth of the server in kbit/s. Default: unshaped")
+    parser.add_argument("--latency", type=float, default=0, help="One-way latency of the server in ms, with --bw")
+    parser.add_argument("--profile", type=str, help="Network profile of the server, in the format of NetworkManager")
+    args = parser.parse_args()
+
+    composer = PlayerComposer()
+    composer.register_core_modules()
+    specs = args.downloader if args.downloader else list(DOWNLOADER_PROTOCOLS)
+
+    with tempfile.TemporaryDirectory(prefix="downloader-bench-") as tempdir:
+        if args.root is not None:
+            root = Path(args.root).resolve()
+            paths = sorted(str(path.relative_to(root)) for path in root.glob(args.pattern) if path.is_file())
+        else:
+            root = Path(tempdir)
+            paths = make_dataset(tempdir, args.segments, args.segment_size)
+        assert len(paths) > 0, "No segment in the dataset"
+
+        protocols = [DOWNLOADER_PROTOCOLS[get_mod_name(spec)] for spec in specs]
+        server_conn, conn = multiprocessing.Pipe()
+        server = multiprocessing.Process(
+            target=serve, args=(str(root), args.profile, args.bw, args.latency, protocols, conn), daemon=True
+        )
+        server.start()
+        ports = server_conn.recv()
+
+        print(
+            f"{'Downloader':<30} {'segments':>9} {'MB':>9} {'segments/s':>11} {'MB/s':>9} {'stdev MB/s':>10} "
+            f"{'events/s':>10} {'CPU (s)':>9} {'CPU ms/MB':>9}"
+        )
+        try:
+            for spec, protocol in zip(specs, protocols):
+                if protocol is None:
+                    urls = [str(root.joinpath(path)) for path in paths]
+                else:
+                    host = f"127.0.0.1:{ports[protocol]}"
+                    urls = [f"{'http' if protocol == 'http' else 'https'}://{host}/{path}" for path in paths]
+                durations, cpu, size, events = await bench(composer, spec, urls, args.rounds, args.concurrency)
+                rates = [size / duration / 1e6 for duration in durations]
+                total_bytes = size * args.rounds
+                print(
+                    f"{spec:<30} {len(urls) * args.rounds:>9} {total_bytes / 1e6:>9.1f} "
+                    f"{len(urls) * args.rounds / sum(durations):>11.1f} {total_bytes / sum(durations) / 1e6:>9.2f} "
+                    f"{statistics.stdev(rates) if len(rates) > 1 else 0:>10.2f} {events / sum(durations):>10.0f} "
+                    f"{cpu:>9.2f} {cpu * 1e9 / max(total_bytes, 1):>9.2f}"
+                )
+        finally:
+            server_conn.send(None)
+            server.join(timeout=5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
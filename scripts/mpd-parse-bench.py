@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import argparse
+import gc
+import time
+import tracemalloc
+from glob import glob
+from typing import Dict, List
+
+from istream_player.modules.mpd.parser import DefaultMPDParser, MPDParser
+from istream_player.modules.mpd.stream_parser import StreamingMPDParser
+
+PARSERS: Dict[str, MPDParser] = {
+    "default": DefaultMPDParser(),
+    "stream": StreamingMPDParser(),
+}
+
+
+def synthetic_mpd(num_representations: int, num_segments: int) -> str:
+    """
+    Build a static MPD with an explicit SegmentTimeline entry for every segment, so the size grows with the length
+    """
+    timeline = "".join(f'<S t="{i * 1000}" d="{1000 + i % 2}" />' for i in range(num_segments))
+    representations = "".join(
+        f'<Representation id="{i}" mimeType="video/mp4" codecs="avc1.640015" bandwidth="{(i + 1) * 250000}" '
+        f'width="426" height="240"><SegmentTemplate timescale="1000" initialization="init-$RepresentationID$.m4s" '
+        f'media="chunk-$RepresentationID$-$Number%05d$.m4s" startNumber="1"><SegmentTimeline>{timeline}'
+        "</SegmentTimeline></SegmentTemplate></Representation>"
+        for i in range(num_representations)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT1H" '
+        'maxSegmentDuration="PT1.0S" minBufferTime="PT2.0S"><Period id="0" start="PT0.0S">'
+        f'<AdaptationSet id="0" contentType="video" maxWidth="426" maxHeight="240">{representations}</AdaptationSet>'
+        "</Period></MPD>"
+    )
+
+
+def bench(parser: MPDParser, content: str, repeat: int) -> List[float]:
+    """
+    Returns
+    -------
+    results: List[float]
+        Best parse time in seconds and peak traced memory in MB
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        parser.parse(content, url="./bench.mpd")
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    parser.parse(content, url="./bench.mpd")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return [min(times), peak / 1e6]
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the MPD parsers")
+    parser.add_argument("--files", type=str, default="./tests/resources/*.mpd", help="Glob of MPD files to parse")
+    parser.add_argument("--representations", type=int, default=10, help="Representations in the synthetic MPDs")
+    parser.add_argument(
+        "--segments", type=int, nargs="*", default=[1_000, 10_000, 50_000], help="Segments in the synthetic MPDs"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs. The best one is reported.")
+    args = parser.parse_args()
+
+    inputs: Dict[str, str] = {}
+    for path in sorted(glob(args.files)):
+        with open(path) as f:
+            inputs[path] = f.read()
+    for num_segments in args.segments:
+        inputs[f"synthetic {args.representations}x{num_segments}"] = synthetic_mpd(args.representations, num_segments)
+
+    print(f"{'MPD':<50} {'size (KB)':>10} {'parser':>8} {'time (ms)':>10} {'peak (MB)':>10}")
+    for name, content in inputs.items():
+        for parser_name, mpd_parser in PARSERS.items():
+            best, peak = bench(mpd_parser, content, args.repeat)
+            print(f"{name:<50} {len(content) / 1e3:>10.1f} {parser_name:>8} {best * 1e3:>10.2f} {peak:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import math
+import unittest
+
+from istream_player.models.mpd_objects import AdaptationSet, Representation, SegmentSequence
+from istream_player.modules.abr.abr_bola import BolaTable
+
+
+def make_adaptation_set(bitrates):
+    representations = {
+        i: Representation(i, "video/mp4", "avc1", bitrate, 0, 0, "init", SegmentSequence("seg", "init", 1, 0, i), {})
+        for i, bitrate in enumerate(bitrates)
+    }
+    return AdaptationSet(0, "video", None, 0, 0, None, representations, {})
+
+
+class BolaTableTest(unittest.TestCase):
+    def test_representation_index(self):
+        index = make_adaptation_set([4_000_000, 250_000, 1_000_000, 500_000]).representation_index
+        assert index.bitrates == [250_000, 500_000, 1_000_000, 4_000_000]
+        assert index.lowest.id == 1 and index.highest.id == 0
+        assert index.rank(2) == 2
+        assert index.highest_below(1_000_000).id == 3
+        assert index.highest_below(1_000_001).id == 2
+        assert index.highest_below(100).id == 1
+
+    def test_matches_bola_scores(self):
+        bitrates = [4_000_000, 250_000, 1_000_000, 500_000, 2_000_000, 1_000_000]
+        index = make_adaptation_set(bitrates).representation_index
+        table = BolaTable(index, min_buffer=2, buffer_target=8)
+
+        # Parameters as in BOLA-BASIC
+        distinct = sorted(set(bitrates))
+        utilities = [1 + math.log(bitrate / distinct[0]) for bitrate in distinct]
+        gp = (utilities[-1] - 1) / (8 / 2 - 1)
+        vp = 2 / gp
+        for step in range(200):
+            buffer_level = step * 0.05
+            scores = [(vp * (u + gp) - buffer_level) / s for u, s in zip(utilities, distinct)]
+            assert index.bitrates[table.quality(buffer_level)] == distinct[scores.index(max(scores))], buffer_level
+
+        assert table.quality(0) == 0
+        assert table.quality(8) == len(index) - 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import itertools
+import unittest
+from unittest.mock import MagicMock
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.bw_meter import DownloadStats
+from istream_player.modules.abr.abr_mpc import MPCABRController
+
+
+class MPCTest(unittest.TestCase):
+    def brute_force(self, bitrates, last_quality, horizon, bw, buffer_level, segment_duration):
+        best_score, best_quality = None, None
+        for qualities in itertools.product(range(len(bitrates)), repeat=horizon):
+            buffer, rebuffer, score, previous = buffer_level, 0.0, 0.0, last_quality
+            for quality in qualities:
+                download_time = bitrates[quality] * segment_duration / bw
+                rebuffer += max(download_time - buffer, 0)
+                buffer = max(buffer - download_time, 0) + segment_duration
+                score += (bitrates[quality] - abs(bitrates[quality] - bitrates[previous])) / 1e6
+                previous = quality
+            score -= bitrates[-1] / 1e6 * rebuffer
+            if best_score is None or score > best_score + 1e-9:
+                best_score, best_quality = score, qualities[0]
+        return best_quality
+
+    def test_matches_exhaustive_search(self):
+        abr = MPCABRController()
+        bitrates = (250_000, 500_000, 1_000_000, 2_000_000, 4_000_000)
+        for bw, buffer_level, last_quality in [(1e6, 2, 0), (3e6, 6, 3), (5e5, 0.5, 4), (2e7, 8, 2)]:
+            assert abr.choose_quality(bitrates, last_quality, 4, bw, buffer_level, 2) == self.brute_force(
+                bitrates, last_quality, 4, bw, buffer_level, 2
+            )
+
+
+class PredictionErrorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_error_against_measured_throughput(self):
+        abr = MPCABRController()
+        bandwidth_meter = MagicMock(bandwidth=2_000_000)
+        scheduler = MagicMock()
+        await abr.setup(PlayerConfig(), bandwidth_meter, MagicMock(), MagicMock(), scheduler)
+        scheduler.add_listener.assert_called_once_with(abr)
+
+        self.assertEqual(abr.predict_bandwidth(), 2_000_000)
+        # Two segments of 125 kB downloaded together in 2 s: 1 Mbps, the prediction was twice too high
+        stats = {
+            as_id: DownloadStats(125_000, 125_000, start_time=10 + as_id * 0.5, stop_time=12, last_byte_at=12)
+            for as_id in (0, 1)
+        }
+        await abr.on_segment_download_complete(1, {}, stats)
+        self.assertAlmostEqual(abr.predict_bandwidth(), 1_000_000)
+
+        # An accurate prediction, the largest error of the window still discounts the next one
+        bandwidth_meter.bandwidth = 1_000_000
+        await abr.on_segment_download_complete(2, {}, {0: DownloadStats(250_000, 250_000, start_time=0, last_byte_at=2)})
+        self.assertAlmostEqual(abr.predict_bandwidth(), 500_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
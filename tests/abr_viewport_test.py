@@ -0,0 +1,42 @@
+import unittest
+
+from istream_player.models.mpd_objects import AdaptationSet, Representation, SegmentSequence
+from istream_player.modules.abr.abr_viewport import Tile, UpgradePath, ViewportABRController, allocate
+
+
+def make_adaptation_set(as_id, bitrates):
+    representations = {
+        i: Representation(i, "video/mp4", "avc1", bitrate, 0, 0, "init", SegmentSequence("seg", "init", 1, as_id, i), {})
+        for i, bitrate in enumerate(bitrates)
+    }
+    return AdaptationSet(as_id, "video", None, 0, 0, None, representations, {})
+
+
+class ViewportABRTest(unittest.TestCase):
+    def test_priority_classes(self):
+        abr = ViewportABRController(fov="100x90", margin="30")
+        # 5x5 tiles of 72x36 degrees
+        center = Tile.from_srd("0,2,2,1,1,5,5")
+        assert center == Tile(yaw=0, pitch=0, width=72, height=36)
+        assert abr.priority_class(center, yaw=0, pitch=0) == 0
+        assert abr.priority_class(Tile.from_srd("0,2,0,1,1,5,5"), yaw=0, pitch=0) == 1
+        assert abr.priority_class(Tile.from_srd("0,4,2,1,1,5,5"), yaw=0, pitch=0) == 2
+        # Wraps around at 180 degrees
+        assert abr.priority_class(Tile.from_srd("0,0,2,1,1,5,5"), yaw=0, pitch=0) == 2
+        assert abr.priority_class(Tile.from_srd("0,0,2,1,1,5,5"), yaw=170, pitch=0) == 0
+        assert abr.priority_class(None, yaw=170, pitch=0) == 0
+
+    def test_allocation(self):
+        bitrates = [100, 200, 400, 800]
+        paths = [UpgradePath(make_adaptation_set(i, bitrates).representation_index) for i in range(3)]
+        # The lowest bitrates do not fit, nothing is upgraded
+        assert allocate(paths, [16, 4, 1], 200) == [0, 0, 0]
+        # The tile in view gets the bits first
+        assert allocate(paths, [16, 1, 1], 1000) == [3, 0, 0]
+        ranks = allocate(paths, [16, 4, 1], 1500)
+        assert ranks == [3, 2, 1]
+        assert sum(bitrates[rank] for rank in ranks) <= 1500
+
+
+if __name__ == "__main__":
+    unittest.main()
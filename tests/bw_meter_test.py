@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.bw_meter import BandwidthUpdateListener
+from istream_player.modules.bw_meter.bandwidth import BandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_cont import ContinuousBandwidthMeterImpl, ThroughputWindow
+from istream_player.models.mpd_objects import Segment
+from istream_player.modules.bw_meter.bandwidth_ewma import EWMABandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_harmonic import HarmonicBandwidthMeterImpl
+from istream_player.modules.bw_meter.bandwidth_percentile import PercentileBandwidthMeterImpl
+
+
+class ThroughputWindowTest(unittest.TestCase):
+    def test_time_eviction(self):
+        window = ThroughputWindow(duration=1, capacity=16)
+        window.add(0.0, 0.5, 1000)
+        assert window.throughput is None
+        window.add(0.5, 1.0, 1000)
+        assert window.throughput == 8 * 2000 / 1.0
+        # The first sample ended more than 1 second before the latest one
+        window.add(1.0, 2.0, 4000)
+        assert len(window) == 2
+        assert window.throughput == 8 * 5000 / 1.5
+
+    def test_capacity(self):
+        window = ThroughputWindow(duration=100, capacity=4)
+        for i in range(10):
+            window.add(i, i + 1, 1000 * i)
+        assert len(window) == 4
+        assert window.throughput == 8 * 1000 * (6 + 7 + 8 + 9) / 4
+
+
+class ContinuousBandwidthMeterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_continuous_estimate(self):
+        class Recorder(BandwidthUpdateListener):
+            def __init__(self):
+                self.estimates = []
+
+            async def on_continuous_bw_update(self, bw: int) -> None:
+                self.estimates.append(bw)
+
+        config = PlayerConfig()
+        config.static.cont_bw_window = 1
+        meter = ContinuousBandwidthMeterImpl(window_capacity="8")
+        await meter.setup(config, segment_downloader=MagicMock(), scheduler=MagicMock())
+        recorder = Recorder()
+        meter.add_listener(recorder)
+
+        await meter.on_transfer_start("segment")
+        for i in range(20):
+            await meter.update_cont_bw(1000, i * 0.1)
+        # Every chunk of 1000 bytes took 0.1 seconds. The first chunk is not a sample, and two samples are needed.
+        assert len(recorder.estimates) == 18
+        assert recorder.estimates[-1] == 80_000
+        assert len(meter.window) == 8
+
+
+
+class BandwidthMeterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_transfers(self):
+        now = [0.0]
+        with patch("istream_player.modules.bw_meter.bandwidth.time.time", side_effect=lambda: now[0]):
+            meter = BandwidthMeterImpl(retained_stats="1")
+            config = PlayerConfig()
+            config.static.smoothing_factor = 0
+            await meter.setup(config, segment_downloader=MagicMock(), scheduler=MagicMock())
+
+            # Two overlapping transfers busy the link from 0 to 3, then it is idle till 10
+            await meter.on_transfer_start("a")
+            now[0] = 1
+            await meter.on_transfer_start("b")
+            await meter.on_bytes_transferred(1000, "a", 1000, 1000, b"")
+            now[0] = 2
+            await meter.on_transfer_end(1000, "a")
+            await meter.on_bytes_transferred(2000, "b", 2000, 2000, b"")
+            now[0] = 3
+            await meter.on_transfer_end(2000, "b")
+            now[0] = 10
+            # A transfer of the next index is still active
+            await meter.on_transfer_start("c")
+            now[0] = 11
+            await meter.on_bytes_transferred(1000, "c", 1000, 2000, b"")
+
+            segments = {0: Segment("a", "init", 1, 0, 0, 0), 1: Segment("b", "init", 1, 0, 1, 0)}
+            await meter.on_segment_download_complete(0, segments, {})
+            assert meter.bandwidth == 8 * 4000 / 4
+            # The stats of the active transfer are kept, only one consumed URL is retained
+            assert meter.get_stats("c").received_bytes == 1000
+            assert meter.get_stats("b").received_bytes == 2000
+            with self.assertRaises(KeyError):
+                meter.get_stats("a")
+
+            # The next estimate starts from the current busy period
+            now[0] = 12
+            await meter.on_bytes_transferred(1000, "c", 2000, 2000, b"")
+            await meter.on_transfer_end(2000, "c")
+            await meter.on_segment_download_complete(1, {0: Segment("c", "init", 1, 0, 0, 0)}, {})
+            assert meter.bandwidth == 8 * 1000 / 1
+
+
+class EstimatorTest(unittest.IsolatedAsyncioTestCase):
+    async def make_meter(self, meter: BandwidthMeterImpl) -> BandwidthMeterImpl:
+        await meter.setup(PlayerConfig(), segment_downloader=MagicMock(), scheduler=MagicMock())
+        return meter
+
+    async def test_harmonic(self):
+        meter = await self.make_meter(HarmonicBandwidthMeterImpl(window="2"))
+        self.assertAlmostEqual(meter.estimate(1000, 1), 1000)
+        self.assertAlmostEqual(meter.estimate(3000, 1), 1500)
+        # The first sample is out of the window
+        self.assertAlmostEqual(meter.estimate(6000, 1), 4000)
+
+    async def test_ewma(self):
+        meter = await self.make_meter(EWMABandwidthMeterImpl(fast_half_life="3", slow_half_life="8"))
+        # No bias towards zero after one sample
+        assert abs(meter.estimate(1000, 1) - 1000) < 1e-6
+        # After a fast segment the slow average is used. It weights the first sample more than the fast average does.
+        estimate = meter.estimate(10_000, 1)
+        assert 1000 < estimate < 6000
+        # A slow segment is followed by the fast average
+        assert meter.estimate(100, 1) < estimate
+
+    async def test_percentile(self):
+        meter = await self.make_meter(PercentileBandwidthMeterImpl(window="3", percentile="50"))
+        assert meter.estimate(1000, 1) == 1000
+        # The nearest rank of the median of two samples rounds to the lower one
+        assert meter.estimate(100_000, 1) == 1000
+        assert meter.estimate(2000, 1) == 2000
+        # 1000 is evicted
+        assert meter.estimate(3000, 1) == 3000
+        assert meter.estimate(10, 1) == 2000
+
+    async def test_percentile_distribution(self):
+        samples = [70, 20, 100, 40, 10, 90, 30, 60, 80, 50]
+        low = await self.make_meter(PercentileBandwidthMeterImpl(window="10", percentile="20"))
+        high = await self.make_meter(PercentileBandwidthMeterImpl(window="10", percentile="90"))
+        for sample in samples:
+            low_estimate = low.estimate(sample, 1)
+            high_estimate = high.estimate(sample, 1)
+        # Ranks round(0.2 * 9) = 2 and round(0.9 * 9) = 8 of the sorted window
+        self.assertEqual(low_estimate, 30)
+        self.assertEqual(high_estimate, 90)
+        # 70 is evicted, the window is 10, 20, 30, 40, 50, 60, 80, 90, 100, 1000
+        self.assertEqual(low.estimate(1000, 1), 30)
+        self.assertEqual(high.estimate(1000, 1), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from istream_player.utils.chunked_buffer import ChunkedBuffer
+
+
+class ChunkedBufferTest(unittest.TestCase):
+    def test_preallocated(self):
+        buffer = ChunkedBuffer(6)
+        buffer.append(b"abc")
+        buffer.append(b"def")
+        self.assertEqual(len(buffer), 6)
+        value = buffer.getvalue()
+        self.assertEqual(value, b"abcdef")
+        # Handed back without copying
+        self.assertIsInstance(value, bytearray)
+
+    def test_overrun(self):
+        buffer = ChunkedBuffer(4)
+        buffer.append(b"abc")
+        buffer.append(b"def")
+        buffer.append(b"g")
+        self.assertEqual(len(buffer), 7)
+        self.assertEqual(buffer.getvalue(), b"abcdefg")
+
+    def test_unknown_size(self):
+        for hint in (None, 0):
+            buffer = ChunkedBuffer(hint)
+            self.assertEqual(buffer.getvalue(), b"")
+            buffer.append(b"abc")
+            buffer.append(b"def")
+            self.assertEqual(len(buffer), 6)
+            self.assertEqual(buffer.getvalue(), b"abcdef")
+
+    def test_partial(self):
+        # Stopped before the announced size is received
+        buffer = ChunkedBuffer(10)
+        buffer.append(b"abc")
+        self.assertEqual(buffer.getvalue(), b"abc")
+        self.assertEqual(len(ChunkedBuffer(10).getvalue()), 0)
+
+    def test_value_does_not_change(self):
+        buffer = ChunkedBuffer(10)
+        buffer.append(b"abc")
+        value = buffer.getvalue()
+        buffer.append(b"def")
+        self.assertEqual(value, b"abc")
+        self.assertEqual(buffer.getvalue(), b"abcdef")
+
+        buffer = ChunkedBuffer(3)
+        buffer.append(b"abc")
+        value = buffer.getvalue()
+        buffer.append(b"def")
+        self.assertEqual(value, b"abc")
+        self.assertEqual(buffer.getvalue(), b"abcdef")
+
+    def test_single_chunk(self):
+        chunk = b"abcdef"
+        buffer = ChunkedBuffer()
+        buffer.append(chunk)
+        self.assertIs(buffer.getvalue(), chunk)
+
+        # A memoryview chunk is not handed back as is
+        buffer = ChunkedBuffer()
+        buffer.append(memoryview(chunk)[1:4])
+        self.assertEqual(buffer.getvalue(), b"bcd")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import time
+import unittest
+from typing import List
+
+from istream_player.core.downloader import ChunkEvent, DownloadEventBus, DownloadEventListener
+
+
+class Recorder(DownloadEventListener):
+    def __init__(self):
+        self.chunks: List[int] = []
+        self.batches: List[List[ChunkEvent]] = []
+        self.ended: List[str] = []
+
+    async def on_bytes_transferred(self, length: int, url: str, position: int, size: int, content: bytes) -> None:
+        self.chunks.append(length)
+
+    async def on_bytes_transferred_batch(self, events: List[ChunkEvent]) -> None:
+        self.batches.append(events)
+
+    async def on_transfer_end(self, size: int, url: str) -> None:
+        # All the chunks of the transfer are delivered before its end
+        assert sum(len(batch) for batch in self.batches) + len(self.chunks) == 3
+        self.ended.append(url)
+
+
+class DownloadEventBusTest(unittest.IsolatedAsyncioTestCase):
+    async def test_batch_dispatch(self):
+        bus = DownloadEventBus()
+        single, batched = Recorder(), Recorder()
+        bus.add_listener(single)
+        bus.add_listener(batched, batch_interval=60)
+        # Already subscribed
+        bus.add_listener(batched)
+
+        await bus.transfer_start("a")
+        for i in range(3):
+            await bus.bytes_transferred(100, "a", 100 * (i + 1), 300, b"")
+        assert single.chunks == [100, 100, 100]
+        assert batched.batches == []
+
+        await bus.transfer_end(300, "a")
+        assert single.ended == batched.ended == ["a"]
+        assert len(batched.batches) == 1
+        events = batched.batches[0]
+        assert [event.position for event in events] == [100, 200, 300]
+        assert events[0].monotonic_ns <= events[-1].monotonic_ns
+        assert abs(events[-1].time - time.time()) < 1
+
+
+if __name__ == "__main__":
+    unittest.main()
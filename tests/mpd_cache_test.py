@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from istream_player.config.config import PlayerConfig
+from istream_player.modules.downloader.local import LocalClient
+from istream_player.modules.mpd.mpd_cache import MPDCache
+from istream_player.modules.mpd.mpd_provider_impl import MPDProviderImpl
+from istream_player.modules.mpd.parser import DefaultMPDParser
+
+MPD_PATH = "./tests/resources/static_2as_5repr_30seg.mpd"
+
+
+class MPDCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        self.dir.cleanup()
+
+    async def load(self):
+        config = PlayerConfig(input=MPD_PATH, time_factor=0)
+        downloader = LocalClient()
+        await downloader.setup(config)
+        provider = MPDProviderImpl(cache_dir=self.dir.name, cache_size_mb="1")
+        await provider.setup(config, mpd_downloader=downloader)
+        try:
+            await provider.update()
+        finally:
+            await downloader.cleanup()
+        assert provider.mpd is not None
+        return provider.mpd
+
+    async def test_cached_parse(self):
+        mpd = await self.load()
+        with patch.object(DefaultMPDParser, "parse", side_effect=AssertionError("MPD parsed again")):
+            cached = await self.load()
+        assert cached.adaptation_sets.keys() == mpd.adaptation_sets.keys()
+        for as_id, adaptation_set in mpd.adaptation_sets.items():
+            for repr_id, representation in adaptation_set.representations.items():
+                cached_repr = cached.adaptation_sets[as_id].representations[repr_id]
+                assert list(cached_repr.segments.values()) == list(representation.segments.values())
+
+    def test_evict_least_recently_used(self):
+        with open(MPD_PATH, "rb") as f:
+            content = f.read()
+        mpd = DefaultMPDParser().parse(content.decode("utf-8"), url=MPD_PATH)
+        cache = MPDCache(self.dir.name, max_size=2**30)
+        key_a, key_b, key_c = (cache.key(url, content) for url in "abc")
+        cache.put(key_a, mpd)
+        entry_size = os.path.getsize(os.path.join(self.dir.name, key_a + cache.SUFFIX))
+
+        # Room for two entries
+        cache.max_size = 2 * entry_size
+        cache.put(key_b, mpd)
+        os.utime(os.path.join(self.dir.name, key_a + cache.SUFFIX), (0, 0))
+        os.utime(os.path.join(self.dir.name, key_b + cache.SUFFIX), (1, 1))
+        # Reading "a" makes "b" the least recently used one
+        assert cache.get(key_a) is not None
+        cache.put(key_c, mpd)
+        assert cache.get(key_b) is None
+        assert cache.get(key_a) is not None and cache.get(key_c) is not None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from istream_player.config.config import PlayerConfig
+from istream_player.modules.downloader.local import LocalClient
+from istream_player.modules.mpd.mpd_provider_impl import MPDProviderImpl
+
+LIVE_MPD = """<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="dynamic" minimumUpdatePeriod="PT2S" timeShiftBufferDepth="PT4S"
+    maxSegmentDuration="PT1.0S" minBufferTime="PT2.0S">
+    <Period id="0" start="PT0.0S">
+        <AdaptationSet id="0" contentType="video" maxWidth="426" maxHeight="240">
+            <Representation id="0" mimeType="video/mp4" codecs="avc1.640015" bandwidth="250000" width="426" height="240">
+                <SegmentTemplate timescale="1000" initialization="init-$RepresentationID$.m4s"
+                    media="chunk-$RepresentationID$-$Number%05d$.m4s" startNumber="{start_number}">
+                    <SegmentTimeline>
+                        <S t="{t}" d="1000" r="{r}" />
+                    </SegmentTimeline>
+                </SegmentTemplate>
+            </Representation>
+        </AdaptationSet>
+    </Period>
+</MPD>
+"""
+
+
+class LiveMPDUpdateTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.mpd_path = os.path.join(self.dir.name, "live.mpd")
+        self.write_mpd(start_number=1, t=0, r=3)
+
+        config = PlayerConfig(input=self.mpd_path, time_factor=0)
+        self.downloader = LocalClient()
+        await self.downloader.setup(config)
+        self.provider = MPDProviderImpl()
+        await self.provider.setup(config, mpd_downloader=self.downloader)
+
+    async def asyncTearDown(self):
+        await self.downloader.cleanup()
+        self.dir.cleanup()
+
+    def write_mpd(self, start_number: int, t: int, r: int, mtime: float = 1_000_000):
+        with open(self.mpd_path, "w") as f:
+            f.write(LIVE_MPD.format(start_number=start_number, t=t, r=r))
+        os.utime(self.mpd_path, (mtime, mtime))
+
+    async def refresh(self):
+        self.provider.last_updated = 0
+        await self.provider.update()
+
+    async def test_incremental_update(self):
+        await self.refresh()
+        mpd = self.provider.mpd
+        assert mpd is not None
+        assert mpd.minimum_update_period == 2 and self.provider.refresh_interval == 2
+        repr = mpd.adaptation_sets[0].representations[0]
+        assert list(repr.segments.keys()) == [1, 2, 3, 4]
+        segment_url = repr.segments[2].url
+        assert self.provider.segment_by_url(segment_url) == repr.segments[2]
+
+        # Unchanged MPD is not downloaded again
+        await self.refresh()
+        headers = self.downloader.response_headers(self.mpd_path)
+        assert headers is not None and headers[":status"] == "304"
+        assert self.provider.mpd is mpd
+
+        # New segments are merged into the same model, and segments out of the 4s window are evicted
+        self.write_mpd(start_number=3, t=2000, r=5, mtime=1_000_010)
+        await self.refresh()
+        assert self.provider.mpd is mpd
+        assert mpd.adaptation_sets[0].representations[0] is repr
+        assert list(repr.segments.keys()) == [5, 6, 7, 8]
+        assert (repr.first_segment_num, repr.last_segment_num) == (5, 8)
+        assert repr.segments[5].start_time == 4 and repr.segments[5].url.endswith("chunk-0-00005.m4s")
+        with self.assertRaises(KeyError):
+            self.provider.segment_by_url(segment_url)
+
+
+if __name__ == "__main__":
+    unittest.main()
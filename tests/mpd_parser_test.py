@@ -0,0 +1,38 @@
+import unittest
+
+from parameterized import parameterized
+
+from istream_player.models.mpd_objects import MPD
+from istream_player.modules.mpd.parser import DefaultMPDParser
+from istream_player.modules.mpd.stream_parser import StreamingMPDParser
+
+
+def summary(mpd: MPD):
+    result = [mpd.type, mpd.media_presentation_duration, mpd.min_buffer_time, mpd.max_segment_duration, mpd.attrib]
+    for adaptation_set in mpd.adaptation_sets.values():
+        result.append((adaptation_set.id, adaptation_set.max_width, adaptation_set.max_height, adaptation_set.attrib))
+        for representation in adaptation_set.representations.values():
+            result.append((representation.id, representation.bandwidth, representation.initialization, representation.attrib))
+            result.append(list(representation.segments.values()))
+    return result
+
+
+class MPDParserTest(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ["./tests/resources/static_1as_1repr_4seg.mpd"],
+            ["./tests/resources/static_2as_5repr_30seg.mpd"],
+            ["./tests/resources/static_360.mpd"],
+        ]
+    )
+    def test_stream_parser(self, path: str):
+        with open(path) as f:
+            content = f.read()
+        expected = DefaultMPDParser().parse(content, url=path)
+        # Small chunks, so elements are split across feeds
+        actual = StreamingMPDParser(chunk_size=256).parse(content, url=path)
+        assert summary(actual) == summary(expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
+from istream_player.core.module_composer import PlayerComposer
+from istream_player.modules.downloader.network_emulator import NetworkCondition, NetworkEmulator, NetworkProfile
+from istream_player.modules.downloader.tcp import TCPClientImpl
+from istream_player.utils.dash_server import DashServer
+
+
+class NetworkEmulatorTest(unittest.IsolatedAsyncioTestCase):
+    def write_profile(self, content: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_profile(self):
+        profile = NetworkProfile.load(self.write_profile("800 20 0\n0 20 0\n1600 40 1\n"))
+        assert profile.at(0.5) == NetworkCondition(100_000, 0.02, 0)
+        assert profile.at(100) == NetworkCondition(200_000, 0.04, 0.01)
+        # 50 KB in the first second, nothing in the second one, 50 KB at 200 KB/s
+        assert profile.transmission_end(0.5, 100_000) == 2.25
+
+    async def test_emulated_transfer(self):
+        profile = NetworkProfile([NetworkCondition(1_000_000, 0.5, 0)])
+        emulator = NetworkEmulator(profile, time_factor=0.1, burst=0)
+        emulator.start()
+        await emulator.request_latency()
+        for _ in range(10):
+            await emulator.transmit(100_000)
+        # 0.5 second of latency then 1 MB at 1 MB/s, in a tenth of the time
+        self.assertAlmostEqual(emulator.now, 1.5, delta=0.3)
+
+    async def test_no_wait(self):
+        # 10 s of latency then 10 s of transfer, with a clock running as fast as possible
+        profile = NetworkProfile([NetworkCondition(100_000, 10, 0.5)])
+        emulator = NetworkEmulator(profile, time_factor=0, burst=0, seed=1)
+        await asyncio.wait_for(emulator.request_latency(), timeout=1)
+        for _ in range(10):
+            await asyncio.wait_for(emulator.transmit(100_000), timeout=1)
+
+        server = DashServer(str(pathlib.Path(__file__).parent.joinpath("resources")), profile=profile, time_factor=0)
+        client = TCPClientImpl()
+        async with server:
+            await server.start(http=0, h3=None)
+            await client.setup(PlayerConfig(input=""))
+            url = server.base_url("http") + "static_1as_5repr_4seg.mpd"
+            await client.download(DownloadRequest(url, DownloadType.MPD))
+            result = await asyncio.wait_for(client.wait_complete(url), timeout=5)
+            assert result is not None
+            await client.close()
+
+    async def test_player(self):
+        profile = self.write_profile("4000 50 0\n1000 50 2\n")
+        config = PlayerConfig(
+            input="./tests/resources/static_1as_5repr_4seg.mpd",
+            run_dir="./runs/test",
+            mod_analyzer=["data_collector:plots_dir=./runs/test/plots"],
+            mod_downloader=f"local:profile={profile},seed=1",
+            time_factor=0.1,
+        )
+        await self.play(config)
+
+    async def test_player_no_wait(self):
+        profile = self.write_profile("40 5000 0\n")
+        config = PlayerConfig(
+            input="./tests/resources/static_1as_5repr_4seg.mpd",
+            run_dir="./runs/test",
+            mod_analyzer=["data_collector:plots_dir=./runs/test/plots"],
+            mod_downloader=f"local:profile={profile},seed=1",
+            time_factor=0,
+        )
+        await asyncio.wait_for(self.play(config), timeout=30)
+
+    async def play(self, config: PlayerConfig):
+        with patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file") as save_file_mock:
+            composer = PlayerComposer()
+            composer.register_core_modules()
+            async with composer.make_player(config) as player:
+                await player.run()
+        [path, data] = save_file_mock.call_args.args
+        assert len(data["segments"]) == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
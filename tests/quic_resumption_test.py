@@ -0,0 +1,69 @@
+import asyncio
+import os
+import pathlib
+import tempfile
+import unittest
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
+from istream_player.modules.downloader.quic.client import QuicClientImpl
+from istream_player.utils.dash_server import DashServer
+
+RESOURCES = pathlib.Path(__file__).parent.joinpath("resources")
+
+
+class QuicResumptionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.ticket_dir = tempfile.TemporaryDirectory()
+        self.server = DashServer(str(RESOURCES))
+        await self.server.start(http=None, h3=0)
+        self.mpd_url = self.server.base_url("h3") + "static_1as_5repr_4seg.mpd"
+
+    async def asyncTearDown(self) -> None:
+        await self.server.stop()
+        self.ticket_dir.cleanup()
+
+    async def download_mpd(self, client: QuicClientImpl):
+        await client.download(DownloadRequest(self.mpd_url, DownloadType.MPD))
+        result = await client.wait_complete(self.mpd_url)
+        assert result is not None
+        self.assertEqual(result[0], RESOURCES.joinpath("static_1as_5repr_4seg.mpd").read_bytes())
+
+    async def test_resume_with_early_data(self):
+        client = QuicClientImpl(ticket_dir=self.ticket_dir.name)
+        await client.setup(PlayerConfig(input=self.mpd_url))
+        await client.warm_up(self.mpd_url)
+        handshake = client._connections[client.origin(self.mpd_url)][0].protocol.handshake
+        assert handshake is not None
+        self.assertFalse(handshake.session_resumed)
+        await self.download_mpd(client)
+        await client.close()
+        self.assertTrue(os.path.exists(client.ticket_path("127.0.0.1")))
+
+        # A new player run reads the ticket from the cache
+        client = QuicClientImpl(ticket_dir=self.ticket_dir.name)
+        await client.setup(PlayerConfig(input=self.mpd_url))
+        await self.download_mpd(client)
+        handshake = client._connections[client.origin(self.mpd_url)][0].protocol.handshake
+        assert handshake is not None
+        self.assertTrue(handshake.session_resumed)
+        self.assertTrue(handshake.early_data_accepted)
+        await client.close()
+
+
+class UnreachableTest(unittest.IsolatedAsyncioTestCase):
+    async def test_handshake_failure(self):
+        # Nothing listens on the discard port
+        url = "https://127.0.0.1:9/segment.m4s"
+        client = QuicClientImpl()
+        await client.setup(PlayerConfig(input=url))
+        client.quic_configuration.idle_timeout = 0.5
+        await asyncio.wait_for(client.warm_up(url), timeout=5)
+        with self.assertRaisesRegex(Exception, "Cannot connect"):
+            await asyncio.wait_for(client.download(DownloadRequest(url, DownloadType.SEGMENT)), timeout=5)
+        self.assertEqual(client._url_connections, {})
+        await client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+from istream_player.models.mpd_objects import SegmentSequence
+
+
+def make_sequence() -> SegmentSequence:
+    # Segments 1-3 of 2 s from 0 s, then segments 4-5 of 1 s from 6 s
+    sequence = SegmentSequence("seg-$Number%03d$.m4s", "init.mp4", 1000, as_id=0, repr_id=1)
+    sequence.add_run(1, 0, 2000, 3)
+    sequence.add_run(4, 6000, 1000, 2)
+    return sequence
+
+
+class SegmentSequenceTest(unittest.TestCase):
+    def test_empty(self):
+        sequence = SegmentSequence("seg-$Number$.m4s", "init.mp4", 1000, as_id=0, repr_id=1)
+        sequence.add_run(1, 0, 2000, 0)
+        self.assertEqual(len(sequence), 0)
+        self.assertEqual(list(sequence), [])
+        self.assertIsNone(sequence.first_number)
+        self.assertIsNone(sequence.last_number)
+        self.assertIsNone(sequence.end_time)
+        self.assertNotIn(1, sequence)
+        self.assertIsNone(sequence.number_of("seg-1.m4s"))
+        sequence.evict_before(10)
+        sequence.evict_ended_before(10)
+        self.assertEqual(len(sequence), 0)
+
+    def test_run_boundaries(self):
+        sequence = make_sequence()
+        self.assertEqual(list(sequence), [1, 2, 3, 4, 5])
+        self.assertEqual((sequence.first_number, sequence.last_number, sequence.end_time), (1, 5, 8))
+        self.assertNotIn(0, sequence)
+        self.assertNotIn(6, sequence)
+        # Last segment of the first run and first segment of the second run
+        self.assertEqual((sequence[3].start_time, sequence[3].duration), (4, 2))
+        self.assertEqual((sequence[4].start_time, sequence[4].duration), (6, 1))
+        self.assertEqual(sequence[5].url, "seg-005.m4s")
+        with self.assertRaises(KeyError):
+            sequence[6]
+        with self.assertRaises(AssertionError):
+            sequence.add_run(7, 8000, 1000, 1)
+
+    def test_number_of(self):
+        sequence = make_sequence()
+        self.assertEqual(sequence.number_of("seg-001.m4s"), 1)
+        self.assertEqual(sequence.number_of("seg-003.m4s"), 3)
+        self.assertEqual(sequence.number_of("seg-004.m4s"), 4)
+        self.assertEqual(sequence.number_of("seg-005.m4s"), 5)
+        self.assertIsNone(sequence.number_of("seg-006.m4s"))
+        # Another zero padding is another URL
+        self.assertIsNone(sequence.number_of("seg-5.m4s"))
+        self.assertIsNone(sequence.number_of("init.mp4"))
+
+    def test_template(self):
+        self.assertEqual(make_sequence().url_affixes, ("seg-", ".m4s"))
+        sequence = SegmentSequence("a$$b-$Number$.m4s", "init.mp4", 1000, as_id=0, repr_id=1)
+        sequence.add_run(1, 0, 2000, 1)
+        self.assertEqual(sequence[1].url, "a$b-1.m4s")
+        self.assertEqual(sequence.number_of("a$b-1.m4s"), 1)
+        self.assertEqual(sequence.url_affixes, ("a$b-", ".m4s"))
+        self.assertIsNone(SegmentSequence("seg.m4s", "init.mp4", 1000, as_id=0, repr_id=1).url_affixes)
+        for media in ("seg-$Time$.m4s", "seg-$Bandwidth$-$Number$.m4s", "seg-$Number$-$Time%05d$.m4s"):
+            with self.assertRaisesRegex(Exception, "Cannot replace"):
+                SegmentSequence(media, "init.mp4", 1000, as_id=0, repr_id=1)
+
+    def test_extend(self):
+        sequence = make_sequence()
+        newer = SegmentSequence("seg-$Number%03d$.m4s", "init.mp4", 1000, as_id=0, repr_id=1)
+        # Overlaps the known segments from the middle of a run
+        newer.add_run(5, 7000, 1000, 3)
+        newer.add_run(8, 10000, 500, 2)
+        sequence.extend(newer)
+        self.assertEqual(list(sequence), list(range(1, 10)))
+        self.assertEqual((sequence[6].start_time, sequence[6].duration), (8, 1))
+        self.assertEqual((sequence[9].start_time, sequence[9].duration), (10.5, 0.5))
+
+        # Nothing newer
+        sequence.extend(make_sequence())
+        self.assertEqual(len(sequence), 9)
+
+        empty = SegmentSequence("seg-$Number%03d$.m4s", "init.mp4", 1000, as_id=0, repr_id=1)
+        empty.extend(make_sequence())
+        self.assertEqual(list(empty), [1, 2, 3, 4, 5])
+
+    def test_evict_before(self):
+        sequence = make_sequence()
+        sequence.evict_before(1)
+        self.assertEqual(len(sequence), 5)
+        # Inside the first run
+        sequence.evict_before(3)
+        self.assertEqual(list(sequence), [3, 4, 5])
+        self.assertEqual(sequence[3].start_time, 4)
+        # At the first number of the second run
+        sequence.evict_before(4)
+        self.assertEqual(list(sequence), [4, 5])
+        self.assertEqual(sequence[4].start_time, 6)
+        sequence.evict_before(6)
+        self.assertEqual(len(sequence), 0)
+        self.assertIsNone(sequence.first_number)
+
+    def test_evict_ended_before(self):
+        sequence = make_sequence()
+        sequence.evict_ended_before(0)
+        self.assertEqual(len(sequence), 5)
+        # Segment 1 ends at 2 s, segment 2 is still playing at 3 s
+        sequence.evict_ended_before(3)
+        self.assertEqual(list(sequence), [2, 3, 4, 5])
+        # Segment 3 ends exactly at 6 s
+        sequence.evict_ended_before(6)
+        self.assertEqual(list(sequence), [4, 5])
+        sequence.evict_ended_before(7)
+        self.assertEqual(list(sequence), [5])
+        sequence.evict_ended_before(8)
+        self.assertEqual(len(sequence), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
+from istream_player.core.module_composer import PlayerComposer
+from istream_player.modules.downloader.http2 import H2ClientImpl
+from istream_player.utils.dash_server import DashServer, _H2ServerProtocol
+
+
+class StaticTest(unittest.IsolatedAsyncioTestCase):
+    def make_config(self):
+        config = PlayerConfig(
+            input=self.server.base_url("h2") + "static_1as_5repr_4seg.mpd",
+            run_dir="./runs/test",
+            mod_abr="dash",
+            mod_downloader="h2",
+            mod_analyzer=["data_collector"],
+            time_factor=0,
+        )
+        config.static.max_initial_bitrate = 100_000
+        return config
+
+    async def asyncSetUp(self):
+        self.server = DashServer(str(pathlib.Path(__file__).parent.joinpath("resources")))
+        await self.server.start(http=None, h2=0, h3=None)
+
+    async def asyncTearDown(self) -> None:
+        await self.server.stop()
+
+    async def test_static_h2(self):
+        save_file_patcher = patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file")
+        save_file_mock = save_file_patcher.start()
+
+        composer = PlayerComposer()
+        composer.register_core_modules()
+        async with composer.make_player(self.make_config()) as player:
+            await player.run()
+
+        save_file_patcher.stop()
+        save_file_mock.assert_called_once()
+        [path, data] = save_file_mock.call_args.args
+        assert len(data["segments"]) == 4
+
+
+class StreamResetTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        for name in ("a.m4s", "b.m4s"):
+            with open(os.path.join(self.tempdir.name, name), "wb") as f:
+                f.write(os.urandom(200_000))
+        # 100 kB in 0.1 s, so the transfers are still running when stopped
+        self.server = DashServer(self.tempdir.name, profile=DashServer.shaped(1_000_000))
+        await self.server.start(http=None, h2=0, h3=None)
+        self.client = H2ClientImpl(weights="0:256;1:1")
+        await self.client.setup(PlayerConfig(input=""))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.stop()
+        self.tempdir.cleanup()
+
+    async def test_stop_and_drop(self):
+        url_a = self.server.base_url("h2") + "a.m4s"
+        url_b = self.server.base_url("h2") + "b.m4s"
+        await self.client.download(DownloadRequest(url_a, DownloadType.SEGMENT, as_id=0))
+        await self.client.download(DownloadRequest(url_b, DownloadType.SEGMENT, as_id=1))
+        self.assertTrue(self.client.is_busy)
+
+        await self.client.drop_url(url_b)
+        self.assertIsNone(await self.client.wait_complete(url_b))
+
+        await asyncio.sleep(0.05)
+        await self.client.stop(url_a)
+        result = await self.client.wait_complete(url_a)
+        assert result is not None
+        content, size = result
+        self.assertEqual(size, 200_000)
+        self.assertGreater(len(content), 0)
+        self.assertLess(len(content), size)
+        self.assertFalse(self.client.is_busy)
+
+        # The connection is still usable after the resets
+        await self.client.download(DownloadRequest(url_b, DownloadType.SEGMENT, as_id=1))
+        result = await self.client.wait_complete(url_b)
+        assert result is not None
+        self.assertEqual(len(result[0]), 200_000)
+
+
+class GoawayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        for name in ("a.m4s", "b.m4s"):
+            with open(os.path.join(self.tempdir.name, name), "wb") as f:
+                f.write(os.urandom(100_000))
+        # The responses wait 0.2 s, so a request can be in flight when the server goes away
+        self.server = DashServer(self.tempdir.name, profile=DashServer.shaped(100_000_000, latency=0.2))
+        self.protocols = []
+        connection_made = _H2ServerProtocol.connection_made
+
+        def track(protocol, transport):
+            self.protocols.append(protocol)
+            connection_made(protocol, transport)
+
+        patcher = patch.object(_H2ServerProtocol, "connection_made", track)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        await self.server.start(http=None, h2=0, h3=None)
+        self.client = H2ClientImpl()
+        await self.client.setup(PlayerConfig(input=""))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.stop()
+        self.tempdir.cleanup()
+
+    def goaway(self, last_stream_id: int):
+        # The server stops accepting streams but keeps the connection open
+        protocol = self.protocols[-1]
+        protocol.conn.close_connection(last_stream_id=last_stream_id)
+        protocol.flush()
+
+    async def fetch(self, url: str):
+        await self.client.download(DownloadRequest(url, DownloadType.SEGMENT))
+        result = await self.client.wait_complete(url)
+        assert result is not None
+        self.assertEqual(len(result[0]), 100_000)
+
+    async def test_goaway_idle(self):
+        await self.fetch(self.server.base_url("h2") + "a.m4s")
+        self.goaway(1)
+        await asyncio.sleep(0.05)
+        await self.fetch(self.server.base_url("h2") + "b.m4s")
+        self.assertEqual(len(self.protocols), 2)
+
+    async def test_goaway_unprocessed_stream(self):
+        await self.fetch(self.server.base_url("h2") + "a.m4s")
+        url = self.server.base_url("h2") + "b.m4s"
+        await self.client.download(DownloadRequest(url, DownloadType.SEGMENT))
+        # Stream 3 was not processed, it is sent again over a new connection
+        self.goaway(1)
+        result = await self.client.wait_complete(url)
+        assert result is not None
+        self.assertEqual(len(result[0]), 100_000)
+        self.assertEqual(len(self.protocols), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
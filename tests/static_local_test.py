@@ -24,7 +24,7 @@ class StaticTest(unittest.IsolatedAsyncioTestCase):
         config.static.max_initial_bitrate = 100_000
         return config
 
-    @parameterized.expand([["dash"]])
+    @parameterized.expand([["dash"], ["bola"], ["bola_e"], ["mpc"]])
     async def test_static(self, abr: str):
         save_file_patcher = patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file")
         save_file_mock = save_file_patcher.start()
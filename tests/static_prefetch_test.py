@@ -0,0 +1,50 @@
+# test_with_pytest.py
+
+
+import unittest
+from unittest.mock import patch
+
+from parameterized import parameterized
+
+from istream_player.config.config import PlayerConfig
+from istream_player.core.module_composer import PlayerComposer
+
+
+class StaticPrefetchTest(unittest.IsolatedAsyncioTestCase):
+    def make_config(self, scheduler: str):
+        config = PlayerConfig(
+            input="./tests/resources/static_1as_5repr_4seg.mpd",
+            run_dir="./runs/test",
+            mod_abr="dash",
+            mod_scheduler=scheduler,
+            mod_analyzer=["data_collector"],
+            mod_downloader="local:bw=100_000",
+            time_factor=0.1
+        )
+        config.static.max_initial_bitrate = 100_000
+        return config
+
+    @parameterized.expand([["prefetch"], ["prefetch:depth=1"], ["prefetch:depth=3"]])
+    async def test_static_prefetch(self, scheduler: str):
+        save_file_patcher = patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file")
+        save_file_mock = save_file_patcher.start()
+
+        composer = PlayerComposer()
+        composer.register_core_modules()
+
+        with patch("istream_player.modules.downloader.local.LocalClient.warm_up") as warm_up_mock:
+            async with composer.make_player(self.make_config(scheduler)) as player:
+                await player.run()
+        # The segment downloader is warmed up with the MPD URL
+        warm_up_mock.assert_called_once_with("./tests/resources/static_1as_5repr_4seg.mpd")
+
+        save_file_patcher.stop()
+        save_file_mock.assert_called_once()
+        [path, data] = save_file_mock.call_args.args
+        assert len(data["segments"]) == 4
+        assert [segment["index"] for segment in data["segments"]] == [1, 2, 3, 4]
+        assert len(data["idle_gaps"]) == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
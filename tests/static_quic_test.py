@@ -1,73 +1,150 @@
 # test_with_pytest.py
 
 
-import logging
+import asyncio
+import os
+import pathlib
+import tempfile
 import unittest
-from pathlib import Path
 from unittest.mock import patch
 
-from parameterized import parameterized
-
 from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
 from istream_player.core.module_composer import PlayerComposer
+from istream_player.modules.downloader.quic.client import QuicClientImpl
+from istream_player.utils.dash_server import DashServer
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)20s %(levelname)8s:%(message)s")
 
-@unittest.skip("Aioquic SSL Error")
 class StaticTest(unittest.IsolatedAsyncioTestCase):
-    def make_config(self, abr: str):
-        return PlayerConfig(
-            protocol='quic',
-            buffer_duration=8,
-            safe_buffer_level=6,
-            panic_buffer_level=2.5,
-            min_rebuffer_duration=2,
-            min_start_duration=2,
+    def make_config(self):
+        config = PlayerConfig(
+            input=self.server.base_url("h3") + "static_1as_5repr_4seg.mpd",
             run_dir="./runs/test",
-            abr=abr,
-            analyzers=["data_collector"],
-            input="https://localhost:443/resources/static_1as_1repr_4seg.mpd",
+            mod_abr="dash",
+            mod_downloader="quic",
+            mod_analyzer=["data_collector"],
+            time_factor=0,
         )
+        config.static.max_initial_bitrate = 100_000
+        return config
 
     async def asyncSetUp(self):
-        import docker
-
-        client = docker.from_env()
-        self.container: Container = client.containers.run(  # type: ignore
-            "server_aioquic",
-            command=["bash", "/etc/nginx/common/container-start.sh", "quic"],
-            name="aioquic_test",
-            remove=False,
-            cap_add=["net_admin"],
-            ports={"443": "443"},
-            auto_remove=False,
-            detach=True,
-            volumes={
-                str(Path(__file__).parent.parent.joinpath("dataset")): {"bind": "/etc/nginx/html", "mode": "ro"},
-                str(Path(__file__).parent.parent.joinpath("runs", "test")): {"bind": "/run", "mode": "rw"},
-            },
-        )
-        print(self.container)
+        self.server = DashServer(str(pathlib.Path(__file__).parent.joinpath("resources")))
+        await self.server.start(http=None, h3=0)
 
     async def asyncTearDown(self) -> None:
-        # self.container.stop()
-        pass
+        await self.server.stop()
 
-    @parameterized.expand([["default"]])
-    async def test_static_tcp(self, abr: str):
+    async def test_static_quic(self):
         save_file_patcher = patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file")
         save_file_mock = save_file_patcher.start()
 
-        with patch("istream_player.modules.player.player_dash.DASHPlayer.SEG_DURATION_MULTIPLIER", 0):
-            async with PlayerComposer(self.make_config(abr)) as composer:
-                await composer.run()
+        composer = PlayerComposer()
+        composer.register_core_modules()
+        async with composer.make_player(self.make_config()) as player:
+            await player.run()
 
         save_file_patcher.stop()
         save_file_mock.assert_called_once()
         [path, data] = save_file_mock.call_args.args
-        # print(json.dumps(data, indent=4))
         assert len(data["segments"]) == 4
 
 
+class ConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.resources = pathlib.Path(__file__).parent.joinpath("resources")
+        # Two servers, as two origins of the same content
+        self.servers = [DashServer(str(self.resources)), DashServer(str(self.resources))]
+        for server in self.servers:
+            await server.start(http=None, h3=0)
+        self.client = QuicClientImpl(max_streams="1", max_connections="2", idle_timeout="0.2")
+        await self.client.setup(PlayerConfig(input=""))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        for server in self.servers:
+            await server.stop()
+
+    async def fetch(self, url: str):
+        await self.client.download(DownloadRequest(url, DownloadType.SEGMENT))
+        result = await self.client.wait_complete(url)
+        assert result is not None
+        self.assertEqual(result[0], self.resources.joinpath(url.split("/", 3)[3]).read_bytes())
+
+    async def test_origins_and_limits(self):
+        paths = [f"chunks/chunk-stream0-0000{index}.m4s" for index in range(1, 4)]
+        urls = [server.base_url("h3") + path for server in self.servers for path in paths]
+        connections = set()
+        max_connections = 0
+        max_streams = 0
+
+        async def watch():
+            nonlocal max_connections, max_streams
+            while True:
+                for origin_connections in self.client._connections.values():
+                    connections.update(origin_connections)
+                    max_connections = max(max_connections, len(origin_connections))
+                    for connection in origin_connections:
+                        max_streams = max(max_streams, len(connection.urls))
+                await asyncio.sleep(0)
+
+        watcher = asyncio.create_task(watch())
+        await asyncio.gather(*(self.fetch(url) for url in urls))
+        watcher.cancel()
+        self.assertEqual(max_connections, 2)
+        self.assertEqual(max_streams, 1)
+        self.assertEqual({connection.origin for connection in connections}, {self.client.origin(url) for url in urls})
+        self.assertEqual(len(connections), 4)
+
+        # The idle connections are closed
+        await asyncio.wait_for(asyncio.gather(*(connection.task for connection in connections)), timeout=10)
+        self.assertEqual(self.client._connections, {})
+
+    async def test_closing_connection_not_reused(self):
+        base_url = self.servers[0].base_url("h3")
+        await self.fetch(base_url + "chunks/chunk-stream0-00001.m4s")
+        [closing] = self.client._connections[self.client.origin(base_url)]
+        # As if the idle timer fired, before the connection task wakes up
+        closing.close_event.set()
+        url = base_url + "chunks/chunk-stream0-00002.m4s"
+        await self.client.download(DownloadRequest(url, DownloadType.SEGMENT))
+        self.assertIsNot(self.client._url_connections[url], closing)
+        result = await self.client.wait_complete(url)
+        assert result is not None
+
+    async def test_stopped_during_handshake(self):
+        for server, stop in zip(self.servers, (self.client.drop_url, self.client.stop)):
+            url = server.base_url("h3") + "chunks/chunk-stream0-00001.m4s"
+            download = asyncio.create_task(self.client.download(DownloadRequest(url, DownloadType.SEGMENT)))
+            while url not in self.client._url_connections or self.client._url_connections[url].protocol is None:
+                await asyncio.sleep(0)
+            connection = self.client._url_connections[url]
+            assert connection.protocol is not None
+            self.assertFalse(connection.protocol.handshake_completed.is_set())
+            await stop(url)
+            await download
+            # The request is not sent after the handshake
+            self.assertTrue(connection.protocol.handshake_completed.is_set())
+            self.assertNotIn(url, connection.protocol._url_stream_id)
+            self.assertEqual(connection.urls, set())
+            self.assertIsNone(await self.client.wait_complete(url))
+
+    async def test_server_stopped(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        with open(os.path.join(tempdir.name, "a.m4s"), "wb") as f:
+            f.write(os.urandom(100_000))
+        # 100 kB in 1 s, so the transfer is still running when the server stops
+        server = DashServer(tempdir.name, profile=DashServer.shaped(100_000))
+        await server.start(http=None, h3=0)
+        url = server.base_url("h3") + "a.m4s"
+        await self.client.download(DownloadRequest(url, DownloadType.SEGMENT))
+        await asyncio.sleep(0.2)
+        await server.stop()
+        self.assertIsNone(await asyncio.wait_for(self.client.wait_complete(url), timeout=5))
+        self.assertEqual(self.client._url_connections, {})
+        self.assertEqual(self.client._connections, {})
+
+
 if __name__ == "__main__":
     unittest.main()
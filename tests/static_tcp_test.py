@@ -1,21 +1,25 @@
 # test_with_pytest.py
 
 
+import asyncio
+import os
 import pathlib
+import tempfile
 import unittest
 from unittest.mock import patch
 
-from aiohttp import web
-
 from istream_player.config.config import PlayerConfig
+from istream_player.core.downloader import DownloadRequest, DownloadType
 from istream_player.core.module_composer import PlayerComposer
+from istream_player.modules.downloader.tcp import TCPClientImpl
+from istream_player.utils.dash_server import DashServer
 
 
 # @unittest.skip("Cannot bind to port inside test")
 class StaticTest(unittest.IsolatedAsyncioTestCase):
     def make_config(self):
         config = PlayerConfig(
-            input="http://localhost:8080/resources/static_1as_5repr_4seg.mpd",
+            input=self.server.base_url("http") + "static_1as_5repr_4seg.mpd",
             run_dir="./runs/test",
             mod_abr='dash',
             mod_downloader="tcp",
@@ -26,16 +30,11 @@ class StaticTest(unittest.IsolatedAsyncioTestCase):
         return config
 
     async def asyncSetUp(self):
-        app = web.Application()
-        app.router.add_static("/", pathlib.Path(__file__).parent, show_index=True)
-
-        self.runner = web.AppRunner(app)
-        await self.runner.setup()
-        site = web.TCPSite(self.runner, "localhost", 8080)
-        await site.start()
+        self.server = DashServer(str(pathlib.Path(__file__).parent.joinpath("resources")))
+        await self.server.start(http=0, h3=None)
 
     async def asyncTearDown(self) -> None:
-        await self.runner.shutdown()
+        await self.server.stop()
 
     async def test_static_tcp(self):
         save_file_patcher = patch("istream_player.modules.analyzer.analyzer.PlaybackAnalyzer.save_file")
@@ -53,6 +52,42 @@ class StaticTest(unittest.IsolatedAsyncioTestCase):
         assert len(data["segments"]) == 4
 
 
+class QueuedStopTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        for name in ("a.m4s", "b.m4s"):
+            with open(os.path.join(self.tempdir.name, name), "wb") as f:
+                f.write(os.urandom(100_000))
+        # 100 kB in 0.1 s, so the second request is still queued behind the first one
+        self.server = DashServer(self.tempdir.name, profile=DashServer.shaped(1_000_000))
+        await self.server.start(http=0, h3=None)
+        self.client = TCPClientImpl(concurrent="false")
+        await self.client.setup(PlayerConfig(input=""))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.stop()
+        self.tempdir.cleanup()
+
+    async def test_stop_queued(self):
+        url_a = self.server.base_url("http") + "a.m4s"
+        url_b = self.server.base_url("http") + "b.m4s"
+        await self.client.download(DownloadRequest(url_a, DownloadType.SEGMENT))
+        await self.client.download(DownloadRequest(url_b, DownloadType.SEGMENT))
+        await asyncio.sleep(0)
+        self.assertIn(url_b, self.client._queued_urls)
+        self.assertTrue(self.client.is_busy)
+
+        await self.client.stop(url_b)
+        result = await self.client.wait_complete(url_a)
+        assert result is not None
+        self.assertEqual(len(result[0]), 100_000)
+        await asyncio.sleep(0.05)
+        # The stopped request was never sent
+        self.assertNotIn(url_b, self.client._headers)
+        self.assertFalse(self.client.is_busy)
+
+
 if __name__ == "__main__":
     unittest.main()
 